@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+渲染服务，在单独进程运行无头浏览器，由机器人主进程启动，异常退出后自动重启
+'''
+import asyncio
+import os
+import sys
+
+from src.utils.config import config_init
+
+# 注册配置
+config_init()
+
+from src.utils import browser  # noqa: E402
+from src.utils.log import logger  # noqa: E402
+from src.utils.render_client import (read_frame, render_client,  # noqa: E402
+                                     service_config, write_frame)
+
+# 本进程直接渲染，不再转发给渲染服务
+render_client.enabled = False
+
+
+class RenderServer:
+    '''
+    渲染服务，每个链接上的任务并发执行，排队超过上限直接返回失败，连续超时后退出进程由主进程重启
+    '''
+
+    def __init__(self):
+        self._semaphore = asyncio.Semaphore(browser.browser_config.get('max-concurrency') or os.cpu_count())
+        '''同时渲染的任务数，默认为CPU核数'''
+        self._waiting = 0
+        '''排队中的任务数'''
+        self._timeout_count = 0
+        '''连续超时次数'''
+        self._stop_event = asyncio.Event()
+        self.exit_code = 0
+
+    async def _render(self, header: dict) -> bytes:
+        '''执行一个任务，排队的时间不算在超时内'''
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        try:
+            if header.get('type') == "web":
+                job = browser.render_web(header.get('url'), header.get('width'))
+            else:
+                job = browser.render_html(header.get('pagename'), header.get('data'))
+            body = await asyncio.wait_for(job, header.get('timeout'))
+        except asyncio.TimeoutError:
+            self._timeout_count += 1
+            if self._timeout_count >= service_config.get('max-timeouts'):
+                log = f'渲染服务 > 连续超时{self._timeout_count}次，退出重启'
+                logger.error(log)
+                self.exit_code = 1
+                self._stop_event.set()
+            raise
+        finally:
+            self._semaphore.release()
+        self._timeout_count = 0
+        return body
+
+    async def _run_job(self, header: dict, writer: asyncio.StreamWriter, lock: asyncio.Lock) -> None:
+        '''执行任务并返回结果'''
+        body = b""
+        if self._waiting >= service_config.get('max-queue'):
+            response = {"id": header.get('id'), "ok": False, "error": "渲染队列已满"}
+        else:
+            try:
+                body = await self._render(header)
+                response = {"id": header.get('id'), "ok": True}
+            except asyncio.TimeoutError:
+                response = {"id": header.get('id'), "ok": False, "error": "渲染超时"}
+            except Exception as e:
+                log = f'渲染服务 > 渲染[{header.get("pagename") or header.get("url")}]出错：{str(e)}'
+                logger.error(log)
+                response = {"id": header.get('id'), "ok": False, "error": str(e)}
+        async with lock:
+            write_frame(writer, response, body)
+            await writer.drain()
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        '''处理一个机器人进程的链接'''
+        lock = asyncio.Lock()
+        task_set: set[asyncio.Task] = set()
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                header, _ = await read_frame(reader)
+                task = loop.create_task(self._run_job(header, writer, lock))
+                task_set.add(task)
+                task.add_done_callback(task_set.discard)
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            for task in task_set:
+                task.cancel()
+            writer.close()
+
+    async def run(self) -> None:
+        '''启动浏览器和服务，停止时关闭浏览器'''
+        await browser.browser_init()
+        server = await asyncio.start_server(self._on_connect, "127.0.0.1", service_config.get('port'))
+        log = f'渲染服务 > 已开启，端口：{service_config.get("port")}'
+        logger.info(log)
+        try:
+            await self._stop_event.wait()
+        finally:
+            server.close()
+            try:
+                await asyncio.wait_for(browser.close_browser(), 10)
+            except Exception:
+                pass
+
+
+async def main() -> int:
+    '''运行渲染服务，返回退出码'''
+    render_server = RenderServer()
+    await render_server.run()
+    return render_server.exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,29 @@
+/*
+ * 渲染完成信号，所有模板页面都需要引入
+ * 截图前调用window.__jx3_render(alldata, timeout)，handle填充数据后等待#main中的图片解码完成
+ * 返回的promise完成后即可截图，同时保存在window.__jx3_render_ready
+ * 入口放在window.__jx3_前缀下，模板脚本中的全局变量不会覆盖
+ */
+window.__jx3_render_ready = null
+
+//等待#main中的图片解码完成，超过timeout毫秒后不再等待
+window.__jx3_wait_images = function (timeout) {
+    var images = Array.from(document.querySelectorAll("#main img"))
+    var all_images = Promise.all(images.map(img => img.decode().catch(() => null)))
+    var budget = new Promise(resolve => setTimeout(resolve, timeout))
+    return Promise.race([all_images, budget])
+}
+
+//填充数据并等待渲染完成，alldata为null时只等待图片
+window.__jx3_render = function (alldata, timeout) {
+    window.__jx3_render_ready = Promise.resolve()
+        .then(() => {
+            if (alldata !== null) {
+                window.data = alldata
+                return handle(alldata)
+            }
+        })
+        .then(() => document.fonts.ready)
+        .then(() => window.__jx3_wait_images(timeout))
+    return window.__jx3_render_ready
+}
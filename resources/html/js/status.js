@@ -13,6 +13,50 @@ function handle(data) {
         one_string = get_string(one_group)
         table.append(one_string)
     }
+
+    //缓存
+    caches = data['cache']
+    var cache_table = $("#cache_table tbody")
+    for (var i = 0; i < caches.length; i++) {
+        one_cache = caches[i]
+        one_string = get_cache_string(one_cache)
+        cache_table.append(one_string)
+    }
+
+    //绘制
+    var render_info = data['render']
+    $("#render_table tbody").append(get_render_string(render_info))
+
+    //指令
+    commands = data['command']
+    var command_table = $("#command_table tbody")
+    for (var i = 0; i < commands.length; i++) {
+        command_table.append(get_command_string(commands[i]))
+    }
+}
+
+function get_command_string(data) {
+    var one_string = "<tr><td>" + data['name'] + '</td><td>' + data['count']
+    one_string += '</td><td>' + data['avg_time'] + 'ms'
+    one_string += '</td><td>' + data['max_time'] + 'ms</td></tr>'
+    return one_string
+}
+
+function get_render_string(data) {
+    var one_string = "<tr><td>" + data['count'] + '</td><td>' + data['errors']
+    one_string += '</td><td>' + data['waiting']
+    one_string += '</td><td>' + data['avg_time'] + 'ms'
+    one_string += '</td><td>' + data['max_time'] + 'ms'
+    one_string += '</td><td>' + data['avg_wait'] + 'ms</td></tr>'
+    return one_string
+}
+
+function get_cache_string(data) {
+    var one_string = "<tr><td>" + data['name'] + '</td><td>' + data['size']
+    one_string += '</td><td>' + data['hits']
+    one_string += '</td><td>' + data['misses']
+    one_string += '</td><td>' + data['hit_rate'] + '%</td></tr>'
+    return one_string
 }
 
 function get_string(data) {
@@ -16,9 +16,10 @@ function get_string(data, index) {
 
     var alive = data['alive']
     if (alive) {
-        one_string += '</td><td><div class="text-success">有效</td></tr>'
+        one_string += '</td><td><div class="text-success">有效</div>'
     } else {
-        one_string += '</td><td><div class="text-danger">无效</td></tr>'
+        one_string += '</td><td><div class="text-danger">无效</div>'
     }
+    one_string += '</td><td>' + data['uses'] + '</td><td>' + data['errors'] + '</td><td>' + data['check_time'] + '</td></tr>'
     return one_string
 }
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+群成员同步基准测试：逐条append_or_update 对比 UserInfo.bulk_sync
+使用sqlite临时数据库，不影响机器人数据
+
+运行：python scripts/bench_bulk_sync.py --groups 20 --members 500
+'''
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tortoise import Tortoise  # noqa: E402
+
+from src.modules.user_info import UserInfo  # noqa: E402
+
+BOT_ID = 10000
+
+
+def make_members(count: int, seed: int) -> dict[int, str]:
+    '''生成一个群的成员，key：QQ号，value：昵称'''
+    rand = random.Random(seed)
+    user_list = rand.sample(range(100000, 100000000), count)
+    return {user_id: f"成员{user_id}" for user_id in user_list}
+
+
+def change_members(user_dict: dict[int, str], seed: int) -> dict[int, str]:
+    '''模拟两次同步之间的变化：10%改名，5%退群，5%新入群'''
+    rand = random.Random(seed)
+    new_dict = dict(user_dict)
+    user_list = list(user_dict)
+    for user_id in rand.sample(user_list, len(user_list)//10):
+        new_dict[user_id] = f"新昵称{user_id}"
+    for user_id in rand.sample(user_list, len(user_list)//20):
+        del new_dict[user_id]
+    for user_id in rand.sample(range(100000000, 200000000), len(user_list)//20):
+        new_dict[user_id] = f"成员{user_id}"
+    return new_dict
+
+
+async def init_db(filename: str) -> None:
+    '''初始化临时数据库'''
+    await Tortoise.init(db_url=f"sqlite://{filename}", modules={"models": ["src.modules.user_info"]})
+    await Tortoise.generate_schemas()
+
+
+async def sync_per_row(group_id: int, user_dict: dict[int, str]) -> None:
+    '''逐条同步，每个成员一次查询和一次写入，和原来一样不删除退群成员'''
+    for user_id, user_name in user_dict.items():
+        await UserInfo.append_or_update(BOT_ID, user_id, group_id, user_name)
+
+
+async def sync_bulk(group_id: int, user_dict: dict[int, str]) -> None:
+    '''批量同步'''
+    await UserInfo.bulk_sync(BOT_ID, group_id, user_dict)
+
+
+async def run_one(name: str, func, group_list: list[tuple[int, dict, dict]]) -> tuple[float, float]:
+    '''
+    在新数据库上运行一种同步方式
+
+    :返回
+        * float：首次同步用时，单位：秒
+        * float：再次同步用时，单位：秒
+    '''
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        await init_db(os.path.join(tmp_dir, f"{name}.db"))
+        time_start = time.perf_counter()
+        for group_id, first_dict, _ in group_list:
+            await func(group_id, first_dict)
+        time_first = time.perf_counter()-time_start
+
+        time_start = time.perf_counter()
+        for group_id, _, second_dict in group_list:
+            await func(group_id, second_dict)
+        time_second = time.perf_counter()-time_start
+        await Tortoise.close_connections()
+    return time_first, time_second
+
+
+async def main(groups: int, members: int) -> None:
+    group_list = []
+    for index in range(groups):
+        first_dict = make_members(members, index)
+        group_list.append((index+1, first_dict, change_members(first_dict, index)))
+
+    print(f"{groups} 个群，每群 {members} 人")
+    print(f"{'方式':<10}{'首次同步':>12}{'再次同步':>12}")
+    for name, func in (("per_row", sync_per_row), ("bulk", sync_bulk)):
+        time_first, time_second = await run_one(name, func, group_list)
+        print(f"{name:<10}{time_first*1000:>10.1f}ms{time_second*1000:>10.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="群成员同步基准测试")
+    parser.add_argument("--groups", type=int, default=20, help="群数量")
+    parser.add_argument("--members", type=int, default=500, help="每个群的成员数")
+    args = parser.parse_args()
+    asyncio.run(main(args.groups, args.members))
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+查询指令匹配基准测试：原来每个指令一个on_regex 对比 CommandRouter合并正则
+* per_regex：和原来一样，同优先级的每个matcher都对消息执行一次re.search
+* router：CommandRouter.classify，每条消息只匹配一次合并后的正则
+指令正则直接从查询插件源码中读取，不导入插件，避免注册nonebot事件响应器
+
+运行：python scripts/bench_command_router.py --messages 100000 --command-ratio 0.1
+'''
+import argparse
+import ast
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.utils.command_router import CommandRouter  # noqa: E402
+
+COMMAND_TEXTS = [
+    "日常", "日常 双梦", "装备 双梦 烟雨", "属性 烟雨", "开服", "开服 蝶恋花", "金价", "金价 长安城",
+    "奇穴 冰心", "冰心奇穴", "小药 花间", "花间小药", "配装 藏剑", "藏剑配装", "宏 莫问", "莫问宏",
+    "前置 阴阳两界", "条件 清风捕王", "科举 世外蓬莱", "攻略 三山四海", "三山四海攻略", "花价", "花价 双梦",
+    "更新", "公告", "更新公告", "物价 天选之人", "奇遇 烟雨", "奇遇 双梦 烟雨", "查询 阴阳两界",
+    "查询 双梦 阴阳两界", "骚话", "装饰 白玉石阶", "资历排行 双梦", "资历排行 双梦 七秀", "战绩 烟雨",
+    "战绩 双梦 烟雨", "名剑排行", "名剑排行 22", "副本记录 烟雨", "副本记录 双梦 烟雨", "沙盘", "沙盘 双梦",
+]
+'''各个指令的示例消息'''
+
+CHAT_TEXTS = [
+    "有人一起打本吗", "今天日常是什么来着", "哈哈哈哈哈", "晚上好", "这个装备怎么样", "金价又涨了",
+    "[CQ:image,file=3a1f.image]", "[CQ:face,id=178]", "奇遇怎么触发", "谁有小药", "开服了吗？",
+    "我刚出了个奇遇", "副本太难了", "求带", "1", "？", "沙盘在哪里看", "老板大气",
+    "https://www.jx3box.com/macro/", "名剑大会走起", "今天更新了什么", "明天见",
+]
+'''群聊中的普通消息，包含指令关键词但不是指令'''
+
+
+def load_patterns() -> list[tuple[str, str]]:
+    '''从查询插件源码中读取router.on_command注册的指令名和正则，正则可以是模块级变量'''
+    filename = os.path.join(ROOT, "src/plugins/jx3_search/__init__.py")
+    with open(filename, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    var_dict: dict[str, str] = {}
+    pattern_list = []
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    var_dict[target.id] = node.value.value
+            continue
+        value = node.value if isinstance(node, (ast.Assign, ast.Expr)) else None
+        if not (isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute) and value.func.attr == "on_command"):
+            continue
+        command_arg, pattern_arg = value.args[:2]
+        if isinstance(pattern_arg, ast.Name):
+            pattern = var_dict[pattern_arg.id]
+        else:
+            pattern = pattern_arg.value
+        pattern_list.append((command_arg.value, pattern))
+    return pattern_list
+
+
+def make_messages(count: int, command_ratio: float, seed: int) -> list[str]:
+    '''生成消息记录，command_ratio为指令消息的比例'''
+    rand = random.Random(seed)
+    message_list = []
+    for _ in range(count):
+        if rand.random() < command_ratio:
+            message_list.append(rand.choice(COMMAND_TEXTS))
+        else:
+            message_list.append(rand.choice(CHAT_TEXTS))
+    return message_list
+
+
+def bench_per_regex(pattern_list: list[tuple[str, str]], message_list: list[str]) -> tuple[float, dict[str, int]]:
+    '''
+    原来的匹配方式，每条消息执行所有指令的re.search，和nonebot检查同优先级所有matcher相同
+
+    :返回
+        * float：总用时，单位：秒
+        * dict：每个指令的匹配次数
+    '''
+    count_dict = {command: 0 for command, _ in pattern_list}
+    time_start = time.perf_counter()
+    for text in message_list:
+        matched = None
+        for command, pattern in pattern_list:
+            if re.search(pattern, text) and matched is None:
+                matched = command
+        if matched is not None:
+            count_dict[matched] += 1
+    return time.perf_counter()-time_start, count_dict
+
+
+def bench_router(pattern_list: list[tuple[str, str]], message_list: list[str]) -> tuple[float, dict[str, int]]:
+    '''
+    CommandRouter的匹配方式，每条消息分类一次
+
+    :返回
+        * float：总用时，单位：秒
+        * dict：每个指令的匹配次数
+    '''
+    router = CommandRouter("bench")
+    for command, pattern in pattern_list:
+        # 只测试分类，不注册matcher
+        router._pattern_list.append((command, pattern))
+    count_dict = {command: 0 for command, _ in pattern_list}
+    time_start = time.perf_counter()
+    for text in message_list:
+        result = router.classify(text)
+        if result is not None:
+            count_dict[result[0]] += 1
+    return time.perf_counter()-time_start, count_dict
+
+
+def main(messages: int, command_ratio: float, seed: int) -> None:
+    pattern_list = load_patterns()
+    message_list = make_messages(messages, command_ratio, seed)
+    print(f"{len(pattern_list)} 个指令，{messages} 条消息，指令消息比例 {command_ratio}")
+
+    time_old, count_old = bench_per_regex(pattern_list, message_list)
+    time_new, count_new = bench_router(pattern_list, message_list)
+    if count_old != count_new:
+        diff = [command for command in count_old if count_old[command] != count_new[command]]
+        print(f"两种方式的匹配结果不同：{diff}")
+
+    print(f"{'方式':<12}{'总用时':>10}{'每条消息':>12}")
+    print(f"{'per_regex':<12}{time_old*1000:>8.1f}ms{time_old*1000000/messages:>10.2f}us")
+    print(f"{'router':<12}{time_new*1000:>8.1f}ms{time_new*1000000/messages:>10.2f}us")
+    print("指令匹配次数：")
+    for command, count in sorted(count_new.items(), key=lambda x: -x[1]):
+        print(f"  {command}：{count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="查询指令匹配基准测试")
+    parser.add_argument("--messages", type=int, default=100000, help="消息数")
+    parser.add_argument("--command-ratio", type=float, default=0.1, help="指令消息的比例")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args()
+    main(args.messages, args.command_ratio, args.seed)
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+'''
+图片绘制基准测试，使用天气插件的卡片绘制：
+* cold：每张卡片前清空字体和图片缓存，相当于原来每次都从磁盘加载
+* cached：使用缓存的字体、图标和背景
+* pool：使用缓存，同时提交到绘制线程池，和机器人中的run_render相同，多核时编码可以并行
+绘制和编码分开计时，png编码通常占大部分时间，缓存只影响绘制
+
+仓库中没有带字体文件时，用--font指定任意ttf/ttc字体
+运行：python scripts/bench_render.py --cards 30 --font /path/to/font.ttf
+'''
+import argparse
+import asyncio
+import importlib.util
+import os
+import sys
+import time
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+from src.utils.config import config_init  # noqa: E402
+
+config_init()
+
+from src.utils import render  # noqa: E402
+from src.utils.config import config  # noqa: E402
+
+
+def load_convrt_pic():
+    '''直接加载天气绘制模块，不导入插件包，避免注册nonebot事件响应器'''
+    filename = os.path.join(ROOT, "src/plugins/weather/convrt_pic.py")
+    spec = importlib.util.spec_from_file_location("bench_convrt_pic", filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_data(index: int) -> dict:
+    '''生成一份天气数据，图标轮换使用'''
+    icon_list = sorted(name[:-4] for name in os.listdir(config.get('weather').get('icon-dir'))
+                       if name[:-4].isdigit())
+
+    def icon(offset: int) -> str:
+        return icon_list[(index+offset) % len(icon_list)]
+
+    day = {"uvIndex": "3", "humidity": "60", "precip": "0.0", "vis": "25",
+           "tempMax": "28", "tempMin": "19"}
+    return {
+        "city": "成都",
+        "now": {"icon": icon(0), "text": "多云", "temp": "24", "obsTime": "2021-08-01T12:00+08:00"},
+        "day1": {**day, "iconDay": icon(1), "iconNight": icon(2)},
+        "day2": {**day, "iconDay": icon(3), "iconNight": icon(4)},
+    }
+
+
+def draw_png(draw, data: dict) -> bytes:
+    '''绘制并编码为png，和天气插件发送前的处理相同'''
+    img = draw(data)
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def bench_sync(draw, data_list: list[dict], cold: bool) -> tuple[float, float]:
+    '''
+    在当前线程依次绘制和编码
+
+    :返回
+        * float：绘制总用时，单位：秒
+        * float：编码总用时，单位：秒
+    '''
+    time_draw = 0
+    time_encode = 0
+    for data in data_list:
+        if cold:
+            render.clear_cache()
+        time_start = time.perf_counter()
+        img = draw(data)
+        time_draw += time.perf_counter()-time_start
+        time_start = time.perf_counter()
+        img.save(BytesIO(), format="PNG")
+        time_encode += time.perf_counter()-time_start
+    return time_draw, time_encode
+
+
+async def bench_pool(draw, data_list: list[dict]) -> float:
+    '''同时提交到绘制线程池，返回绘制加编码的总用时，单位：秒'''
+    time_start = time.perf_counter()
+    await asyncio.gather(*[render.run_render(draw_png, draw, data) for data in data_list])
+    return time.perf_counter()-time_start
+
+
+def main(cards: int, font: str) -> None:
+    if font:
+        config['weather']['font'] = font
+    if not os.path.exists(config.get('weather').get('font')):
+        print(f"字体文件不存在：{config.get('weather').get('font')}，请用--font指定")
+        return
+    draw = load_convrt_pic().draw
+    data_list = [make_data(index) for index in range(cards)]
+    # 预热，排除第一次导入编码器等开销
+    draw_png(draw, data_list[0])
+
+    print(f"{cards} 张天气卡片，CPU核数 {os.cpu_count()}，绘制线程数 {config.get('render').get('workers')}")
+    draw_cold, encode_cold = bench_sync(draw, data_list, cold=True)
+    draw_cached, encode_cached = bench_sync(draw, data_list, cold=False)
+    time_pool = asyncio.run(bench_pool(draw, data_list))
+    print(f"{'方式':<8}{'绘制/张':>10}{'绘制+编码/张':>14}")
+    print(f"{'cold':<8}{draw_cold*1000/cards:>9.1f}ms{(draw_cold+encode_cold)*1000/cards:>13.1f}ms")
+    print(f"{'cached':<8}{draw_cached*1000/cards:>9.1f}ms{(draw_cached+encode_cached)*1000/cards:>13.1f}ms")
+    print(f"{'pool':<8}{'':>11}{time_pool*1000/cards:>13.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="图片绘制基准测试")
+    parser.add_argument("--cards", type=int, default=30, help="绘制卡片数")
+    parser.add_argument("--font", type=str, default="", help="字体文件，默认使用天气插件配置的字体")
+    args = parser.parse_args()
+    main(args.cards, args.font)
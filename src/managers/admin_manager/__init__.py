@@ -1,7 +1,4 @@
-import asyncio
-import random
 import re
-import time
 from datetime import datetime
 
 from nonebot import on_message, on_notice, on_regex, on_request
@@ -13,6 +10,7 @@ from nonebot.typing import T_State
 from src.utils.browser import get_html_screenshots
 from src.utils.config import config as baseconfig
 from src.utils.log import logger
+from src.utils.sender import Priority, send_group_msgs
 from src.utils.utils import OWNER, get_nickname
 
 from . import data_source as source
@@ -148,6 +146,9 @@ async def _(bot: Bot, event: PrivateMessageEvent):
     data['groups'] = groups
     data['group_nums'] = group_nums
     data['nickname'] = nickname
+    data['cache'] = source.get_cache_status()
+    data['render'] = source.get_render_status()
+    data['command'] = source.get_command_status()
 
     pagename = "status.html"
     img = await get_html_screenshots(pagename=pagename, data=data)
@@ -322,20 +323,9 @@ async def _(bot: Bot, event: PrivateMessageEvent):
     get_msg.insert(0, msg_0)
 
     group_list = await source.get_bot_group_list(bot_id)
-    num = len(group_list)
-    time_start = time.time()
-    count_success = 0
-    count_failed = 0
-    for group_id in group_list:
-        try:
-            await bot.send_group_msg(group_id=group_id, message=get_msg)
-            await asyncio.sleep(random.uniform(0.3, 0.5))
-            count_success += 1
-        except Exception:
-            count_failed += 1
-    time_end = time.time()
-    time_use = round(time_end-time_start, 2)
-    msg = f"发送完毕，共发送 {num} 个群\n成功 {count_success} 个\n失败 {count_failed} 个\n用时 {time_use} 秒"
+    msg_list = [(group_id, get_msg) for group_id in group_list]
+    summary = await send_group_msgs(bot, msg_list, Priority.NORMAL)
+    msg = f"发送完毕，共发送 {summary.count_all} 个群\n成功 {summary.count_success} 个\n失败 {summary.count_failed} 个\n用时 {summary.time_use} 秒"
     await borodcast_all.finish(msg)
 
 
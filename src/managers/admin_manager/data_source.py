@@ -1,6 +1,5 @@
 from typing import Optional, Tuple
 
-import httpx
 from nonebot import get_bot
 from nonebot.adapters.cqhttp import Bot, Event, MessageSegment
 from nonebot.rule import Rule
@@ -9,8 +8,13 @@ from src.modules.bot_info import BotInfo
 from src.modules.group_info import GroupInfo
 from src.modules.token_info import TokenInfo
 from src.modules.user_info import UserInfo
+from src.utils.cache import get_cache_status as _get_cache_status
+from src.utils.command_router import get_router_status as _get_router_status
 from src.utils.config import config
+from src.utils.http_client import get_client
 from src.utils.log import logger
+from src.utils.render import get_render_status as _get_render_status
+from src.utils.token_manager import token_manager
 from src.utils.user_agent import get_user_agent
 
 
@@ -49,6 +53,47 @@ async def get_all_data(bot_id: int) -> list[dict]:
     return await GroupInfo.get_all_data(bot_id)
 
 
+def get_cache_status() -> list[dict]:
+    '''
+        :返回缓存统计,dict字段：
+        * name：缓存名称
+        * size：缓存条数
+        * hits：命中次数
+        * misses：未命中次数
+        * hit_rate：命中率
+    '''
+    return _get_cache_status()
+
+
+def get_render_status() -> dict:
+    '''
+        :返回绘制统计,dict字段：
+        * count：完成次数
+        * errors：出错次数
+        * waiting：当前排队数
+        * avg_time：平均耗时，单位：毫秒
+        * max_time：最大耗时，单位：毫秒
+        * avg_wait：平均排队时间，单位：毫秒
+    '''
+    return _get_render_status()
+
+
+def get_command_status() -> list[dict]:
+    '''
+        :返回有处理记录的指令统计,dict字段：
+        * name：路由名-指令名
+        * count：处理次数
+        * avg_time：平均耗时，单位：毫秒
+        * max_time：最大耗时，单位：毫秒
+    '''
+    data = []
+    for router in _get_router_status():
+        for command in router['commands']:
+            if command['count']:
+                data.append({**command, "name": f"{router['name']}-{command['name']}"})
+    return data
+
+
 def get_text_num(text: str) -> Tuple[bool, int]:
     '''从信息中获取开关，群号'''
     _status = text.split(' ')[0]
@@ -91,23 +136,23 @@ async def get_reply_jx3(question: str, nickname: str) -> Optional[str]:
     params = chat_nlp.copy()
     params['name'] = nickname
     params['question'] = question
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        try:
-            req_url = await client.get(url=url, params=params)
-            req = req_url.json()
-            if req['code'] == 200:
-                log = 'jx3API请求成功。'
-                logger.debug(log)
-                data = req['data']
-                return data['answer']
-            else:
-                log = f'jx3API请求失败：{req["msg"]}'
-                logger.debug(log)
-                return None
-        except Exception as e:
-            log = f'API访问失败：{str(e)}'
-            logger.error(log)
+    client = get_client(url)
+    try:
+        req_url = await client.get(url=url, params=params, headers=get_user_agent())
+        req = req_url.json()
+        if req['code'] == 200:
+            log = 'jx3API请求成功。'
+            logger.debug(log)
+            data = req['data']
+            return data['answer']
+        else:
+            log = f'jx3API请求失败：{req["msg"]}'
+            logger.debug(log)
             return None
+    except Exception as e:
+        log = f'API访问失败：{str(e)}'
+        logger.error(log)
+        return None
 
 
 async def get_reply_qingyunke(text: str, nickname: str) -> Optional[str]:
@@ -130,27 +175,27 @@ async def get_reply_qingyunke(text: str, nickname: str) -> Optional[str]:
         'msg': text
     }
     url = 'http://api.qingyunke.com/api.php'
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        try:
-            req_url = await client.get(url, params=params)
-            req = req_url.json()
-            if req['result'] == 0:
-                msg = str(req['content'])
-                # 消息替换
-                msg = msg.replace(r'{br}', '\n')
-                msg = msg.replace('菲菲', nickname)
-                log = '请求青云客API成功。'
-                logger.debug(log)
-                return msg
-            else:
-                e = req['content']
-                log = f'青云客API请求失败：{e}'
-                logger.error(log)
-                return None
-        except Exception as e:
-            log = f'青云客API访问失败：{str(e)}'
+    client = get_client(url)
+    try:
+        req_url = await client.get(url, params=params, headers=get_user_agent())
+        req = req_url.json()
+        if req['result'] == 0:
+            msg = str(req['content'])
+            # 消息替换
+            msg = msg.replace(r'{br}', '\n')
+            msg = msg.replace('菲菲', nickname)
+            log = '请求青云客API成功。'
+            logger.debug(log)
+            return msg
+        else:
+            e = req['content']
+            log = f'青云客API请求失败：{e}'
             logger.error(log)
             return None
+    except Exception as e:
+        log = f'青云客API访问失败：{str(e)}'
+        logger.error(log)
+        return None
 
 
 async def get_robot_status(bot_id: int, group_id: int) -> Optional[bool]:
@@ -195,12 +240,16 @@ async def add_token(bot_id: int, token: str) -> bool:
 
 
 async def get_token(bot_id: int) -> list[dict]:
-    '''获取token'''
-    return await TokenInfo.get_token(bot_id)
+    '''获取token，附带使用统计'''
+    token_list = await TokenInfo.get_token(bot_id)
+    for one_token in token_list:
+        one_token.update(token_manager.get_stats(bot_id, one_token['token']))
+    return token_list
 
 
 async def remove_token(bot_id: int, token: str) -> bool:
     '''删除一条token'''
+    token_manager.remove(bot_id, token)
     return await TokenInfo.remove_token(bot_id, token)
 
 
@@ -218,12 +267,12 @@ async def check_token(ticket: str) -> Tuple[bool, str]:
         'token': token,
         'ticket': ticket
     }
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        try:
-            req_url = await client.get(url=url, params=params)
-            req = req_url.json()
-            code = req['code']
-            msg = req['msg']
-            return (code == 200), msg
-        except Exception as e:
-            return False, str(e)
+    client = get_client(url)
+    try:
+        req_url = await client.get(url=url, params=params, headers=get_user_agent())
+        req = req_url.json()
+        code = req['code']
+        msg = req['msg']
+        return (code == 200), msg
+    except Exception as e:
+        return False, str(e)
@@ -1,3 +1,4 @@
+import time
 from datetime import datetime
 
 from nonebot import get_bots, get_driver, on_regex
@@ -8,9 +9,11 @@ from nonebot.plugin import export
 from src.managers.group_manager import data_source as group_source
 from src.managers.plugins_manager import data_source as plugins_source
 from src.utils.browser import get_html_screenshots
+from src.utils.cluster import cluster
 from src.utils.config import config
 from src.utils.log import logger
 from src.utils.scheduler import scheduler
+from src.utils.sender import remove_sender
 
 from . import data_source as source
 
@@ -32,6 +35,11 @@ async def _(bot: Bot):
     链接bot
     '''
     bot_id = int(bot.self_id)
+    if not cluster.is_local_bot(bot_id):
+        # 不影响使用，推送和定时任务会在所有进程执行
+        port = cluster.get_bot_port(bot_id, driver.config.port)
+        log = f'bot（{bot.self_id}）应该链接到进程[{cluster.get_worker_id(bot_id)}]，端口：{port}'
+        logger.warning(log)
     log = f'连接到bot（{bot.self_id}），正在注册bot_info信息'
     logger.debug(log)
     await source.bot_connect(bot_id)
@@ -42,20 +50,38 @@ async def _(bot: Bot):
 
     log = f'bot（{bot.self_id}）正在注册group_info和plugin_info信息'
     logger.debug(log)
+    time_start = time.time()
     group_list = await bot.get_group_list()
-    for group in group_list:
-        group_id = group['group_id']
-        group_name = group['group_name']
-        await plugins_source.plugin_init(bot_id, group_id)
-        await group_source.group_init(bot_id=bot_id, group_id=group_id, group_name=group_name)
-        # 用户注册
+    group_dict = {group['group_id']: group['group_name'] for group in group_list}
+    group_create, group_update = await group_source.group_init_bulk(bot_id, group_dict)
+    plugin_create, plugin_update = await plugins_source.plugin_init_bulk(bot_id, list(group_dict.keys()))
+    # 用户注册
+    user_create = 0
+    user_update = 0
+    user_delete = 0
+    user_skip = 0
+    for group_id in group_dict:
         user_list = await bot.get_group_member_list(group_id=group_id)
+        user_dict = {}
         for user in user_list:
             user_id = user['user_id']
             user_name = user['nickname'] if user['card'] == "" else user['card']
-            await group_source.user_init(bot_id, user_id, group_id, user_name)
-    log = f'bot（{bot.self_id}）group_info和plugin_info信息注册完毕'
-    logger.debug(log)
+            user_dict[user_id] = user_name
+        one_create, one_update, one_delete, one_skip = await group_source.user_init_bulk(bot_id, group_id, user_dict)
+        user_create += one_create
+        user_update += one_update
+        user_delete += one_delete
+        if one_skip:
+            log = f'bot（{bot.self_id}）群（{group_id}）成员列表异常减少，跳过删除 {one_skip} 个成员'
+            logger.warning(log)
+            user_skip += one_skip
+    time_use = round(time.time()-time_start, 2)
+    log = (f'bot（{bot.self_id}）group_info和plugin_info信息注册完毕，用时 {time_use} 秒，'
+           f'群：增加 {group_create} 更新 {group_update}，'
+           f'插件：增加 {plugin_create} 更新 {plugin_update}，'
+           f'用户：增加 {user_create} 更新 {user_update} 删除 {user_delete} 跳过删除 {user_skip}')
+    logger.info(log)
+    await source.load_cache(bot_id)
 
 
 @driver.on_bot_disconnect
@@ -67,6 +93,7 @@ async def _(bot: Bot):
     log = f'检测到bot（{bot.self_id}）断开链接.'
     logger.info(log)
     await source.bot_disconnect(bot_id)
+    await remove_sender(bot_id)
 
 
 # 定时清理离线超过时间的Bot
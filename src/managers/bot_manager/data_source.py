@@ -128,6 +128,14 @@ async def get_bot_owner(bot_id: int) -> Optional[int]:
     return owner_id
 
 
+async def load_cache(bot_id: int) -> None:
+    '''加载机器人的群设置和插件开关缓存'''
+    group_count = await GroupInfo.load_cache(bot_id)
+    plugin_count = await PluginInfo.load_cache(bot_id)
+    log = f'bot（{str(bot_id)}）缓存加载完毕，群设置 {group_count} 条，插件开关 {plugin_count} 条'
+    logger.debug(log)
+
+
 async def get_bot_nickname(bot_id: int) -> str:
     '''获取nickname'''
     return await BotInfo.get_nickname(bot_id)
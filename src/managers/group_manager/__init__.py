@@ -1,6 +1,4 @@
 import asyncio
-import random
-import time
 
 from nonebot import get_bots, on_notice, on_regex
 from nonebot.adapters.cqhttp import (Bot, GroupDecreaseNoticeEvent,
@@ -9,9 +7,11 @@ from nonebot.adapters.cqhttp import (Bot, GroupDecreaseNoticeEvent,
 from nonebot.adapters.cqhttp.permission import GROUP, GROUP_ADMIN, GROUP_OWNER
 from nonebot.plugin import export
 from src.utils.browser import get_html_screenshots
+from src.utils.cluster import cluster
 from src.utils.config import config as baseconfig
 from src.utils.log import logger
 from src.utils.scheduler import scheduler
+from src.utils.sender import Priority, send_group_msgs
 from src.utils.utils import OWNER, get_nickname
 
 from ..plugins_manager.data_source import plugin_init
@@ -27,39 +27,47 @@ export.ignore = True  # 插件管理器忽略此插件
 config = baseconfig.get('default')
 
 
+# 提前准备晚安发送计划
+@scheduler.scheduled_job("cron", hour=23, minute=55)
+@cluster.broadcast_job("goodnight_prepare")
+async def _():
+    for bot_id in get_bots().keys():
+        plan = await source.prepare_goodnight(int(bot_id))
+        log = f"Bot({bot_id}) | 晚安发送计划准备完毕，共 {len(plan['msg_list'])} 个群，用时 {plan['time_use']} 秒"
+        logger.debug(log)
+
+
+# 每天清理不再使用的图片
+@scheduler.scheduled_job("cron", hour=4, minute=10)
+async def _():
+    count = await source.clean_media()
+    log = f"清理不再使用的图片 {count} 张"
+    logger.debug(log)
+
+
 # 零点重置签到数
 @scheduler.scheduled_job("cron", hour=0, minute=0)
+@cluster.broadcast_job("goodnight")
 async def _():
     bot_id_list = get_bots()
-    for bot_id, bot in bot_id_list.items():
-        group_list = await source.sign_reset(int(bot_id))
-        count_success = 0
-        count_failed = 0
-        count_closed = 0
-        count_all = len(group_list)
-        time_start = time.time()
-        for group_id in group_list:
-            goodnight_status = await source.get_goodnight_status(int(bot_id), group_id)
-            if goodnight_status:
-                try:
-                    msg = await source.get_goodnight_text(bot_id, group_id)
-                    await bot.send_group_msg(group_id=group_id, message=msg)
-                    await asyncio.sleep(random.uniform(0.3, 0.5))
-                    count_success += 1
-                except Exception:
-                    log = f'Bot({bot.self_id}) | （{group_id}）群被禁言了，无法发送晚安……'
-                    logger.warning(log)
-                    count_failed += 1
-            else:
-                count_closed += 1
-
-        # 获取owner
-        time_end = time.time()
-        time_use = round(time_end-time_start, 2)
-        owner_id = await source.get_bot_owner(bot_id)
-        if owner_id is not None:
-            msg = f"发送晚安完毕，共发送 {count_all} 个群\n发送成功 {count_success} 个\n发送失败 {count_failed} 个\n关闭通知 {count_closed}个\n用时 {time_use} 秒"
-            await bot.send_private_msg(user_id=owner_id, message=msg)
+    # 每个机器人有独立的发送队列，同时发送
+    await asyncio.gather(*[_send_goodnight(bot_id, bot) for bot_id, bot in bot_id_list.items()])
+
+
+async def _send_goodnight(bot_id: str, bot: Bot):
+    '''重置签到数，发送晚安'''
+    await source.sign_reset(int(bot_id))
+    plan = await source.get_goodnight_plan(int(bot_id))
+    summary = await send_group_msgs(bot, plan['msg_list'], Priority.LOW)
+    for group_id in summary.failed_list:
+        log = f'Bot({bot.self_id}) | （{group_id}）群被禁言了，无法发送晚安……'
+        logger.warning(log)
+
+    # 获取owner
+    owner_id = await source.get_bot_owner(bot_id)
+    if owner_id is not None:
+        msg = f"发送晚安完毕，共发送 {plan['count_all']} 个群\n发送成功 {summary.count_success} 个\n发送失败 {summary.count_failed} 个\n关闭通知 {plan['count_closed']}个\n准备用时 {plan['time_use']} 秒\n发送用时 {summary.time_use} 秒"
+        await bot.send_private_msg(user_id=owner_id, message=msg)
 
 
 # 绑定服务器
@@ -202,6 +210,9 @@ async def _(bot: Bot, event: GroupIncreaseNoticeEvent):
     welcome_status = await source.get_welcome_status(bot_id, group_id)
     if welcome_status:
         msg = await source.get_welcome_text(bot_id, group_id)
+    # 图片全部丢失时消息为空，不发送
+    if not msg:
+        msg = None
     await someone_in_group.finish(msg)
 
 
@@ -1,16 +1,18 @@
-import os
+import json
+import time
 from typing import Optional
 
-import httpx
 from nonebot.adapters.cqhttp import Bot, Event
 from nonebot.adapters.cqhttp.message import Message, MessageSegment
 from nonebot.rule import Rule
 from nonebot.typing import T_State
 from src.modules.bot_info import BotInfo
-from src.modules.group_info import GroupInfo
+from src.modules.group_info import GroupInfo, goodnight_cache
 from src.modules.plugin_info import PluginInfo
 from src.modules.user_info import UserInfo
 from src.utils.config import config
+from src.utils.http_client import get_client
+from src.utils.media_store import media_store
 from src.utils.user_agent import get_user_agent
 
 
@@ -21,6 +23,22 @@ async def group_init(bot_id: int, group_id: int, group_name: str) -> None:
     await GroupInfo.append_or_update(bot_id, group_id, group_name)
 
 
+async def group_init_bulk(bot_id: int, group_dict: dict[int, str]) -> tuple[int, int]:
+    '''
+    :说明
+        批量注册群信息
+
+    :参数
+        * bot_id：机器人QQ
+        * group_dict：key：QQ群号，value：群名
+
+    :返回
+        * int：增加数量
+        * int：更新数量
+    '''
+    return await GroupInfo.bulk_sync(bot_id, group_dict)
+
+
 async def get_group_name(bot_id: int, group_id: int) -> str:
     '''获取群名'''
     return await GroupInfo.get_group_name(bot_id, group_id)
@@ -47,6 +65,25 @@ async def user_init(bot_id: int, user_id: int, group_id: int, user_name: str) ->
     await UserInfo.append_or_update(bot_id, user_id, group_id, user_name)
 
 
+async def user_init_bulk(bot_id: int, group_id: int, user_dict: dict[int, str]) -> tuple[int, int, int, int]:
+    '''
+    :说明
+        批量同步一个群的成员信息，已不在群中的成员会被删除，成员列表异常减少时跳过删除
+
+    :参数
+        * bot_id：机器人QQ
+        * group_id：QQ群号
+        * user_dict：key：用户QQ，value：用户昵称
+
+    :返回
+        * int：增加数量
+        * int：更新数量
+        * int：删除数量
+        * int：跳过删除的数量
+    '''
+    return await UserInfo.bulk_sync(bot_id, group_id, user_dict)
+
+
 async def user_detele(bot_id: int, user_id: int, group_id: int) -> None:
     '''
     删除成员信息
@@ -81,18 +118,18 @@ async def get_server_name(name: str) -> Optional[str]:
     url_head: str = config.get('jx3-api').get('jx3-url')
     url = f"{url_head}/app/server"
     params = {"name": name}
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        try:
-            req_url = await client.get(url=url, params=params)
-            req = req_url.json()
-            code = req.get('code')
-            if code == 200:
-                data = req['data']
-                return data['server']
-            else:
-                return None
-        except Exception:
+    client = get_client(url)
+    try:
+        req_url = await client.get(url=url, params=params, headers=get_user_agent())
+        req = req_url.json()
+        code = req.get('code')
+        if code == 200:
+            data = req['data']
+            return data['server']
+        else:
             return None
+    except Exception:
+        return None
 
 
 async def change_active(bot_id: int, group_id: int, active: int) -> None:
@@ -197,7 +234,7 @@ def Message_command_handler(message: Message, command: str) -> Message:
 async def _Message_encoder(bot_id: int, group_id: int, msg_type: str, message: Message) -> list:
     '''
     :说明
-        message消息编码器，将message消息序列化，保存本地
+        message消息编码器，将message消息序列化，图片按内容保存到media_store
 
     :参数
         * bot_id：机器人id
@@ -205,31 +242,15 @@ async def _Message_encoder(bot_id: int, group_id: int, msg_type: str, message: M
         * msg_type：消息类型，welcome，someoneleft，goodninght
         * message：消息内容
     '''
-    # 处理目录
-    _path = config.get('path').get(msg_type)
-    path = f"{_path}{str(bot_id)}/{str(group_id)}/"
-
-    if os.path.exists(path):
-        file_list = os.listdir(path)
-        for one_file in file_list:
-            filepath = os.path.join(path, one_file)
-            os.remove(filepath)
-    else:
-        os.makedirs(path)
-
-    count = 1
     req_message = []
     for one_message in message:
         one_req_message = {}
         if one_message.type == 'image':
             # 图片处理
             url = one_message.data['url']
-            file_name = f"{path}{count}.image"
-            async with httpx.AsyncClient(headers=get_user_agent()) as client:
-                req = await client.get(url=url)
-                with open(file_name, mode='wb') as f:
-                    f.write(req.read())
-            count += 1
+            client = get_client(url)
+            req = await client.get(url=url, headers=get_user_agent())
+            file_name = await media_store.put(req.read())
             one_req_message['type'] = "image"
             one_req_message['data'] = file_name
             req_message.append(one_req_message)
@@ -253,7 +274,7 @@ async def _Message_encoder(bot_id: int, group_id: int, msg_type: str, message: M
     return req_message
 
 
-def _Message_decoder(message_list: list) -> Message:
+async def _Message_decoder(message_list: list) -> Message:
     '''
     message消息解码器
     '''
@@ -269,15 +290,40 @@ def _Message_decoder(message_list: list) -> Message:
             msg = MessageSegment.face(face_id)
 
         if msg_type == 'image':
-            url = one_message['data']
-            with open(url, 'rb') as f:
-                img_byte = f.read()
+            img_byte = await media_store.get(one_message['data'])
+            if img_byte is None:
+                # 图片文件丢失，跳过这一段
+                continue
             msg = MessageSegment.image(img_byte)
 
         req_message.append(msg)
     return req_message
 
 
+async def _clean_images(old_list: Optional[list]) -> int:
+    '''
+    :说明
+        删除被替换的消息中不再使用的图片，相同图片可能被其他群共用，检查所有群的消息后再删除
+
+    :参数
+        * old_list：替换前的消息
+
+    :返回
+        * int：删除数量
+    '''
+    old_names = {one_message['data'] for one_message in old_list or [] if one_message['type'] == 'image'}
+    if not old_names:
+        return 0
+    used = await GroupInfo.get_image_names()
+    return await media_store.delete([name for name in old_names if name not in used])
+
+
+async def clean_media() -> int:
+    '''清理没有被任何群消息使用的图片，包括已删除的群和机器人的图片'''
+    used = await GroupInfo.get_image_names()
+    return await media_store.clean(used)
+
+
 async def set_welcome_text(bot_id: int, group_id: int, msg_type: str, message: Message):
     '''
     :说明
@@ -290,7 +336,9 @@ async def set_welcome_text(bot_id: int, group_id: int, msg_type: str, message: M
         * message：消息内容
     '''
     message_list = await _Message_encoder(bot_id=bot_id, group_id=group_id, msg_type=msg_type, message=message)
+    old_list = await GroupInfo.get_welcome_text(bot_id, group_id)
     await GroupInfo.set_welcome_text(bot_id, group_id, message_list)
+    await _clean_images(old_list)
 
 
 async def get_welcome_text(bot_id: int, group_id: int) -> Message:
@@ -303,7 +351,7 @@ async def get_welcome_text(bot_id: int, group_id: int) -> Message:
         * group_id：QQ群号
     '''
     message_list = await GroupInfo.get_welcome_text(bot_id, group_id)
-    message = _Message_decoder(message_list)
+    message = await _Message_decoder(message_list)
     return message
 
 
@@ -317,7 +365,7 @@ async def get_someoneleft_text(bot_id: int, group_id: int) -> Message:
         * group_id：QQ群号
     '''
     message_list = await GroupInfo.get_someoneleft_text(bot_id, group_id)
-    message = _Message_decoder(message_list)
+    message = await _Message_decoder(message_list)
     return message
 
 
@@ -333,7 +381,9 @@ async def set_someoneleft_text(bot_id: int, group_id: int, msg_type: str, messag
         * message：消息内容
     '''
     message_list = await _Message_encoder(bot_id=bot_id, group_id=group_id, msg_type=msg_type, message=message)
+    old_list = await GroupInfo.get_someoneleft_text(bot_id, group_id)
     await GroupInfo.set_someoneleft_text(bot_id, group_id, message_list)
+    await _clean_images(old_list)
 
 
 async def get_goodnight_text(bot_id: int, group_id: int) -> Message:
@@ -346,7 +396,7 @@ async def get_goodnight_text(bot_id: int, group_id: int) -> Message:
         * group_id：QQ群号
     '''
     message_list = await GroupInfo.get_goodnight_text(bot_id, group_id)
-    message = _Message_decoder(message_list)
+    message = await _Message_decoder(message_list)
     return message
 
 
@@ -362,7 +412,63 @@ async def set_goodnight_text(bot_id: int, group_id: int, msg_type: str, message:
         * message：消息内容
     '''
     message_list = await _Message_encoder(bot_id=bot_id, group_id=group_id, msg_type=msg_type, message=message)
+    old_list = await GroupInfo.get_goodnight_text(bot_id, group_id)
     await GroupInfo.set_goodnight_text(bot_id, group_id, message_list)
+    await _clean_images(old_list)
+
+
+async def prepare_goodnight(bot_id: int) -> dict:
+    '''
+    :说明
+        准备晚安发送计划，一次查询所有群，相同的晚安语只解码一次
+
+    :参数
+        * bot_id：机器人QQ
+
+    :返回
+        * dict：字段：
+            * msg_list：发送列表，[(group_id, Message)]
+            * count_all：群数量
+            * count_closed：关闭晚安的群数量
+            * time_use：准备用时，单位：秒
+    '''
+    time_start = time.time()
+    # 准备期间群设置被修改时不保存计划，发送时重新准备
+    version = goodnight_cache.get_version()
+    record_list = await GroupInfo.get_goodnight_list(bot_id)
+    message_dict: dict[str, Message] = {}
+    msg_list = []
+    count_closed = 0
+    for record in record_list:
+        if not record['goodnight_status']:
+            count_closed += 1
+            continue
+        key = json.dumps(record['goodnight_text'], ensure_ascii=False, sort_keys=True)
+        msg = message_dict.get(key)
+        if msg is None:
+            msg = await _Message_decoder(record['goodnight_text'])
+            message_dict[key] = msg
+        if not msg:
+            # 图片全部丢失时消息为空，跳过
+            continue
+        msg_list.append((record['group_id'], msg))
+    plan = {
+        "msg_list": msg_list,
+        "count_all": len(record_list),
+        "count_closed": count_closed,
+        "time_use": round(time.time()-time_start, 2)
+    }
+    goodnight_cache.fill(bot_id, plan, version)
+    return plan
+
+
+async def get_goodnight_plan(bot_id: int) -> dict:
+    '''获取准备好的晚安发送计划，没有则现在准备，取出后删除，字段同prepare_goodnight'''
+    flag, plan = goodnight_cache.lookup(bot_id)
+    if not flag:
+        plan = await prepare_goodnight(bot_id)
+    goodnight_cache.delete(bot_id)
+    return plan
 
 
 def handle_didi_message(one_message: MessageSegment) -> MessageSegment:
@@ -63,6 +63,28 @@ async def plugin_init(bot_id, group_id: int) -> None:
         await PluginInfo.append_or_update(bot_id, module_name, description, group_id, default_status)
 
 
+async def plugin_init_bulk(bot_id: int, group_list: list[int]) -> tuple[int, int]:
+    '''
+    :说明
+        批量注册多个群的所有插件
+
+    :返回
+        * int：增加数量
+        * int：更新数量
+    '''
+    plugin_list = []
+    for plugin in PluginManager:
+        # 跳过忽略的插件
+        if plugin.ignore:
+            continue
+        plugin_list.append({
+            "module_name": plugin.module_name,
+            "description": plugin.plugin_usage,
+            "status": plugin.default_status
+        })
+    return await PluginInfo.bulk_sync(bot_id, group_list, plugin_list)
+
+
 async def change_plugin_status(bot_id: int, plugin_name: str, group_id: int, status: bool) -> MessageSegment:
     '''
     :说明
@@ -1,10 +1,13 @@
-from nonebot import get_driver, on_regex
+from fastapi import Response
+from nonebot import get_asgi, get_driver, on_regex
 from nonebot.adapters.cqhttp import Bot, PrivateMessageEvent
 from nonebot.permission import SUPERUSER
 from nonebot.plugin import export
-from src.utils.browser import close_browser, get_broser
+from src.utils.browser import close_browser, get_broser, read_image
+from src.utils.cluster import cluster
+from src.utils.http_client import close_client
 from src.utils.log import logger
-from src.utils.scheduler import scheduler
+from src.utils.render_client import render_client
 from tortoise import Tortoise
 
 from . import data_source as source
@@ -17,6 +20,17 @@ export.default_status = True  # 插件默认开关
 export.ignore = True  # 插件管理器忽略此插件
 
 driver = get_driver()
+app = get_asgi()
+
+
+@app.get("/render_image/{name}")
+async def _(name: str):
+    '''截图发送方式为http时，go-cqhttp从这里下载截图'''
+    result = await read_image(name)
+    if result is None:
+        return Response(status_code=404)
+    image_bytes, media_type = result
+    return Response(content=image_bytes, media_type=media_type)
 
 
 @driver.on_startup
@@ -24,28 +38,57 @@ async def _():
     '''
     初始化链接ws
     '''
+    await cluster.start(driver.config.port)
+    render_client.start()
+    if not cluster.is_leader:
+        # 子进程的推送由主进程转发
+        source.push_dispatcher.start()
+        return
     log = 'jx3_api > 开始连接ws.'
     logger.info(log)
-    source.init()
+    source.ws_supervisor.start()
 
 
 @driver.on_shutdown
 async def _():
-    '''shut_down时关闭链接'''
+    '''
+    shut_down时关闭链接，先停止接收推送，再写入缓存中的数据，最后关闭浏览器、http客户端和数据库
+    插件的on_shutdown在本插件之后执行，需要数据库的清理都放在这里
+    '''
     log = 'jx3_bot进程关闭，正在清理……'
     logger.info(log)
+    log = 'jx3_api > 关闭ws链接。'
+    logger.info(log)
+    await source.ws_supervisor.stop()
+    await source.push_dispatcher.stop()
+    await cluster.stop()
+    log = '写入查询记录'
+    logger.info(log)
+    try:
+        await source.flush_search_record()
+    except Exception as e:
+        log = f'写入查询记录失败：{str(e)}'
+        logger.error(log)
+    log = '关闭渲染服务'
+    logger.info(log)
+    await render_client.stop()
     log = '关闭无头浏览器'
     logger.info(log)
     browser = get_broser()
     if browser is not None:
         await close_browser()
+    log = '关闭http客户端'
+    logger.info(log)
+    await close_client()
     log = '关闭数据库'
     logger.info(log)
     await Tortoise.close_connections()
-    log = 'jx3_api > 关闭ws链接。'
-    logger.info(log)
-    ws_connect = source.get_ws_connect()
-    await ws_connect.close()
+
+
+@driver.on_bot_disconnect
+async def _(bot: Bot):
+    '''机器人断开链接，停止它的推送处理任务'''
+    source.push_dispatcher.remove_bot(bot.self_id)
 
 
 # 查看ws链接状态
@@ -57,11 +100,27 @@ async def _(bot: Bot, event: PrivateMessageEvent):
     '''
     查询ws链接状态
     '''
-    ws_connect = source.get_ws_connect()
-    if ws_connect.closed:
-        msg = 'jx3_api > 当前未链接。'
+    if not cluster.is_leader:
+        await ws_check.finish('jx3_api > ws链接由主进程管理，请向主进程的机器人发送。')
+    status = source.ws_supervisor.get_status()
+    if status['connected']:
+        msg = f"jx3_api > 当前链接正常，已链接 {status['uptime']} 秒。"
+    elif status['running']:
+        msg = f"jx3_api > 当前未链接，正在重连，已失败 {status['fail_count']} 次。"
     else:
-        msg = 'jx3_api > 当前链接正常。'
+        msg = 'jx3_api > 当前未链接。'
+    msg += f"\n链接次数：{status['connect_count']}"
+    msg += f"\n心跳超时：{status['heartbeat_timeout']}"
+    msg += f"\n收到推送：{status['recv_count']}"
+    msg += f"\n重复推送：{status['duplicate_count']}"
+    if status['last_error']:
+        msg += f"\n上次断开：{status['last_error']}"
+    dispatch = source.push_dispatcher.get_status()
+    msg += f"\n待分发推送：{dispatch['queue_size']}"
+    for bot_id, size in dispatch['bot_queue'].items():
+        msg += f"\nBot({bot_id}) 待处理：{size}"
+    msg += f"\n推送处理：{dispatch['dispatch_count']} 次，平均 {dispatch['avg_latency']} 秒，最长 {dispatch['max_latency']} 秒"
+    msg += f"\n队列满丢弃：{dispatch['drop_count']}"
     await ws_check.finish(msg)
 
 # 查看ws链接状态
@@ -73,11 +132,12 @@ async def _(bot: Bot, event: PrivateMessageEvent):
     '''
     关闭ws链接
     '''
-    ws_connect = source.get_ws_connect()
-    if ws_connect.closed:
+    if not cluster.is_leader:
+        await ws_close.finish('jx3_api > ws链接由主进程管理，请向主进程的机器人发送。')
+    if not source.ws_supervisor.running:
         msg = 'ws已经关闭了，不要重复关闭。'
     else:
-        await ws_connect.close()
+        await source.ws_supervisor.stop()
         msg = 'ws关闭成功！'
     await ws_close.finish(msg)
 
@@ -90,23 +150,10 @@ async def _(bot: Bot, event: PrivateMessageEvent):
     '''
     重连ws链接
     '''
-    ws_connect = source.get_ws_connect()
-    if ws_connect.closed:
-        await source.on_connect()
+    if not cluster.is_leader:
+        await ws_re_connect.finish('jx3_api > ws链接由主进程管理，请向主进程的机器人发送。')
+    if source.ws_supervisor.start():
         msg = 'jx3_api > 正在重连……'
     else:
         msg = 'jx3_api > 当前已链接，请勿重复链接。'
     await ws_re_connect.finish(msg)
-
-
-# jx3_api中ws的心跳事件
-@scheduler.scheduled_job("interval", seconds=5)
-async def _():
-    try:
-        ws_connect = source.get_ws_connect()
-        if ws_connect.closed:
-            msg = "检测到jx3_api断开链接！正在重连……"
-            logger.debug(msg)
-            await source.on_connect()
-    except Exception:
-        pass
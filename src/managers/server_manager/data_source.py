@@ -1,92 +1,386 @@
 import asyncio
 import json
-from asyncio import AbstractEventLoop
+import random
+import time
+from typing import Optional
 
 import websockets
 from nonebot import get_bots
 from nonebot.message import handle_event
+from src.modules.search_record import SearchRecord
+from src.utils.cache import TTLCache
+from src.utils.cluster import cluster
 from src.utils.config import config
-from src.utils.jx3_event import Jx3EventList
+from src.utils.jx3_event import Jx3EventList, RecvEvent
 from src.utils.log import logger
-from websockets.exceptions import (ConnectionClosed, ConnectionClosedError,
-                                   ConnectionClosedOK)
+from websockets.exceptions import ConnectionClosed
 from websockets.legacy.client import WebSocketClientProtocol
 
-ws_connect: WebSocketClientProtocol
-'''
-ws全局链接
-'''
+ws_config: dict = config.get('jx3-api')
+'''jx3-api的配置'''
 
-loop: AbstractEventLoop
-'''
-事件循环池
-'''
 
+class PushDispatcher:
+    '''
+    推送分发，接收和处理分开，每个机器人有独立的队列和处理任务，互不阻塞
+    '''
+
+    dispatch_count: int
+    '''处理完成的推送数，每个机器人算一次'''
+    total_latency: float
+    '''从收到到处理完成的总耗时，单位：秒'''
+    max_latency: float
+    '''最大耗时，单位：秒'''
+    drop_count: int
+    '''队列满时丢弃的推送数，每个机器人算一次'''
+
+    def __init__(self):
+        self.dispatch_count = 0
+        self.total_latency = 0
+        self.max_latency = 0
+        self.drop_count = 0
+        self._queue: Optional[asyncio.Queue] = None
+        '''收到的推送队列，item：(event, 收到时间)'''
+        self._task: Optional[asyncio.Task] = None
+        '''分发任务'''
+        self._bot_queue: dict[str, asyncio.Queue] = {}
+        '''机器人推送队列，key：机器人QQ，item：(bot, event, 收到时间)'''
+        self._bot_task: dict[str, asyncio.Task] = {}
+        '''机器人处理任务'''
+
+    def start(self) -> None:
+        '''启动分发任务'''
+        if self._queue is None:
+            self._queue = asyncio.Queue(ws_config.get('ws-queue-size'))
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        '''停止所有任务，未处理的推送丢弃'''
+        task_list = list(self._bot_task.values())
+        if self._task is not None:
+            task_list.append(self._task)
+        for task in task_list:
+            task.cancel()
+        self._task = None
+        self._bot_task.clear()
+        self._bot_queue.clear()
+
+    def put(self, event: RecvEvent) -> None:
+        '''放入一条推送，不等待处理，队列满时丢弃，不阻塞接收'''
+        try:
+            self._queue.put_nowait((event, time.time()))
+        except asyncio.QueueFull:
+            self.drop_count += 1
+            log = f'jx3_api > 待分发推送队列已满，丢弃推送：{event.get_event_name()}'
+            logger.warning(log)
+
+    async def _run(self) -> None:
+        '''分发任务，把推送放入每个机器人的队列，一个机器人处理不过来不影响其他机器人'''
+        while True:
+            event, recv_time = await self._queue.get()
+            for bot_id, one_bot in get_bots().items():
+                queue = self._get_bot_queue(bot_id)
+                try:
+                    queue.put_nowait((one_bot, event, recv_time))
+                except asyncio.QueueFull:
+                    self.drop_count += 1
+                    log = f'Bot({bot_id}) | 待处理推送队列已满，丢弃推送：{event.get_event_name()}'
+                    logger.warning(log)
+            self._queue.task_done()
+
+    def remove_bot(self, bot_id: str) -> None:
+        '''机器人断开链接，停止处理任务，未处理的推送丢弃'''
+        task = self._bot_task.pop(bot_id, None)
+        if task is not None:
+            task.cancel()
+        self._bot_queue.pop(bot_id, None)
 
-def init():
+    def _get_bot_queue(self, bot_id: str) -> asyncio.Queue:
+        '''获取机器人队列，没有则创建队列和处理任务'''
+        queue = self._bot_queue.get(bot_id)
+        if queue is None:
+            queue = asyncio.Queue(ws_config.get('bot-queue-size'))
+            self._bot_queue[bot_id] = queue
+        task = self._bot_task.get(bot_id)
+        if task is None or task.done():
+            self._bot_task[bot_id] = asyncio.get_event_loop().create_task(self._bot_run(queue))
+        return queue
+
+    async def _bot_run(self, queue: asyncio.Queue) -> None:
+        '''机器人处理任务，一个推送出错不影响后面的推送'''
+        while True:
+            bot, event, recv_time = await queue.get()
+            try:
+                await handle_event(bot, event)
+            except Exception as e:
+                log = f'Bot({bot.self_id}) | 处理推送出错：{str(e)}'
+                logger.error(log)
+            latency = time.time()-recv_time
+            self.dispatch_count += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            queue.task_done()
+
+    def get_status(self) -> dict:
+        '''
+        :返回分发状态,dict字段：
+        * queue_size：待分发数
+        * bot_queue：每个机器人待处理数，key：机器人QQ
+        * dispatch_count：处理完成数
+        * avg_latency：平均耗时，单位：秒
+        * max_latency：最大耗时，单位：秒
+        * drop_count：丢弃数
+        '''
+        count = self.dispatch_count
+        return {
+            "queue_size": self._queue.qsize() if self._queue is not None else 0,
+            "bot_queue": {bot_id: queue.qsize() for bot_id, queue in self._bot_queue.items()},
+            "dispatch_count": count,
+            "avg_latency": round(self.total_latency/count, 2) if count else 0,
+            "max_latency": round(self.max_latency, 2),
+            "drop_count": self.drop_count
+        }
+
+
+push_dispatcher = PushDispatcher()
+'''全局推送分发'''
+
+
+class WsSupervisor:
     '''
-    初始化
+    ws链接管理，断线后按指数退避重连，同一时间只有一条链接
     '''
-    global loop
-    loop = asyncio.get_event_loop()
-    loop.create_task(on_connect())
 
+    ws_connect: Optional[WebSocketClientProtocol]
+    '''当前链接'''
+    connect_time: float
+    '''本次链接建立时间，未链接为0'''
+    connect_count: int
+    '''链接成功次数'''
+    fail_count: int
+    '''连续链接失败次数'''
+    heartbeat_timeout: int
+    '''心跳超时次数'''
+    recv_count: int
+    '''收到的推送数'''
+    last_error: str
+    '''上次断开原因'''
 
-def get_ws_connect() -> WebSocketClientProtocol:
-    global ws_connect
-    return ws_connect
+    def __init__(self):
+        self.ws_connect = None
+        self.connect_time = 0
+        self.connect_count = 0
+        self.fail_count = 0
+        self.heartbeat_timeout = 0
+        self.recv_count = 0
+        self.last_error = ""
+        self._lock = asyncio.Lock()
+        '''链接锁，保证只有一个任务在链接'''
+        self._task: Optional[asyncio.Task] = None
+        '''守护任务'''
+        self._recv_cache = TTLCache("ws_push", 1000)
+        '''最近收到的推送，用于重连前后去重'''
 
+    @property
+    def running(self) -> bool:
+        '''守护任务是否在运行'''
+        return self._task is not None and not self._task.done()
 
-async def on_connect():
-    global ws_connect
-    global loop
+    @property
+    def connected(self) -> bool:
+        '''当前是否已链接'''
+        return self.ws_connect is not None and not self.ws_connect.closed
 
-    ws_path: str = config.get('jx3-api').get('ws-path')
-    max_recon_times: int = config.get('default').get('max-recon-times')
+    def start(self) -> bool:
+        '''
+        :说明
+            启动守护任务，已在运行则跳过
+
+        :返回
+            * bool：是否新启动
+        '''
+        push_dispatcher.start()
+        if self.running:
+            return False
+        self._task = asyncio.get_event_loop().create_task(self._run())
+        return True
+
+    async def stop(self) -> None:
+        '''停止守护任务并关闭链接，不再重连'''
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.ws_connect is not None:
+            await self.ws_connect.close()
+        self.connect_time = 0
+
+    def _get_delay(self) -> float:
+        '''获取重连等待时间，指数增长，带随机抖动'''
+        delay = min(ws_config.get('ws-max-delay'), ws_config.get('ws-base-delay')*2**self.fail_count)
+        return delay/2+random.uniform(0, delay/2)
+
+    async def _connect(self) -> None:
+        '''建立链接，关闭旧链接'''
+        async with self._lock:
+            if self.ws_connect is not None and not self.ws_connect.closed:
+                await self.ws_connect.close()
+            # 心跳由守护任务处理
+            self.ws_connect = await websockets.connect(uri=ws_config.get('ws-path'),
+                                                       ping_interval=None,
+                                                       close_timeout=10)
+            self.connect_time = time.time()
+            self.connect_count += 1
+
+    async def _run(self) -> None:
+        '''守护任务，链接断开后重连'''
+        max_recon_times: int = config.get('default').get('max-recon-times')
+        while True:
+            try:
+                await self._connect()
+            except (ConnectionRefusedError, OSError, websockets.InvalidHandshake, asyncio.TimeoutError) as e:
+                self.fail_count += 1
+                self.last_error = str(e)
+                delay = self._get_delay()
+                log = f'jx3_api > [{self.fail_count}] 链接失败：{e}，{round(delay, 1)} 秒后重连'
+                if self.fail_count == max_recon_times:
+                    logger.error(log)
+                else:
+                    logger.info(log)
+                await asyncio.sleep(delay)
+                continue
 
-    for count in range(max_recon_times):
-        try:
-            ws_connect = await websockets.connect(uri=ws_path,
-                                                  ping_interval=20,
-                                                  ping_timeout=20,
-                                                  close_timeout=10)
             logger.info('jx3_api > websockets链接成功！')
-            loop.create_task(_task())
-            return
-        except (ConnectionRefusedError, OSError) as e:
-            logger.info(f'jx3_api > [{count}] {e}')
-            logger.info(f'jx3_api > [{count}] 尝试向 websockets 服务器建立链接！')
-            await asyncio.sleep(1)
+            try:
+                await self._recv_loop()
+            except Exception as e:
+                self.last_error = str(e)
+                if self.ws_connect is not None:
+                    await self.ws_connect.close()
+            # 链接保持足够久才重置失败次数，反复断开时重连等待时间继续增长
+            if time.time()-self.connect_time >= ws_config.get('ws-stable-time'):
+                self.fail_count = 0
+            else:
+                self.fail_count += 1
+            self.connect_time = 0
+            delay = self._get_delay()
+            log = f'jx3_api > 链接已断开：{self.last_error}，{round(delay, 1)} 秒后重连'
+            logger.error(log)
+            await asyncio.sleep(delay)
 
+    async def _heartbeat(self) -> bool:
+        '''发送心跳，返回链接是否正常'''
+        try:
+            pong_waiter = await self.ws_connect.ping()
+            await asyncio.wait_for(pong_waiter, timeout=ws_config.get('ws-heartbeat-timeout'))
+            return True
+        except (asyncio.TimeoutError, ConnectionClosed):
+            return False
 
-async def _task():
-    global ws_connect
-    global loop
-    try:
+    async def _recv_loop(self) -> None:
+        '''接收推送，空闲超过心跳间隔时检查链接'''
         while True:
-            data_recv = await ws_connect.recv()
+            try:
+                data_recv = await asyncio.wait_for(self.ws_connect.recv(),
+                                                   timeout=ws_config.get('ws-heartbeat-interval'))
+            except asyncio.TimeoutError:
+                if await self._heartbeat():
+                    continue
+                self.heartbeat_timeout += 1
+                self.last_error = "心跳超时"
+                await self.ws_connect.close()
+                return
+            except ConnectionClosed as e:
+                self.last_error = f"code：{e.code}，{e.reason}"
+                return
+
+            try:
+                await self._handle_recv(data_recv)
+            except Exception as e:
+                # 一条推送出错不影响链接
+                log = f'jx3_api > 处理推送出错：{str(e)}，推送：{data_recv}'
+                logger.error(log)
+
+    def _is_duplicate(self, data_recv: str) -> bool:
+        '''检查推送是否重复，只在重连后一段时间内检查，服务器可能重发断开前的推送'''
+        in_window = time.time()-self.connect_time < ws_config.get('ws-dedupe-window')
+        if self.connect_count > 1 and in_window:
+            hit, _ = self._recv_cache.lookup(data_recv)
+            if hit:
+                return True
+        self._recv_cache.set(data_recv, None, ws_config.get('ws-dedupe-ttl'))
+        return False
+
+    async def _handle_recv(self, data_recv: str) -> None:
+        '''处理一条推送'''
+        try:
             data = json.loads(data_recv)
-            msg_type: int = data['type']
-            event = None
-            for event_type in Jx3EventList:
-                if msg_type == event_type.get_api_type():
-                    event = event_type(data)
-                    break
-
-            if event is not None:
-                # 服务器推送，对所有机器人广播事件
-                log = _get_recv_log(data)
-                logger.debug(log)
-                bots = get_bots()
-                for _, one_bot in bots.items():
-                    await handle_event(one_bot, event)
-
-    except (ConnectionClosed, ConnectionClosedError, ConnectionClosedOK) as e:
-        if e.code != 1000:
-            logger.error('jx3_api > 链接已断开！')
-        else:
-            logger.error('jx3_api > 链接被关闭！')
-        logger.error(e)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or 'type' not in data:
+            log = f'jx3_api > 无法解析的推送：{data_recv}'
+            logger.error(log)
+            return
+        if self._is_duplicate(data_recv):
+            log = f'jx3_api > 重复推送，已跳过：{data_recv}'
+            logger.debug(log)
+            return
+        self.recv_count += 1
+        # 多进程模式下推送给子进程
+        cluster.publish("push", data)
+
+        event = _get_event(data)
+        if event is not None:
+            # 服务器推送，交给分发任务对所有机器人广播事件
+            log = _get_recv_log(data)
+            logger.debug(log)
+            push_dispatcher.put(event)
+
+    def get_status(self) -> dict:
+        '''
+        :返回链接状态,dict字段：
+        * connected：是否已链接
+        * running：是否在自动重连
+        * uptime：本次链接时长，单位：秒
+        * connect_count：链接成功次数
+        * fail_count：连续链接失败次数
+        * heartbeat_timeout：心跳超时次数
+        * recv_count：收到的推送数
+        * duplicate_count：跳过的重复推送数
+        * last_error：上次断开原因
+        '''
+        return {
+            "connected": self.connected,
+            "running": self.running,
+            "uptime": int(time.time()-self.connect_time) if self.connect_time else 0,
+            "connect_count": self.connect_count,
+            "fail_count": self.fail_count,
+            "heartbeat_timeout": self.heartbeat_timeout,
+            "recv_count": self.recv_count,
+            "duplicate_count": self._recv_cache.hits,
+            "last_error": self.last_error
+        }
+
+
+ws_supervisor = WsSupervisor()
+'''全局ws链接管理'''
+
+
+def _get_event(data: dict) -> Optional[RecvEvent]:
+    '''根据推送类型生成事件，未知类型返回None'''
+    msg_type: int = data['type']
+    for event_type in Jx3EventList:
+        if msg_type == event_type.get_api_type():
+            return event_type(data)
+    return None
+
+
+@cluster.subscribe("push")
+async def _(data: dict):
+    '''子进程收到主进程转发的推送'''
+    event = _get_event(data)
+    if event is not None:
+        push_dispatcher.put(event)
 
 
 def _get_recv_log(data: dict) -> str:
@@ -113,3 +407,8 @@ def _get_recv_log(data: dict) -> str:
         serendipity = recv_data.get('serendipity')
         log = f"奇遇推送事件：[{server}]的[{name}]抱走了奇遇：{serendipity}"
     return log
+
+
+async def flush_search_record() -> int:
+    '''关闭前写入查询记录，需要在关闭数据库前调用'''
+    return await SearchRecord.flush()
@@ -10,9 +10,9 @@ defaule_nickname: str = config.get('default').get('nickname')
 
 class BotInfo(Model):
     '''QQ机器人表'''
-    bot_id = fields.IntField(pk=True)
+    bot_id = fields.BigIntField(pk=True)
     '''机器人QQ号'''
-    owner_id = fields.IntField(null=True)
+    owner_id = fields.BigIntField(null=True)
     '''管理员账号'''
     nickname = fields.CharField(max_length=255, default=defaule_nickname)
     '''机器人昵称'''
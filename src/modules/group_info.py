@@ -1,8 +1,12 @@
 from typing import Optional
 
+from src.utils.cache import MemoryCache
 from src.utils.config import config as baseconfig
+from src.utils.database import get_update_sql
+from src.utils.push_index import push_index
 from tortoise import fields
 from tortoise.models import Model
+from tortoise.transactions import in_transaction
 
 config = baseconfig.get('default')
 default_server: str = config.get('server')
@@ -24,15 +28,21 @@ robot_goodnight = [{
     "data": config.get('robot-goodnight')
 }]
 
+group_cache = MemoryCache("group_info", shared=True)
+'''群设置缓存，key：(bot_id, group_id)，value：dict或None'''
+
+goodnight_cache = MemoryCache("goodnight_plan", shared=True)
+'''晚安发送计划，key：机器人QQ，提前准备，零点直接发送，影响晚安的群设置修改时删除'''
+
 
 class GroupInfo(Model):
     '''
     QQ群表
     '''
     id = fields.IntField(pk=True, generated=True)
-    bot_id = fields.IntField()
+    bot_id = fields.BigIntField()
     '''机器人QQ'''
-    group_id = fields.IntField()
+    group_id = fields.BigIntField()
     '''QQ群号'''
     group_name = fields.CharField(max_length=255, default='')
     '''群名'''
@@ -60,6 +70,94 @@ class GroupInfo(Model):
     class Meta:
         table = "group_info"
         table_description = "管理QQ群信息"
+        unique_together = ("bot_id", "group_id")
+
+    @staticmethod
+    def _get_cache_value(record: "GroupInfo") -> dict:
+        '''生成缓存数据'''
+        return {
+            "robot_status": record.robot_status,
+            "server": record.server,
+            "active": record.active
+        }
+
+    @classmethod
+    async def _get_cache(cls, bot_id: int, group_id: int) -> Optional[dict]:
+        '''
+        :说明
+            读取群设置缓存，未命中则查询数据库并写入缓存
+
+        :参数
+            * bot_id：机器人QQ
+            * group_id：QQ群号
+
+        :返回
+            * dict：缓存数据
+            * None：群未注册
+        '''
+        key = (bot_id, group_id)
+        flag, value = group_cache.lookup(key)
+        if flag:
+            return value
+        version = group_cache.get_version()
+        record = await cls.get_or_none(bot_id=bot_id, group_id=group_id)
+        value = None if record is None else cls._get_cache_value(record)
+        group_cache.fill(key, value, version)
+        return value
+
+    @classmethod
+    async def load_cache(cls, bot_id: int) -> int:
+        '''
+        :说明
+            批量加载一个机器人的群设置缓存
+
+        :参数
+            * bot_id：机器人QQ
+
+        :返回
+            * int：加载数量
+        '''
+        version = group_cache.get_version()
+        record_list = await cls.filter(bot_id=bot_id)
+        for record in record_list:
+            group_cache.fill((bot_id, record.group_id), cls._get_cache_value(record), version)
+            push_index.set_group(bot_id, record.group_id, server=record.server, robot_status=record.robot_status)
+        return len(record_list)
+
+    @classmethod
+    async def bulk_sync(cls, bot_id: int, group_dict: dict[int, str]) -> tuple[int, int]:
+        '''
+        :说明
+            批量注册群，不存在的增加，群名改变的更新，不删除已退出的群，缓存需要另外加载
+
+        :参数
+            * bot_id：机器人QQ
+            * group_dict：群列表，key：QQ群号，value：群名
+
+        :返回
+            * int：增加数量
+            * int：更新数量
+        '''
+        record_list = await cls.filter(bot_id=bot_id).values_list("id", "group_id", "group_name")
+        exist_dict = {group_id: (id, group_name) for id, group_id, group_name in record_list}
+
+        create_list = [cls(bot_id=bot_id, group_id=group_id, group_name=group_name)
+                       for group_id, group_name in group_dict.items() if group_id not in exist_dict]
+        update_list = [[group_dict[group_id], id] for group_id, (id, group_name) in exist_dict.items()
+                       if group_id in group_dict and group_dict[group_id] != group_name]
+
+        if create_list or update_list:
+            async with in_transaction() as connection:
+                if create_list:
+                    await cls.bulk_create(create_list, using_db=connection)
+                if update_list:
+                    sql = get_update_sql(connection, cls._meta.db_table, "group_name")
+                    await connection.execute_many(sql, update_list)
+        if create_list:
+            # 其他进程可能缓存了新增的群未注册
+            group_cache.delete_prefix((bot_id,))
+            goodnight_cache.delete(bot_id)
+        return len(create_list), len(update_list)
 
     @classmethod
     async def get_group_list(cls, bot_id: int) -> list[int]:
@@ -122,8 +220,8 @@ class GroupInfo(Model):
         :返回
             * bool
         '''
-        record: GroupInfo = await cls.get_or_none(bot_id=bot_id, group_id=group_id)
-        return None if record is None else record.robot_status
+        value = await cls._get_cache(bot_id, group_id)
+        return None if value is None else value['robot_status']
 
     @classmethod
     async def reset_sign(cls, bot_id: int) -> None:
@@ -175,6 +273,9 @@ class GroupInfo(Model):
         if record is not None:
             record.robot_status = status
             await record.save(update_fields=["robot_status"])
+            group_cache.update((bot_id, group_id), robot_status=status)
+            goodnight_cache.delete(bot_id)
+            push_index.set_group(bot_id, group_id, robot_status=status)
             return True
         else:
             return False
@@ -189,17 +290,21 @@ class GroupInfo(Model):
             * bot_id：机器人QQ
             * group_id：QQ群号
         '''
-        record, _ = await cls.get_or_create(bot_id=bot_id, group_id=group_id)
+        record, flag = await cls.get_or_create(bot_id=bot_id, group_id=group_id)
         record.group_name = group_name
         await record.save(update_fields=["group_name"])
+        group_cache.set((bot_id, group_id), cls._get_cache_value(record))
+        if flag:
+            goodnight_cache.delete(bot_id)
+        push_index.set_group(bot_id, group_id, server=record.server, robot_status=record.robot_status)
 
     @classmethod
     async def check_group_init(cls, bot_id: int, group_id: int) -> bool:
         '''
         检查群是否注册
         '''
-        record = await cls.get_or_none(bot_id=bot_id, group_id=group_id)
-        return (record is not None)
+        value = await cls._get_cache(bot_id, group_id)
+        return (value is not None)
 
     @classmethod
     async def get_server(cls, bot_id: int, group_id: int) -> Optional[str]:
@@ -214,8 +319,8 @@ class GroupInfo(Model):
         :返回
             * str：服务器名
         '''
-        record = await cls.get_or_none(bot_id=bot_id, group_id=group_id)
-        return None if record is None else record.server
+        value = await cls._get_cache(bot_id, group_id)
+        return None if value is None else value['server']
 
     @classmethod
     async def set_server(cls, bot_id: int, group_id: int, server: str) -> None:
@@ -232,6 +337,8 @@ class GroupInfo(Model):
         if record is not None:
             record.server = server
             await record.save(update_fields=["server"])
+            group_cache.update((bot_id, group_id), server=server)
+            push_index.set_group(bot_id, group_id, server=server)
         else:
             raise Exception
 
@@ -250,6 +357,7 @@ class GroupInfo(Model):
         if record is not None:
             record.active = active
             await record.save(update_fields=["active"])
+            group_cache.update((bot_id, group_id), active=active)
         else:
             raise Exception
 
@@ -266,8 +374,8 @@ class GroupInfo(Model):
         :返回
             * int：活跃度，1-100
         '''
-        record = await cls.get_or_none(bot_id=bot_id, group_id=group_id)
-        return None if record is None else record.active
+        value = await cls._get_cache(bot_id, group_id)
+        return None if value is None else value['active']
 
     @classmethod
     async def set_welcome_status(cls, bot_id: int, group_id: int, welcome_status: bool):
@@ -331,6 +439,7 @@ class GroupInfo(Model):
         if record is not None:
             record.goodnight_status = goodnight_status
             await record.save(update_fields=["goodnight_status"])
+            goodnight_cache.delete(bot_id)
         else:
             raise Exception
 
@@ -345,6 +454,7 @@ class GroupInfo(Model):
         if record is not None:
             record.goodnight_text = goodnight_text
             await record.save(update_fields=["goodnight_text"])
+            goodnight_cache.delete(bot_id)
         else:
             raise Exception
 
@@ -353,6 +463,34 @@ class GroupInfo(Model):
         record = await cls.get_or_none(bot_id=bot_id, group_id=group_id)
         return None if record is None else record.goodnight_text
 
+    @classmethod
+    async def get_image_names(cls) -> set[str]:
+        '''
+        :说明
+            获取所有群的欢迎、离群、晚安消息中使用的图片，用于清理不再使用的图片
+
+        :返回
+            * set[str]：图片名称，旧数据为文件路径
+        '''
+        record_list = await cls.all().values_list("welcome_text", "someoneleft_text", "goodnight_text")
+        names = set()
+        for message_list in (one_list for record in record_list for one_list in record):
+            for one_message in message_list or []:
+                if one_message.get('type') == 'image':
+                    names.add(one_message['data'])
+        return names
+
+    @classmethod
+    async def get_goodnight_list(cls, bot_id: int) -> list[dict]:
+        '''
+        :说明
+            一次查询所有开启机器人的群的晚安设置
+
+        :返回
+            * list[dict]：字段：group_id，goodnight_status，goodnight_text
+        '''
+        return await cls.filter(bot_id=bot_id, robot_status=True).values("group_id", "goodnight_status", "goodnight_text")
+
     @classmethod
     async def get_all_data(cls, bot_id: int) -> list[dict]:
         '''
@@ -383,6 +521,9 @@ class GroupInfo(Model):
         改变所有群开关
         '''
         await cls.filter(bot_id=bot_id).update(robot_status=status)
+        group_cache.delete_prefix((bot_id,))
+        goodnight_cache.delete(bot_id)
+        push_index.set_bot_robot_status(bot_id, status)
 
     @classmethod
     async def delete_one(cls, bot_id: int, group_id: int) -> bool:
@@ -390,6 +531,9 @@ class GroupInfo(Model):
         record = await cls.get_or_none(bot_id=bot_id, group_id=group_id)
         if record is not None:
             await record.delete()
+            group_cache.set((bot_id, group_id), None)
+            goodnight_cache.delete(bot_id)
+            push_index.remove_group(bot_id, group_id)
             return True
         return False
 
@@ -397,3 +541,6 @@ class GroupInfo(Model):
     async def detele_bot(cls, bot_id: int) -> None:
         '''删除一个机器人的数据'''
         await cls.filter(bot_id=bot_id).delete()
+        group_cache.delete_prefix((bot_id,))
+        goodnight_cache.delete(bot_id)
+        push_index.remove_bot(bot_id)
@@ -1,7 +1,14 @@
 from typing import Optional
 
+from src.utils.cache import MemoryCache
+from src.utils.database import get_update_sql
+from src.utils.push_index import push_index
 from tortoise import fields
 from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+plugin_cache = MemoryCache("plugin_info", shared=True)
+'''插件开关缓存，key：(bot_id, group_id, module_name)，value：开关状态'''
 
 
 class PluginInfo(Model):
@@ -9,7 +16,7 @@ class PluginInfo(Model):
     插件管理表
     '''
     id = fields.IntField(pk=True, generated=True)
-    bot_id = fields.IntField()
+    bot_id = fields.BigIntField()
     '''
     机器人QQ
     '''
@@ -21,7 +28,7 @@ class PluginInfo(Model):
     '''
     插件描述
     '''
-    group_id = fields.IntField()
+    group_id = fields.BigIntField()
     '''
     QQ群号
     '''
@@ -33,6 +40,27 @@ class PluginInfo(Model):
     class Meta:
         table = "plugin_info"
         table_description = "处理插件"
+        unique_together = ("bot_id", "group_id", "module_name")
+
+    @classmethod
+    async def load_cache(cls, bot_id: int) -> int:
+        '''
+        :说明
+            批量加载一个机器人的插件开关缓存
+
+        :参数
+            * bot_id：机器人QQ
+
+        :返回
+            * int：加载数量
+        '''
+        version = plugin_cache.get_version()
+        record_list = await cls.filter(bot_id=bot_id).values("module_name", "group_id", "status")
+        for record in record_list:
+            key = (bot_id, record['group_id'], record['module_name'])
+            plugin_cache.fill(key, record['status'], version)
+            push_index.set_plugin(bot_id, record['module_name'], record['group_id'], record['status'])
+        return len(record_list)
 
     @classmethod
     async def get_status(cls, bot_id: int, module_name: str, group_id: int) -> Optional[bool]:
@@ -48,8 +76,15 @@ class PluginInfo(Model):
         :返回
             * bool：当前插件开关状态
         '''
+        key = (bot_id, group_id, module_name)
+        flag, status = plugin_cache.lookup(key)
+        if flag:
+            return status
+        version = plugin_cache.get_version()
         record = await cls.get_or_none(bot_id=bot_id, module_name=module_name, group_id=group_id)
-        return None if record is None else record.status
+        status = None if record is None else record.status
+        plugin_cache.fill(key, status, version)
+        return status
 
     @classmethod
     async def change_status(cls, bot_id: int, module_name: str, group_id: int, status: bool) -> None:
@@ -67,6 +102,8 @@ class PluginInfo(Model):
         if record is not None:
             record.status = status
             await record.save(update_fields=["status"])
+            plugin_cache.set((bot_id, group_id, module_name), status)
+            push_index.set_plugin(bot_id, module_name, group_id, status)
         else:
             raise Exception
 
@@ -91,6 +128,51 @@ class PluginInfo(Model):
         else:
             update_fields = ["description"]
         await record.save(update_fields=update_fields)
+        plugin_cache.set((bot_id, group_id, module_name), record.status)
+        push_index.set_plugin(bot_id, module_name, group_id, record.status)
+
+    @classmethod
+    async def bulk_sync(cls, bot_id: int, group_list: list[int], plugin_list: list[dict]) -> tuple[int, int]:
+        '''
+        :说明
+            批量注册多个群的插件，不存在的按默认开关增加，描述改变的更新，缓存需要另外加载
+
+        :参数
+            * bot_id：机器人QQ
+            * group_list：QQ群号列表
+            * plugin_list：插件列表，dict字段：module_name，description，status
+
+        :返回
+            * int：增加数量
+            * int：更新数量
+        '''
+        record_list = await cls.filter(bot_id=bot_id).values_list("id", "module_name", "group_id", "description")
+        exist_dict = {(module_name, group_id): (id, description) for id, module_name, group_id, description in record_list}
+
+        create_list = []
+        update_list = []
+        for group_id in group_list:
+            for plugin in plugin_list:
+                module_name = plugin['module_name']
+                description = plugin['description']
+                one_exist = exist_dict.get((module_name, group_id))
+                if one_exist is None:
+                    create_list.append(cls(bot_id=bot_id, module_name=module_name, description=description,
+                                           group_id=group_id, status=plugin['status']))
+                elif one_exist[1] != description:
+                    update_list.append([description, one_exist[0]])
+
+        if create_list or update_list:
+            async with in_transaction() as connection:
+                if create_list:
+                    await cls.bulk_create(create_list, using_db=connection)
+                if update_list:
+                    sql = get_update_sql(connection, cls._meta.db_table, "description")
+                    await connection.execute_many(sql, update_list)
+        if create_list:
+            # 其他进程可能缓存了新增记录不存在
+            plugin_cache.delete_prefix((bot_id,))
+        return len(create_list), len(update_list)
 
     @classmethod
     async def set_group_status(cls, bot_id: int, group_id: int, status: bool) -> None:
@@ -104,6 +186,8 @@ class PluginInfo(Model):
             * status：插件状态
         '''
         await cls.filter(bot_id=bot_id, group_id=group_id).update(status=status)
+        plugin_cache.delete_prefix((bot_id, group_id))
+        push_index.set_group_plugins(bot_id, group_id, status)
 
     @classmethod
     async def set_module_status(cls, bot_id: int, module_name: str, status: bool) -> None:
@@ -117,6 +201,8 @@ class PluginInfo(Model):
             * status：插件状态
         '''
         await cls.filter(bot_id=bot_id, module_name=module_name).update(status=status)
+        plugin_cache.delete_prefix((bot_id,))
+        push_index.set_module(bot_id, module_name, status)
 
     @classmethod
     async def get_all_status_from_group(cls, bot_id: int, group_id: int) -> list[dict]:
@@ -139,8 +225,12 @@ class PluginInfo(Model):
     async def deltele_group(cls, bot_id: int, group_id: int) -> None:
         '''删除一个群插件'''
         await cls.filter(bot_id=bot_id, group_id=group_id).delete()
+        plugin_cache.delete_prefix((bot_id, group_id))
+        push_index.set_group_plugins(bot_id, group_id, False)
 
     @classmethod
     async def detele_bot(cls, bot_id: int) -> None:
         '''删除一个机器人'''
         await cls.filter(bot_id=bot_id).delete()
+        plugin_cache.delete_prefix((bot_id,))
+        push_index.remove_bot(bot_id)
@@ -1,17 +1,29 @@
+import asyncio
 from time import time
-from typing import Optional
 
+from src.utils.cache import MemoryCache
+from src.utils.database import get_update_sql
 from tortoise import fields
 from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+record_cache = MemoryCache("search_record")
+'''查询记录缓存，key：(bot_id, group_id, app_name)，value：{"count","last_time"}'''
+
+_dirty_dict: dict[tuple[int, int, str], dict] = {}
+'''未写入数据库的记录，value与缓存为同一个dict'''
+
+_loading: dict[tuple[int, int, str], asyncio.Task] = {}
+'''正在从数据库读取的记录，同一条记录同时未命中时只读取一次'''
 
 
 class SearchRecord(Model):
     '''查询使用记录表'''
 
     id = fields.IntField(pk=True, generated=True)
-    bot_id = fields.IntField()
+    bot_id = fields.BigIntField()
     '''机器人QQ'''
-    group_id = fields.IntField()
+    group_id = fields.BigIntField()
     '''群号'''
     app_name = fields.CharField(max_length=255)
     '''查询类型'''
@@ -23,35 +35,109 @@ class SearchRecord(Model):
     class Meta:
         table = "search_record"
         table_description = "记录查询次数"
+        unique_together = ("bot_id", "group_id", "app_name")
 
     @classmethod
-    async def append_or_update(cls, bot_id: int, group_id: int, app_name: str) -> bool:
-        '''增加或更新一条记录'''
-        _, flag = await cls.get_or_create(bot_id=bot_id, group_id=group_id, app_name=app_name)
-        return flag
+    async def _get_cache(cls, bot_id: int, group_id: int, app_name: str) -> dict:
+        '''
+        读取记录缓存，未命中则查询数据库，没有记录时为初始值
+        同时未命中的请求共用一次查询，拿到同一个dict，不会互相覆盖计数
+        '''
+        key = (bot_id, group_id, app_name)
+        flag, value = record_cache.lookup(key)
+        if flag:
+            return value
+        task = _loading.get(key)
+        if task is None:
+            task = asyncio.create_task(cls._load_cache(key))
+            _loading[key] = task
+            task.add_done_callback(lambda _: _loading.pop(key, None))
+        return await asyncio.shield(task)
 
     @classmethod
-    async def count_search(cls, bot_id: int, group_id: int, app_name: str):
-        '''使用一次'''
+    async def _load_cache(cls, key: tuple[int, int, str]) -> dict:
+        '''从数据库读取一条记录写入缓存'''
+        bot_id, group_id, app_name = key
         record = await cls.get_or_none(bot_id=bot_id, group_id=group_id, app_name=app_name)
-        if record:
-            record.count += 1
-            record.last_time = int(time())
-            await record.save(update_fields=["count", "last_time"])
+        if record is None:
+            value = {"count": 0, "last_time": 0}
+        else:
+            value = {"count": record.count, "last_time": record.last_time}
+        record_cache.set(key, value)
+        return value
 
     @classmethod
-    async def get_last_time(cls, bot_id: int, group_id: int, app_name: str) -> Optional[int]:
-        '''获取上次使用时间'''
-        record = await cls.get_or_none(bot_id=bot_id, group_id=group_id, app_name=app_name)
-        return record.last_time if record else None
+    async def count_search(cls, bot_id: int, group_id: int, app_name: str):
+        '''使用一次，只修改缓存，由flush定时写入数据库'''
+        value = await cls._get_cache(bot_id, group_id, app_name)
+        value['count'] += 1
+        value['last_time'] = int(time())
+        _dirty_dict[(bot_id, group_id, app_name)] = value
+
+    @classmethod
+    async def get_last_time(cls, bot_id: int, group_id: int, app_name: str) -> int:
+        '''获取上次使用时间，没有记录为0'''
+        value = await cls._get_cache(bot_id, group_id, app_name)
+        return value['last_time']
 
     @classmethod
-    async def get_count(cls, bot_id: int, group_id: int, app_name: str) -> Optional[int]:
+    async def get_count(cls, bot_id: int, group_id: int, app_name: str) -> int:
         '''获取统计次数'''
-        record = await cls.get_or_none(bot_id=bot_id, group_id=group_id, app_name=app_name)
-        return record.count if record else None
+        value = await cls._get_cache(bot_id, group_id, app_name)
+        return value['count']
+
+    @classmethod
+    async def flush(cls) -> int:
+        '''
+        :说明
+            把缓存中修改过的记录在一个事务中写入数据库
+
+        :返回
+            * int：写入条数
+        '''
+        if not _dirty_dict:
+            return 0
+        data = dict(_dirty_dict)
+        _dirty_dict.clear()
+        try:
+            bot_list = list(set(key[0] for key in data))
+            group_list = list(set(key[1] for key in data))
+            record_list = await cls.filter(bot_id__in=bot_list, group_id__in=group_list).values_list(
+                "id", "bot_id", "group_id", "app_name")
+            exist_dict = {(bot_id, group_id, app_name): id for id, bot_id, group_id, app_name in record_list}
+
+            create_list = []
+            count_list = []
+            time_list = []
+            for key, value in data.items():
+                id = exist_dict.get(key)
+                if id is None:
+                    bot_id, group_id, app_name = key
+                    create_list.append(cls(bot_id=bot_id, group_id=group_id, app_name=app_name,
+                                           count=value['count'], last_time=value['last_time']))
+                else:
+                    count_list.append([value['count'], id])
+                    time_list.append([value['last_time'], id])
+
+            async with in_transaction() as connection:
+                if create_list:
+                    await cls.bulk_create(create_list, using_db=connection)
+                if count_list:
+                    sql = get_update_sql(connection, cls._meta.db_table, "count")
+                    await connection.execute_many(sql, count_list)
+                    sql = get_update_sql(connection, cls._meta.db_table, "last_time")
+                    await connection.execute_many(sql, time_list)
+        except Exception:
+            # 写入失败，放回去下次再写，期间的新修改优先
+            for key, value in data.items():
+                _dirty_dict.setdefault(key, value)
+            raise
+        return len(data)
 
     @classmethod
     async def detele_bot(cls, bot_id: int):
         '''清理一个机器人的数据'''
         await cls.filter(bot_id=bot_id).delete()
+        record_cache.delete_where(lambda key: key[0] == bot_id)
+        for key in [key for key in _dirty_dict if key[0] == bot_id]:
+            del _dirty_dict[key]
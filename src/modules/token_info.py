@@ -7,7 +7,7 @@ from tortoise.models import Model
 class TokenInfo(Model):
     '''存储token表'''
     id = fields.IntField(pk=True, generated=True)
-    bot_id = fields.IntField()
+    bot_id = fields.BigIntField()
     '''机器人QQ'''
     token = fields.CharField(max_length=255)
     '''token值'''
@@ -17,6 +17,7 @@ class TokenInfo(Model):
     class Meta:
         table = "token_info"
         table_description = "存储token用"
+        unique_together = ("bot_id", "token")
 
     @classmethod
     async def get_token(cls, bot_id: int) -> list[dict]:
@@ -33,6 +34,18 @@ class TokenInfo(Model):
         record = await cls.filter(bot_id=bot_id).values("token", "alive")
         return record
 
+    @classmethod
+    async def get_all_token(cls) -> list[dict]:
+        '''
+        :说明
+            获取所有机器人的token列表
+
+        :返回
+            * list[dict]，dict{"bot_id":"","token":"","alive":""}
+        '''
+        record = await cls.all().values("bot_id", "token", "alive")
+        return record
+
     @classmethod
     async def get_alive_token(cls, bot_id: int) -> list[str]:
         '''
@@ -1,8 +1,10 @@
 from datetime import date
 from typing import Optional
 
+from src.utils.database import get_update_sql
 from tortoise import fields
 from tortoise.models import Model
+from tortoise.transactions import in_transaction
 
 
 class UserInfo(Model):
@@ -10,15 +12,15 @@ class UserInfo(Model):
     用户表
     '''
     id = fields.IntField(pk=True, generated=True)
-    bot_id = fields.IntField()
+    bot_id = fields.BigIntField()
     '''
     机器人QQ
     '''
-    user_id = fields.IntField()
+    user_id = fields.BigIntField()
     '''
     用户QQ号
     '''
-    group_id = fields.IntField()
+    group_id = fields.BigIntField()
     '''
     所属QQ群号
     '''
@@ -47,6 +49,7 @@ class UserInfo(Model):
     class Meta:
         table = "user_info"
         table_description = "管理用户"
+        unique_together = ("bot_id", "group_id", "user_id")
 
     @classmethod
     async def get_friendly(cls, bot_id: int, user_id: int, group_id: int) -> Optional[int]:
@@ -311,3 +314,47 @@ class UserInfo(Model):
     async def detele_bot(cls, bot_id: int) -> None:
         '''删除一个机器人的数据'''
         await cls.filter(bot_id=bot_id).delete()
+
+    @classmethod
+    async def bulk_sync(cls, bot_id: int, group_id: int, user_dict: dict[int, str],
+                        min_ratio: float = 0.5) -> tuple[int, int, int, int]:
+        '''
+        :说明
+            批量同步一个群的成员，与数据库对比后在一个事务中增加、更新、删除
+            获取的成员列表为空，或者少于已有记录的min_ratio时，可能是go-cqhttp临时出错，不删除成员，避免丢失签到、金币等数据
+
+        :参数
+            * bot_id：机器人QQ
+            * group_id：QQ群号
+            * user_dict：群成员，key：用户QQ，value：用户昵称
+            * min_ratio：成员列表至少为已有记录的多少时才删除不在列表中的成员
+
+        :返回
+            * int：增加数量
+            * int：更新数量
+            * int：删除数量
+            * int：跳过删除的数量
+        '''
+        record_list = await cls.filter(bot_id=bot_id, group_id=group_id).values_list("id", "user_id", "user_name")
+        exist_dict = {user_id: (id, user_name) for id, user_id, user_name in record_list}
+
+        create_list = [cls(bot_id=bot_id, user_id=user_id, group_id=group_id, user_name=user_name)
+                       for user_id, user_name in user_dict.items() if user_id not in exist_dict]
+        update_list = [[user_dict[user_id], id] for user_id, (id, user_name) in exist_dict.items()
+                       if user_id in user_dict and user_dict[user_id] != user_name]
+        delete_list = [id for user_id, (id, _) in exist_dict.items() if user_id not in user_dict]
+        skip_count = 0
+        if delete_list and (not user_dict or len(user_dict) < len(exist_dict)*min_ratio):
+            skip_count = len(delete_list)
+            delete_list = []
+
+        if create_list or update_list or delete_list:
+            async with in_transaction() as connection:
+                if create_list:
+                    await cls.bulk_create(create_list, using_db=connection)
+                if update_list:
+                    sql = get_update_sql(connection, cls._meta.db_table, "user_name")
+                    await connection.execute_many(sql, update_list)
+                if delete_list:
+                    await cls.filter(id__in=delete_list).using_db(connection).delete()
+        return len(create_list), len(update_list), len(delete_list), skip_count
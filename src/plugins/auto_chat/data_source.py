@@ -1,8 +1,8 @@
 from typing import Optional
 
-import httpx
 from src.modules.group_info import GroupInfo
 from src.utils.config import config
+from src.utils.http_client import get_client
 from src.utils.log import logger
 from src.utils.user_agent import get_user_agent
 
@@ -28,22 +28,22 @@ async def get_saohua() -> str:
     '''
     jx3_url: str = config.get('jx3-api').get('jx3-url')
     url = f"{jx3_url}/app/random"
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        try:
-            req_url = await client.get(url=url)
-            req = req_url.json()
-            if req['code'] == 200:
-                data = req['data']
-                msg = data['text']
-                log = f'请求骚话成功！内容：{msg}'
-                logger.debug(log)
-                return msg
-        except Exception as e:
-            log = f'请求骚话失败，原因：{str(e)}'
+    client = get_client(url)
+    try:
+        req_url = await client.get(url=url, headers=get_user_agent())
+        req = req_url.json()
+        if req['code'] == 200:
+            data = req['data']
+            msg = data['text']
+            log = f'请求骚话成功！内容：{msg}'
             logger.debug(log)
-            # 请求失败，从本地返回一条
-            msg = "你好骚啊。"
             return msg
+    except Exception as e:
+        log = f'请求骚话失败，原因：{str(e)}'
+        logger.debug(log)
+        # 请求失败，从本地返回一条
+        msg = "你好骚啊。"
+        return msg
 
 
 async def get_voice(text: str) -> Optional[str]:
@@ -68,20 +68,20 @@ async def get_voice(text: str) -> Optional[str]:
     url = f"{jx3_url}/share/aliyun"
     params = chat_voice.copy()
     params['text'] = text
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        try:
-            req_url = await client.get(url=url, params=params)
-            req = req_url.json()
-            if req['code'] == 200:
-                data = req['data']
-                voice_url = data['url']
-                # 获取语音数据
-                return voice_url
-            else:
-                log = f'语音合成请求参数出错：{req["msg"]}'
-                logger.debug(log)
-                return None
-        except Exception as e:
-            log = f'请求链接失败，原因：{str(e)}'
-            logger.error(log)
+    client = get_client(url)
+    try:
+        req_url = await client.get(url=url, params=params, headers=get_user_agent())
+        req = req_url.json()
+        if req['code'] == 200:
+            data = req['data']
+            voice_url = data['url']
+            # 获取语音数据
+            return voice_url
+        else:
+            log = f'语音合成请求参数出错：{req["msg"]}'
+            logger.debug(log)
             return None
+    except Exception as e:
+        log = f'请求链接失败，原因：{str(e)}'
+        logger.error(log)
+        return None
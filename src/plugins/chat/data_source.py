@@ -1,7 +1,7 @@
 from typing import Optional
 
-import httpx
 from src.utils.config import config
+from src.utils.http_client import get_client
 from src.utils.log import logger
 from src.utils.user_agent import get_user_agent
 
@@ -22,23 +22,23 @@ async def get_reply_jx3(question: str, nickname: str) -> Optional[str]:
     params = chat_nlp.copy()
     params['name'] = nickname
     params['question'] = question
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        try:
-            req_url = await client.get(url=url, params=params)
-            req = req_url.json()
-            if req['code'] == 200:
-                log = 'jx3API请求成功。'
-                logger.debug(log)
-                data = req['data']
-                return data['answer']
-            else:
-                log = f'jx3API请求失败：{req["msg"]}'
-                logger.debug(log)
-                return None
-        except Exception as e:
-            log = f'API访问失败：{str(e)}'
-            logger.error(log)
+    client = get_client(url)
+    try:
+        req_url = await client.get(url=url, params=params, headers=get_user_agent())
+        req = req_url.json()
+        if req['code'] == 200:
+            log = 'jx3API请求成功。'
+            logger.debug(log)
+            data = req['data']
+            return data['answer']
+        else:
+            log = f'jx3API请求失败：{req["msg"]}'
+            logger.debug(log)
             return None
+    except Exception as e:
+        log = f'API访问失败：{str(e)}'
+        logger.error(log)
+        return None
 
 
 async def get_reply_qingyunke(text: str, nickname: str) -> Optional[str]:
@@ -61,24 +61,24 @@ async def get_reply_qingyunke(text: str, nickname: str) -> Optional[str]:
         'msg': text
     }
     url = 'http://api.qingyunke.com/api.php'
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        try:
-            req_url = await client.get(url, params=params)
-            req = req_url.json()
-            if req['result'] == 0:
-                msg = str(req['content'])
-                # 消息替换
-                msg = msg.replace(r'{br}', '\n')
-                msg = msg.replace('菲菲', nickname)
-                log = '请求青云客API成功。'
-                logger.debug(log)
-                return msg
-            else:
-                e = req['content']
-                log = f'青云客API请求失败：{e}'
-                logger.error(log)
-                return None
-        except Exception as e:
-            log = f'青云客API访问失败：{str(e)}'
+    client = get_client(url)
+    try:
+        req_url = await client.get(url, params=params, headers=get_user_agent())
+        req = req_url.json()
+        if req['result'] == 0:
+            msg = str(req['content'])
+            # 消息替换
+            msg = msg.replace(r'{br}', '\n')
+            msg = msg.replace('菲菲', nickname)
+            log = '请求青云客API成功。'
+            logger.debug(log)
+            return msg
+        else:
+            e = req['content']
+            log = f'青云客API请求失败：{e}'
             logger.error(log)
             return None
+    except Exception as e:
+        log = f'青云客API访问失败：{str(e)}'
+        logger.error(log)
+        return None
@@ -1,9 +1,7 @@
-import asyncio
-import random
-
 from nonebot.adapters.cqhttp import Bot
 from nonebot.plugin import export, on
 from src.utils.jx3_event import NewsRecvEvent
+from src.utils.sender import Priority, send_group_msgs
 
 from . import data_source as source
 
@@ -30,14 +28,8 @@ async def _(bot: Bot, event: NewsRecvEvent):
     news_date = event.news_date
 
     msg = f"[{news_type}]来惹\n标题：{news_tittle}\n链接：{news_url}\n日期：{news_date}"
-    group_list = await bot.get_group_list()
-    for group in group_list:
-        group_id = group['group_id']
-        status = await source.get_robot_status(bot_id, group_id)
-        if status:
-            try:
-                await bot.send_group_msg(group_id=group_id, message=msg)
-                await asyncio.sleep(random.uniform(0.3, 0.5))
-            except Exception:
-                pass
+    group_list = source.get_push_groups(bot_id)
+    msg_list = [(group_id, msg) for group_id in group_list]
+    summary = await send_group_msgs(bot, msg_list, Priority.NORMAL, wait=False)
+    summary.log_when_done(f"Bot({bot.self_id}) | 新闻推送完毕")
     await news_recv.finish()
@@ -1,12 +1,14 @@
 from datetime import datetime
 from time import localtime, strftime
 
-from nonebot import on_regex
 from nonebot.adapters.cqhttp import Bot, GroupMessageEvent, MessageSegment
 from nonebot.adapters.cqhttp.permission import GROUP
 from nonebot.plugin import export
 from src.utils.browser import get_html_screenshots, get_web_screenshot
+from src.utils.cluster import cluster
+from src.utils.command_router import CommandRouter
 from src.utils.log import logger
+from src.utils.scheduler import scheduler
 from src.utils.utils import get_nickname
 
 from . import data_source as source
@@ -18,93 +20,106 @@ export.plugin_usage = '提供各种剑网三的查询功能。'
 export.default_status = True  # 插件默认开关
 export.ignore = False  # 插件管理器忽略此插件
 
+router = CommandRouter("jx3_search")
+'''查询指令路由，所有查询指令合并成一个正则匹配'''
+
+
+# 定时写入查询记录
+@scheduler.scheduled_job("interval", seconds=60)
+@cluster.broadcast_job("search_record_flush")
+async def _():
+    count = await source.flush_search_record()
+    if count:
+        log = f"查询记录写入数据库 {count} 条"
+        logger.debug(log)
+
 
 # 日常查询
-daily = on_regex(pattern=r"(^日常$)|(^日常 [\u4e00-\u9fa5]+$)", permission=GROUP, priority=5, block=True)
+daily = router.on_command("日常查询", r"(^日常$)|(^日常 [\u4e00-\u9fa5]+$)", permission=GROUP, priority=5, block=True)
 
 # 装备查询
 equipquery_regex = r"(^((装备)|(属性)) [(\u4e00-\u9fa5)|(1-9)|(@)]+$)|(^((装备)|(属性)) [\u4e00-\u9fa5]+ [(\u4e00-\u9fa5)|(1-9)|(@)]+$)"
-equipquery = on_regex(pattern=equipquery_regex, permission=GROUP, priority=5, block=True)
+equipquery = router.on_command("装备查询", equipquery_regex, permission=GROUP, priority=5, block=True)
 
 # 开服查询
 open_server_regex = r"(^开服$)|(^开服 [\u4e00-\u9fa5]+$)"
-open_server_send = on_regex(pattern=open_server_regex, permission=GROUP, priority=5, block=True)
+open_server_send = router.on_command("开服查询", open_server_regex, permission=GROUP, priority=5, block=True)
 
 # 金价查询
-gold_query = on_regex(pattern=r"(^金价$)|(^金价 [\u4e00-\u9fa5]+$)", permission=GROUP, priority=5, block=True)
+gold_query = router.on_command("金价查询", r"(^金价$)|(^金价 [\u4e00-\u9fa5]+$)", permission=GROUP, priority=5, block=True)
 
 # 奇穴查询
 extra_point_regex = r"(^奇穴 [\u4e00-\u9fa5]+$)|(^[\u4e00-\u9fa5]+奇穴$)"
-extra_point = on_regex(pattern=extra_point_regex, permission=GROUP, priority=5, block=True)
+extra_point = router.on_command("奇穴查询", extra_point_regex, permission=GROUP, priority=5, block=True)
 
 # 小药查询
 medicine_regex = r"(^小药 [\u4e00-\u9fa5]+$)|(^[\u4e00-\u9fa5]+小药$)"
-medicine = on_regex(pattern=medicine_regex, permission=GROUP, priority=5, block=True)
+medicine = router.on_command("小药查询", medicine_regex, permission=GROUP, priority=5, block=True)
 
 # 配装查询
 equip_group_query_regex = r"(^配装 [\u4e00-\u9fa5]+$)|(^[\u4e00-\u9fa5]+配装$)"
-equip_group_query = on_regex(pattern=equip_group_query_regex, permission=GROUP, priority=5, block=True)
+equip_group_query = router.on_command("配装查询", equip_group_query_regex, permission=GROUP, priority=5, block=True)
 
 # 宏查询
 macro_regex = r"(^宏 [\u4e00-\u9fa5]+$)|(^[\u4e00-\u9fa5]+宏$)"
-macro = on_regex(pattern=macro_regex, permission=GROUP, priority=5, block=True)
+macro = router.on_command("宏查询", macro_regex, permission=GROUP, priority=5, block=True)
 
 # 奇遇前置查询
 adventure_regex = r"^((前置)|(条件)) [\u4e00-\u9fa5]+$"
-adventurecondition = on_regex(pattern=adventure_regex, permission=GROUP, priority=5, block=True)
+adventurecondition = router.on_command("奇遇前置查询", adventure_regex, permission=GROUP, priority=5, block=True)
 
 # 科举查询
-exam = on_regex(pattern=r"^((考试)|(科举)) ", permission=GROUP, priority=5, block=True)
+exam = router.on_command("科举查询", r"^((考试)|(科举)) ", permission=GROUP, priority=5, block=True)
 
 # 攻略查询
 raiderse = r"(^攻略 [\u4e00-\u9fa5]+$)|(^[\u4e00-\u9fa5]+攻略$)"
-raiderse = on_regex(pattern=raiderse, permission=GROUP, priority=5, block=True)
+raiderse = router.on_command("攻略查询", raiderse, permission=GROUP, priority=5, block=True)
 
 # 花价查询
 flowers_regex = r"(^花价$)|(^花价 [\u4e00-\u9fa5]+$)"
-flowers = on_regex(pattern=flowers_regex, permission=GROUP, priority=5, block=True)
+flowers = router.on_command("花价查询", flowers_regex, permission=GROUP, priority=5, block=True)
 
 # 更新公告
 update_regex = r"(^更新$)|(^公告$)|(^更新公告$)"
-update_query = on_regex(pattern=update_regex, permission=GROUP, priority=5, block=True)
+update_query = router.on_command("更新公告", update_regex, permission=GROUP, priority=5, block=True)
 
 # 物价查询
-price_query = on_regex(pattern=r"^物价 [\u4e00-\u9fa5]+$", permission=GROUP, priority=5, block=True)
+price_query = router.on_command("物价查询", r"^物价 [\u4e00-\u9fa5]+$", permission=GROUP, priority=5, block=True)
 
 # 奇遇查询
-serendipity = on_regex(pattern=r"(^奇遇 [(\u4e00-\u9fa5)|(1-9)|(@)]+$)|(^奇遇 [\u4e00-\u9fa5]+ [(\u4e00-\u9fa5)|(1-9)|(@)]+$)",
-                       permission=GROUP, priority=5, block=True)
+serendipity = router.on_command("奇遇查询", r"(^奇遇 [(\u4e00-\u9fa5)|(1-9)|(@)]+$)|(^奇遇 [\u4e00-\u9fa5]+ [(\u4e00-\u9fa5)|(1-9)|(@)]+$)",
+                                permission=GROUP, priority=5, block=True)
 
 # 奇遇列表
-serendipityList = on_regex(pattern=r"(^查询 [\u4e00-\u9fa5]+$)|(^查询 [\u4e00-\u9fa5]+ [\u4e00-\u9fa5]+$)",
-                           permission=GROUP, priority=5, block=True)
+serendipityList = router.on_command("奇遇列表", r"(^查询 [\u4e00-\u9fa5]+$)|(^查询 [\u4e00-\u9fa5]+ [\u4e00-\u9fa5]+$)",
+                                    permission=GROUP, priority=5, block=True)
 
 # 骚话
-saohua_query = on_regex(pattern=r"^骚话$", permission=GROUP, priority=5, block=True)
+saohua_query = router.on_command("骚话", r"^骚话$", permission=GROUP, priority=5, block=True)
 
 # 装饰查询
-furniture_query = on_regex(pattern=r"^装饰 [\u4e00-\u9fa5]+$", permission=GROUP, priority=5, block=True)
+furniture_query = router.on_command("装饰查询", r"^装饰 [\u4e00-\u9fa5]+$", permission=GROUP, priority=5, block=True)
 
 # 资历查询
 seniority_regex = r"(^资历排行 [\u4e00-\u9fa5]+$)|(^资历排行 [\u4e00-\u9fa5]+ [\u4e00-\u9fa5]+$)"
-seniority_query = on_regex(pattern=seniority_regex, permission=GROUP, priority=5, block=True)
+seniority_query = router.on_command("资历查询", seniority_regex, permission=GROUP, priority=5, block=True)
 
 # 战绩总览查询
 indicator_regex = r"(^战绩 [(\u4e00-\u9fa5)|(1-9)|(@)]+$)|(^战绩 [\u4e00-\u9fa5]+ [(\u4e00-\u9fa5)|(1-9)|(@)]+$)"
-indicator = on_regex(pattern=indicator_regex, permission=GROUP, priority=5, block=True)
+indicator = router.on_command("战绩总览查询", indicator_regex, permission=GROUP, priority=5, block=True)
 
 # 名剑排行查询
 awesome_query_regex = r"(^名剑排行 [0-9]+$)|(^名剑排行$)"
-awesome_query = on_regex(pattern=awesome_query_regex, permission=GROUP, priority=5, block=True)
+awesome_query = router.on_command("名剑排行查询", awesome_query_regex, permission=GROUP, priority=5, block=True)
 
 # 团本记录查询
 teamcdlist_regex = r"(^副本记录 [(\u4e00-\u9fa5)|(1-9)|(@)]+$)|(^副本记录 [\u4e00-\u9fa5]+ [(\u4e00-\u9fa5)|(1-9)|(@)]+$)"
-teamcdlist = on_regex(pattern=teamcdlist_regex, permission=GROUP, priority=5, block=True)
+teamcdlist = router.on_command("团本记录查询", teamcdlist_regex, permission=GROUP, priority=5, block=True)
 
 
 # 沙盘查询
 sand_query_regex = r"(^沙盘$)|(^沙盘 [\u4e00-\u9fa5]+$)"
-sand_query = on_regex(pattern=sand_query_regex, permission=GROUP, priority=5, block=True)
+sand_query = router.on_command("沙盘查询", sand_query_regex, permission=GROUP, priority=5, block=True)
 
 
 @daily.handle()
@@ -311,7 +326,7 @@ async def _(bot: Bot, event: GroupMessageEvent):
     }
     req_msg, data = await source.get_data_from_jx3api(url=url, params=params)
     if req_msg != 'success':
-        msg = f"查询失败，{req_msg}。"
+        msg = source.get_fail_msg(req_msg, name, data)
         await extra_point.finish(msg)
 
     # 查询成功
@@ -345,7 +360,7 @@ async def _(bot: Bot, event: GroupMessageEvent):
     }
     req_msg, data = await source.get_data_from_jx3api(url=url, params=params)
     if req_msg != 'success':
-        msg = f"查询失败，{req_msg}。"
+        msg = source.get_fail_msg(req_msg, name, data)
         await medicine.finish(msg)
 
     # 查询成功
@@ -385,7 +400,7 @@ async def _(bot: Bot, event: GroupMessageEvent):
     }
     req_msg, data = await source.get_data_from_jx3api(url=url, params=params)
     if req_msg != 'success':
-        msg = f"查询失败，{req_msg}。"
+        msg = source.get_fail_msg(req_msg, name, data)
         await macro.finish(msg)
 
     # 查询成功
@@ -486,7 +501,7 @@ async def _(bot: Bot, event: GroupMessageEvent):
     }
     req_msg, data = await source.get_data_from_jx3api(url=url, params=params)
     if req_msg != 'success':
-        msg = f"查询失败，{req_msg}。"
+        msg = source.get_fail_msg(req_msg, name, data)
         await equip_group_query.finish(msg)
 
     # 查询成功
@@ -104,131 +104,163 @@ daily_list = {
 jx3_app = {
     "日常查询": {
         "app": "/app/daily",
-        "cd": 0
+        "cd": 0,
+        "ttl": 300
     },
     "开服查询": {
         "app": "/app/check",
-        "cd": 0
+        "cd": 0,
+        "ttl": 30
     },
     "金价查询": {
         "app": "/app/demon",
-        "cd": 0
+        "cd": 0,
+        "ttl": 300
     },
     "花价查询": {
         "app": "/app/flower",
-        "cd": 0
+        "cd": 0,
+        "ttl": 300
     },
     "沙盘查询": {
         "app": "/app/sand",
-        "cd": 0
+        "cd": 0,
+        "ttl": 300
     },
     "考试查询": {
         "app": "/app/exam",
-        "cd": 0
+        "cd": 0,
+        "ttl": 86400
     },
     "装饰查询": {
         "app": "/app/furniture",
-        "cd": 0
+        "cd": 0,
+        "ttl": 86400
     },
     "前置查询": {
         "app": "/app/require",
-        "cd": 0
+        "cd": 0,
+        "ttl": 86400
     },
     "小药查询": {
         "app": "/app/heighten",
-        "cd": 0
+        "cd": 0,
+        "ttl": 86400
     },
     "配装查询": {
         "app": "/app/equip",
-        "cd": 0
+        "cd": 0,
+        "ttl": 86400
     },
     "奇穴查询": {
         "app": "/app/qixue",
-        "cd": 0
+        "cd": 0,
+        "ttl": 86400
     },
     "server": {
         "app": "/app/server",
-        "cd": 0
+        "cd": 0,
+        "ttl": 86400
     },  # 主从区服
     "宏查询": {
         "app": "/app/macro",
-        "cd": 0
+        "cd": 0,
+        "ttl": 3600
     },
     "器物谱": {
         "app": "/app/travel",
-        "cd": 0
+        "cd": 0,
+        "ttl": 86400
     },
     "物价查询": {
         "app": "/app/price",
-        "cd": 0
+        "cd": 0,
+        "ttl": 600
     },
     "物品收出价格": {
         "app": "/app/prices",
-        "cd": 0
+        "cd": 0,
+        "ttl": 600
     },
     "资历排行": {
         "app": "/next/seniority",
-        "cd": 0
+        "cd": 0,
+        "ttl": 600
     },
     "攻略查询": {
         "app": "/app/strategy",
-        "cd": 0
+        "cd": 0,
+        "ttl": 86400
     },
     "刷马地点": {
         "app": "/app/horse",
-        "cd": 0
+        "cd": 0,
+        "ttl": 3600
     },
     "骚话": {
         "app": "/app/random",
-        "cd": 0
+        "cd": 0,
+        "ttl": 0
     },
     "动画id": {
         "app": "/movie/matchId",
-        "cd": 0
+        "cd": 0,
+        "ttl": 0
     },
     "奇遇查询":  {
         "app": "/advent/result",
-        "cd": 10
+        "cd": 10,
+        "ttl": 60
     },
     "奇遇列表": {
         "app": "/advent/statistical",
-        "cd": 10
+        "cd": 10,
+        "ttl": 60
     },
     "服务器最近奇遇": {
         "app": "/advent/collect",
-        "cd": 10
+        "cd": 10,
+        "ttl": 60
     },
     "角色信息": {
         "app": "/role/roleInfo",
-        "cd": 0
+        "cd": 0,
+        "ttl": 300
     },
     "副本记录": {
         "app": "/role/teamCdList",
-        "cd": 10
+        "cd": 10,
+        "ttl": 60
     },
     "装备属性": {
         "app": "/role/attribute",
-        "cd": 10
+        "cd": 10,
+        "ttl": 60
     },
     "成就进度": {
         "app": "/role/achievement",
-        "cd": 10
+        "cd": 10,
+        "ttl": 60
     },
     "角色资历": {
         "app": "/role/seniority",
-        "cd": 10
+        "cd": 10,
+        "ttl": 60
     },
     "战绩查询": {
         "app": "/arena/match",
-        "cd": 10
+        "cd": 10,
+        "ttl": 60
     },
     "名剑排行": {
         "app": "/arena/awesome",
-        "cd": 10
+        "cd": 10,
+        "ttl": 300
     },
     "名剑统计": {
         "app": "/arena/schools",
-        "cd": 10
+        "cd": 10,
+        "ttl": 300
     }
 }
-'''jx3api的app名字对应表'''
+'''jx3api的app名字对应表，cd：查询冷却时间，ttl：返回结果缓存时间，单位：秒'''
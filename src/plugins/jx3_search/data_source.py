@@ -1,12 +1,15 @@
+import asyncio
+import copy
 import re
 import time
 from typing import Optional, Tuple
 
-import httpx
 from src.modules.group_info import GroupInfo
 from src.modules.search_record import SearchRecord
-from src.modules.token_info import TokenInfo
+from src.utils.cache import TTLCache
 from src.utils.config import config as baseconfig
+from src.utils.http_client import get_client
+from src.utils.token_manager import token_manager
 
 from .config import daily_list, jx3_app, zhiye_name
 
@@ -18,9 +21,16 @@ if _jx3_token is None:
     _jx3_token = ""
 
 _jx3_headers = {"token": _jx3_token, "User-Agent": "Nonebot2-jx3_bot"}
+'''jx3-api请求头'''
 
-jx3_client = httpx.AsyncClient(headers=_jx3_headers)
-'''异步请求库客户端'''
+api_cache = TTLCache("jx3api", 1000)
+'''jx3api返回结果缓存，key：(url, 排序后的参数)'''
+
+_app_ttl: dict[str, int] = {config.get('jx3-url')+one['app']: one.get('ttl', 0) for one in jx3_app.values()}
+'''url对应的缓存时间'''
+
+_inflight: dict[tuple, asyncio.Task] = {}
+'''正在请求中的任务，相同请求合并为一次'''
 
 
 async def get_jx3_url(app: str) -> Tuple[str, int]:
@@ -59,8 +69,6 @@ async def check_cd_time(bot_id: int, group_id: int, app_name: str, cd_time: int)
         * bool：检查成功flag
         * int：剩余cd
     '''
-    # 没有记录创建记录
-    await SearchRecord.append_or_update(bot_id, group_id, app_name)
     time_last = await SearchRecord.get_last_time(bot_id, group_id, app_name)
     time_now = int(time.time())
     over_time = time_now-time_last
@@ -76,10 +84,16 @@ async def use_one_app(bot_id: int, group_id: int, app_name: str):
     await SearchRecord.count_search(bot_id, group_id, app_name)
 
 
+async def flush_search_record() -> int:
+    '''查询记录写入数据库'''
+    return await SearchRecord.flush()
+
+
 async def get_data_from_jx3api(url: str, params: dict) -> Tuple[str, Optional[dict]]:
     '''
     :说明
-        发送一条请求给jx3-api，返回结果
+        发送一条请求给jx3-api，返回结果。
+        成功的结果按app配置的ttl缓存，同时进行的相同请求只会访问一次jx3-api
 
     :参数
         * url：url地址
@@ -89,14 +103,43 @@ async def get_data_from_jx3api(url: str, params: dict) -> Tuple[str, Optional[di
         * msg：返回msg，为'success'时成功
         * data：返回数据
     '''
+    # ticket不影响返回结果，不参与缓存key
+    key = (url, tuple(sorted((k, str(v)) for k, v in params.items() if k != "ticket")))
+    flag, value = api_cache.lookup(key)
+    if flag:
+        msg, data = value
+        return msg, copy.deepcopy(data)
+
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_jx3api(key, url, params))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    msg, data = await asyncio.shield(task)
+    return msg, copy.deepcopy(data)
+
+
+async def _fetch_jx3api(key: tuple, url: str, params: dict) -> Tuple[str, Optional[dict]]:
+    '''请求jx3-api，成功则写入缓存'''
     try:
-        req_url = await jx3_client.get(url, params=params)
+        client = get_client(url)
+        req_url = await client.get(url, params=params, headers=_jx3_headers)
         req = req_url.json()
         msg = req['msg']
         data = req['data']
-        return msg, data
     except Exception as e:
-        return str(e), None
+        msg, data = str(e), None
+
+    ticket = params.get("ticket")
+    if ticket:
+        token_manager.record(ticket, msg == 'success')
+    if data is None:
+        return msg, data
+
+    ttl = _app_ttl.get(url, 0)
+    if msg == 'success' and ttl:
+        api_cache.set(key, (msg, data), ttl)
+    return msg, data
 
 
 async def get_server(bot_id: int, group_id: int) -> Optional[str]:
@@ -114,10 +157,8 @@ async def get_master_server(server: str) -> Optional[str]:
     params = {
         "name": server
     }
+    _, data = await get_data_from_jx3api(url, params)
     try:
-        req_url = await jx3_client.get(url, params=params)
-        req = req_url.json()
-        data = req['data']
         return data.get('server')
     except Exception:
         return None
@@ -135,10 +176,16 @@ def get_equipquery_name(text: str) -> Tuple[Optional[str], str]:
     return server, name
 
 
+_macro_regex = re.compile(r'^[\u4e00-\u9fa5]+宏$')
+_qixue_regex = re.compile(r'^[\u4e00-\u9fa5]+奇穴$')
+_medicine_regex = re.compile(r'^[\u4e00-\u9fa5]+小药$')
+_peizhuang_regex = re.compile(r'^[\u4e00-\u9fa5]+配装$')
+_gonglue_regex = re.compile(r'^[\u4e00-\u9fa5]+攻略$')
+
+
 def get_macro_name(text: str) -> str:
     '''宏查询返回职业'''
-    args = re.search(r'^[\u4e00-\u9fa5]+宏$', text)
-    if args is not None:
+    if _macro_regex.match(text) is not None:
         return text[:-1]
     else:
         return text.split(' ')[-1]
@@ -146,8 +193,7 @@ def get_macro_name(text: str) -> str:
 
 def get_qixue_name(text: str) -> str:
     '''奇穴查询返回职业'''
-    args = re.search(r'^[\u4e00-\u9fa5]+奇穴$', text)
-    if args is not None:
+    if _qixue_regex.match(text) is not None:
         return text[:-2]
     else:
         return text.split(' ')[-1]
@@ -155,8 +201,7 @@ def get_qixue_name(text: str) -> str:
 
 def get_medicine_name(text: str) -> str:
     '''小药查询返回职业'''
-    args = re.search(r'^[\u4e00-\u9fa5]+小药$', text)
-    if args is not None:
+    if _medicine_regex.match(text) is not None:
         return text[:-2]
     else:
         return text.split(' ')[-1]
@@ -164,8 +209,7 @@ def get_medicine_name(text: str) -> str:
 
 def get_peizhuang_name(text: str) -> str:
     '''配装查询返回职业'''
-    args = re.search(r'^[\u4e00-\u9fa5]+配装$', text)
-    if args is not None:
+    if _peizhuang_regex.match(text) is not None:
         return text[:-2]
     else:
         return text.split(' ')[-1]
@@ -173,22 +217,88 @@ def get_peizhuang_name(text: str) -> str:
 
 def get_gonglue_name(text: str) -> str:
     '''攻略查询返回'''
-    args = re.search(r'^[\u4e00-\u9fa5]+攻略$', text)
-    if args is not None:
+    if _gonglue_regex.match(text) is not None:
         return text[:-2]
     else:
         return text.split(' ')[-1]
 
 
-def get_xinfa(name: str) -> str:
-    '''获取心法名称'''
+def _get_xinfa_index() -> dict[str, str]:
+    '''生成心法别名索引，key：别名（小写），value：心法名称'''
+    index = {}
     for key, xinfa in zhiye_name.items():
+        index[key.lower()] = key
         for one_name in xinfa:
-            if one_name == name:
-                return key
+            index.setdefault(one_name.lower(), key)
+    return index
+
+
+xinfa_index = _get_xinfa_index()
+'''心法别名索引，导入时生成'''
 
+
+def get_xinfa(name: str) -> str:
+    '''获取心法名称'''
     # 未找到，返回原值
-    return name
+    return xinfa_index.get(name.lower(), name)
+
+
+def _edit_distance(a: str, b: str) -> int:
+    '''计算编辑距离'''
+    last = list(range(len(b)+1))
+    for i, char_a in enumerate(a, 1):
+        now = [i]
+        for j, char_b in enumerate(b, 1):
+            now.append(min(last[j]+1, now[j-1]+1, last[j-1]+(char_a != char_b)))
+        last = now
+    return last[-1]
+
+
+def get_xinfa_suggest(name: str, limit: int = 3) -> list[str]:
+    '''
+    :说明
+        jx3-api查询失败时，按别名的编辑距离和包含关系给出相近的心法，名称仍然交给jx3-api判断
+
+    :参数
+        * name：get_xinfa返回的名称
+        * limit：最多返回数量
+
+    :返回
+        * list[str]：相近的心法名称，名称已知或没有相近的时为空
+    '''
+    name = name.lower()
+    if name in xinfa_index:
+        return []
+    max_distance = 1 if len(name) <= 3 else 2
+    suggest: dict[str, int] = {}
+    for alias, xinfa in xinfa_index.items():
+        if alias in name or name in alias:
+            distance = 0
+        else:
+            distance = _edit_distance(name, alias)
+        if distance <= max_distance and distance < suggest.get(xinfa, max_distance+1):
+            suggest[xinfa] = distance
+    return sorted(suggest, key=lambda x: suggest[x])[:limit]
+
+
+def get_fail_msg(req_msg: str, name: str, data: Optional[dict]) -> str:
+    '''
+    :说明
+        心法相关查询失败时的回复，jx3-api有返回时才可能是名称不对，附上相近的心法，网络错误不给出建议
+
+    :参数
+        * req_msg：get_data_from_jx3api返回的msg
+        * name：查询的心法名称
+        * data：get_data_from_jx3api返回的数据，请求出错时为None
+
+    :返回
+        * str：回复内容
+    '''
+    msg = f"查询失败，{req_msg}。"
+    suggest = get_xinfa_suggest(name) if data is not None else []
+    if suggest:
+        msg += f"你是不是要找：{'、'.join(suggest)}"
+    return msg
 
 
 def get_daily_week(week: str) -> str:
@@ -354,27 +464,6 @@ def indicator_query_hanlde(data: list[dict]) -> list[dict]:
     return req_data
 
 
-async def _check_token(ticket: str) -> str:
-    '''检测token是否有效，返回msg值'''
-    url = config.get('jx3-url')+'/token/validity'
-    params = {
-        'ticket': ticket
-    }
-    try:
-        req_url = await jx3_client.get(url=url, params=params)
-        req = req_url.json()
-        msg = req['msg']
-        return msg
-    except Exception as e:
-        return str(e)
-
-
 async def get_token(bot_id: int) -> Tuple[str, str]:
     '''获取一条token，返回msg，token'''
-    token_list = await TokenInfo.get_alive_token(bot_id)
-    for one_token in token_list:
-        # 验证token
-        msg = await _check_token(one_token)
-        return msg, one_token
-
-    return "没有找到合适的ticket", ""
+    return await token_manager.get_token(bot_id)
@@ -1,10 +1,9 @@
-import asyncio
-import random
 from datetime import datetime
 
 from nonebot.adapters.cqhttp import Bot
 from nonebot.plugin import export, on
 from src.utils.jx3_event import OpenServerRecvEvent
+from src.utils.sender import Priority, send_group_msgs
 
 from . import data_source as source
 
@@ -33,17 +32,8 @@ async def _(bot: Bot, event: OpenServerRecvEvent):
         msg = f'时间：{time_now}\n[{server}] 开服啦！'
     else:
         msg = f'时间{time_now}\n[{server}]维护惹。'
-    group_list = await bot.get_group_list()
-    for group in group_list:
-        group_id = group['group_id']
-        group_server = await source.get_server(bot_id, group_id)
-        if group_server == server:
-            # 判断机器人是否开启
-            status = await source.get_robot_status(bot_id, group_id)
-            if status:
-                try:
-                    await bot.send_group_msg(group_id=group_id, message=msg)
-                    await asyncio.sleep(random.uniform(0.3, 0.5))
-                except Exception:
-                    pass
+    group_list = source.get_push_groups(bot_id, server)
+    msg_list = [(group_id, msg) for group_id in group_list]
+    summary = await send_group_msgs(bot, msg_list, Priority.HIGH, wait=False)
+    summary.log_when_done(f"Bot({bot.self_id}) | 开服推送完毕")
     await open_server_recv.finish()
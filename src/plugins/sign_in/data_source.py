@@ -2,10 +2,10 @@ import base64
 import random
 from datetime import date
 
-import httpx
 from nonebot.adapters.cqhttp import Message, MessageSegment
 from src.modules.group_info import GroupInfo
 from src.modules.user_info import UserInfo
+from src.utils.http_client import get_client
 from src.utils.user_agent import get_user_agent
 
 from .config import FRIENDLY_ADD, GOLD_BASE, LUCKY_GOLD, LUCKY_MAX, LUCKY_MIN
@@ -91,8 +91,8 @@ async def _get_qq_img(user_id: int) -> str:
         'nk': user_id,
         's': 100
     }
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        resp = await client.get(url, params=params)
+    client = get_client(url)
+    resp = await client.get(url, params=params, headers=get_user_agent())
 
     req_bytes = resp.content
     base64_str = base64.b64encode(req_bytes)
@@ -7,6 +7,9 @@ from nonebot.adapters.cqhttp import Bot, MessageEvent, MessageSegment
 from nonebot.adapters.cqhttp.permission import GROUP
 from nonebot.plugin import export
 from PIL import Image
+from src.utils.cache import TTLCache
+from src.utils.config import config
+from src.utils.render import run_render
 
 from .convrt_pic import draw
 from .get_weather import get_City_Weather
@@ -22,6 +25,9 @@ export.ignore = False  # 插件管理器忽略此插件
 weather_regex = r"([\u4e00-\u9fa5]+天气$)|(^天气 [\u4e00-\u9fa5]+$)"
 weather = on_regex(pattern=weather_regex, permission=GROUP, priority=5, block=True)
 
+card_cache = TTLCache("weather_card", config.get('weather').get('cache-size'))
+'''天气图片缓存，key：(city_id, obsTime)，实时天气更新后key会变化'''
+
 
 def img_to_b64(pic: Image.Image) -> str:
     buf = BytesIO()
@@ -30,6 +36,11 @@ def img_to_b64(pic: Image.Image) -> str:
     return "base64://" + base64_str
 
 
+def _draw_b64(data: dict) -> str:
+    '''绘制天气卡片并编码，在绘制线程中执行'''
+    return img_to_b64(draw(data))
+
+
 def _get_msg(message_str: str) -> str:
     # 匹配前面
     args = re.search(r'[\u4e00-\u9fa5]+天气$', message_str)
@@ -55,8 +66,12 @@ async def _(bot: Bot, event: MessageEvent):
 
     code, data = await get_City_Weather(city)
     if code == "200":
-        img = draw(data)
-        b64 = img_to_b64(img)
+        key = (data["id"], data["now"]["obsTime"])
+        hit, b64 = card_cache.lookup(key)
+        if not hit:
+            b64 = await run_render(_draw_b64, data)
+            # 和天气数据缓存时间相同，图片不会比数据保存更久
+            card_cache.set(key, b64, config.get('weather').get('cache-ttl'))
         msg = MessageSegment.image(b64)
     elif code == "404":
         msg = "查询失败，请输入正确的城市名称。"
@@ -1,5 +1,6 @@
 from PIL import Image, ImageDraw, ImageFont
 from src.utils.config import config as baseconfig
+from src.utils.render import get_font, get_icon
 
 config = baseconfig.get('weather')
 font = config.get('font')
@@ -8,22 +9,18 @@ background_img = config.get('background')
 
 
 def size(size: int) -> ImageFont:
-    return ImageFont.truetype(font, size)
+    return get_font(font, size)
 
 
 def load_icon(id: str, size: float = 1.0) -> Image:
-    im = Image.open(icon_dir + id + ".png")
-    resize = (int(im.width * size), int(im.height * size))
-    icon = im.thumbnail(resize, Image.ANTIALIAS)
-    icon = im.convert("RGBA")
-    return icon
+    return get_icon(icon_dir + id + ".png", size)
 
 
 def draw(data: dict) -> Image:
     # load backgroud picture
     im = Image.new("RGB", (1000, 1600), "white")
     d = ImageDraw.Draw(im)
-    bg = Image.open(background_img)
+    bg = get_icon(background_img)
     im.paste(bg, (0, 0), bg)
 
     # city
@@ -1,7 +1,11 @@
+import asyncio
+import json
+import os
 from typing import Optional, Tuple
 
-from httpx import AsyncClient
+from src.utils.cache import MemoryCache, TTLCache
 from src.utils.config import config as baseconfig
+from src.utils.http_client import get_client
 from src.utils.log import logger
 
 config = baseconfig.get('weather')
@@ -9,48 +13,124 @@ apikey = config.get('api-key')
 url_weather_api = config.get('url-weather')
 url_geoapi = config.get('url-geoapi')
 
+city_file = baseconfig.get('path').get('data')+"weather_city.json"
+'''城市id索引文件，城市名不会变，保存到磁盘'''
+
+city_dict: dict[str, dict[str, str]] = {}
+'''城市id索引，key：查询的城市名，value：{"id", "name"}'''
+
+city_cache = MemoryCache("weather_city")
+'''城市id缓存，内容同city_dict，用于统计命中'''
+
+weather_cache = TTLCache("weather", config.get('cache-size'))
+'''天气数据缓存，key：(api_type, city_id)'''
+
+
+def _load_city_file() -> None:
+    '''读取城市id索引文件'''
+    if not os.path.exists(city_file):
+        return
+    try:
+        with open(city_file, 'r', encoding='utf-8') as f:
+            city_dict.update(json.load(f))
+    except (OSError, ValueError) as e:
+        log = f"读取城市id索引失败：{str(e)}"
+        logger.error(log)
+        return
+    for city, value in city_dict.items():
+        city_cache.set(city, value)
+
+
+def _save_city_file(city_dict: dict) -> None:
+    '''写入城市id索引文件，先写临时文件再替换'''
+    os.makedirs(os.path.dirname(city_file), exist_ok=True)
+    tmp_file = city_file+".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(city_dict, f, ensure_ascii=False)
+    os.replace(tmp_file, city_file)
+
+
+_load_city_file()
+
 
 # 获取城市ID
 async def get_Location(city_kw: str, api_type: str = "lookup") -> dict:
-    async with AsyncClient() as client:
-        res = await client.get(
-            url_geoapi + api_type, params={"location": city_kw, "key": apikey}
-        )
-        return res.json()
+    url = url_geoapi + api_type
+    client = get_client(url)
+    res = await client.get(url, params={"location": city_kw, "key": apikey})
+    return res.json()
 
 
 # 获取天气信息
 async def get_WeatherInfo(api_type: str, city_id: str) -> dict:
-    async with AsyncClient() as client:
-        res = await client.get(
-            url_weather_api + api_type, params={"location": city_id, "key": apikey}
-        )
-        return res.json()
+    hit, value = weather_cache.lookup((api_type, city_id))
+    if hit:
+        return value
+    url = url_weather_api + api_type
+    client = get_client(url)
+    res = await client.get(url, params={"location": city_id, "key": apikey})
+    value = res.json()
+    if value.get('code') == "200":
+        weather_cache.set((api_type, city_id), value, config.get('cache-ttl'))
+    return value
 
 
-async def get_City_Weather(city: str) -> Tuple[str, Optional[dict[str, str]]]:
-    # global city_id
+async def get_City_Id(city: str) -> Tuple[str, Optional[dict[str, str]]]:
+    '''
+    :说明
+        获取城市id，优先使用索引
+
+    :参数
+        * city：城市名
+
+    :返回
+        * str：code，为"200"时成功
+        * dict：{"id", "name"}
+    '''
+    hit, value = city_cache.lookup(city)
+    if hit:
+        return "200", value
+
     city_info = await get_Location(city)
     code = city_info['code']
     if code != "200":
         log = f"获取城市id失败，参数：{city}"
         logger.debug(log)
         return code, None
-    city_id = city_info["location"][0]["id"]
-    city_name = city_info["location"][0]["name"]
-    log = f"获取城市id成功，name：{city_name} id：{city_id}"
+    value = {
+        "id": city_info["location"][0]["id"],
+        "name": city_info["location"][0]["name"]
+    }
+    log = f"获取城市id成功，name：{value['name']} id：{value['id']}"
     logger.debug(log)
+    city_dict[city] = value
+    city_cache.set(city, value)
+    try:
+        await asyncio.to_thread(_save_city_file, dict(city_dict))
+    except OSError as e:
+        log = f"保存城市id索引失败：{str(e)}"
+        logger.error(log)
+    return code, value
+
+
+async def get_City_Weather(city: str) -> Tuple[str, Optional[dict[str, str]]]:
+    code, city_value = await get_City_Id(city)
+    if code != "200":
+        return code, None
+    city_id = city_value["id"]
+    city_name = city_value["name"]
 
-    # 3天天气
-    daily_info = await get_WeatherInfo("3d", city_id)
+    # 3天天气和实时天气
+    daily_info, now_info = await asyncio.gather(
+        get_WeatherInfo("3d", city_id),
+        get_WeatherInfo("now", city_id)
+    )
     daily = daily_info["daily"]
     day1 = daily[0]
     day2 = daily[1]
     day3 = daily[2]
 
-    # 实时天气
-    now_info = await get_WeatherInfo("now", city_id)
     now = now_info["now"]
-    req_data = {"city": city_name, "now": now, "day1": day1, "day2": day2, "day3": day3}
+    req_data = {"id": city_id, "city": city_name, "now": now, "day1": day1, "day2": day2, "day3": day3}
 
     return code, req_data
@@ -2,10 +2,11 @@ import base64
 from datetime import datetime
 from io import BytesIO
 
-import httpx
 from nonebot.adapters.cqhttp.message import MessageSegment
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ImageDraw
 from src.utils.config import config as baseconfig
+from src.utils.http_client import get_client
+from src.utils.render import get_font, get_image, run_render
 from src.utils.user_agent import get_user_agent
 
 config = baseconfig.get('yiqing')
@@ -34,7 +35,7 @@ async def get_yiqing_card(province: str, city: str = None) -> MessageSegment:
         return MessageSegment.text(msg)
 
     # 开始造卡
-    img = await _draw_card(data)
+    img = await run_render(_draw_card, data)
 
     # 返回
     return MessageSegment.image(img)
@@ -61,9 +62,9 @@ async def _get_yiqing_data(province: str, city: str = None) -> dict:
             "city": city
         }
 
-    async with httpx.AsyncClient(headers=get_user_agent()) as client:
-        resp = await client.get(url, params=params)
-        result = resp.json()
+    client = get_client(url)
+    resp = await client.get(url, params=params, headers=get_user_agent())
+    result = resp.json()
     data = {}
     if city is None:
         # 查询省份
@@ -81,7 +82,7 @@ async def _get_yiqing_data(province: str, city: str = None) -> dict:
     return data
 
 
-async def _draw_card(data: dict) -> str:
+def _draw_card(data: dict) -> str:
     '''
     :说明
         * 绘制疫情卡片
@@ -102,29 +103,27 @@ async def _draw_card(data: dict) -> str:
     highDangerCount = str(data['highDangerCount'])  # 重症病例
 
     # 打开文件
-    img = Image.open(background_img)
-    # 设置字体
-    font = ImageFont.truetype(font_path)
+    img = get_image(background_img)
     # 设置画板
     drawBoard = ImageDraw.Draw(img)
 
     # ===============开始绘制======================================
 
     # 城市
-    font = ImageFont.truetype(font_path, size=28)
+    font = get_font(font_path, 28)
     loc = (86, 72)
     color = (79, 126, 237, 255)
     drawBoard.text(xy=loc, text=name, fill=color, font=font)
 
     # 日期
     today = datetime.today().strftime('%Y-%m-%d')
-    font = ImageFont.truetype(font_path, size=20)
+    font = get_font(font_path, 20)
     loc = (320, 87)
     color = (79, 126, 237, 255)
     drawBoard.text(xy=loc, text=today, fill=color, font=font)
 
     # 现存确诊
-    font = ImageFont.truetype(font_path, size=18)
+    font = get_font(font_path, 18)
     w, h = font.getsize(currentConfirmedCount)
     loc = (118-int(w/2), 150)
     color = (251, 51, 53, 255)
@@ -1,13 +1,22 @@
+import asyncio
 import base64
+import hashlib
 import json
 import os
+import re
+from io import BytesIO
 from typing import Optional
 
-from playwright.async_api import BrowserContext, async_playwright
+from PIL import Image
+from playwright.async_api import BrowserContext, Page, async_playwright
 from playwright.async_api._generated import Playwright as AsyncPlaywright
 
+from .cache import DiskCache, TTLCache
+from .cluster import cluster
 from .config import config
 from .log import logger
+from .render_client import render_client
+from .scheduler import scheduler
 
 playwright: AsyncPlaywright
 '''全局playwright进程'''
@@ -15,72 +24,375 @@ playwright: AsyncPlaywright
 browser: Optional[BrowserContext] = None
 '''全局browser'''
 
+browser_config: dict = config.get('browser')
+'''无头浏览器配置'''
+
+page_pool: dict[str, list["PoolPage"]] = {}
+'''预热页面池，key：页面名称'''
+
+_semaphore: Optional[asyncio.Semaphore] = None
+'''渲染并发限制'''
+
+render_cache = TTLCache("render", browser_config.get('cache-size'))
+'''页面截图内存缓存，key：页面名称-数据哈希'''
+
+render_disk_cache: Optional[DiskCache] = None
+'''页面截图磁盘缓存'''
+if browser_config.get('cache-disk'):
+    render_disk_cache = DiskCache("render_disk", config.get('path').get('data')+"render_cache/")
+
+image_cache = DiskCache("render_image", os.path.abspath(config.get('path').get('data')+"render_image/"))
+'''发送用的截图文件，按内容哈希命名，file和http发送方式使用'''
+
+_image_types = {"jpeg": "image/jpeg", "png": "image/png", "webp": "image/webp"}
+'''截图格式对应的类型'''
+
+_js_wait_images = '''
+timeout => Promise.race([
+    Promise.all(Array.from(document.querySelectorAll("img")).map(img => img.decode().catch(() => null))),
+    new Promise(resolve => setTimeout(resolve, timeout))
+])
+'''
+'''网络页面没有渲染完成信号，等待页面图片解码完成，超时后不再等待'''
+
+_js_reset_page = '''
+() => {
+    document.getElementById('main').outerHTML = window.main_html
+    return typeof window.__jx3_render === 'function'
+}
+'''
+'''还原复用的模板页面，返回渲染入口是否还在'''
+
+
+class PoolPage:
+    '''
+    预热页面，保存页面和复用次数
+    '''
+    page: Page
+    '''页面对象'''
+    uses: int
+    '''已复用次数'''
+
+    def __init__(self, page: Page):
+        self.page = page
+        self.uses = 0
+
 
 def get_broser() -> Optional[BrowserContext]:
     global browser
     return browser
 
 
+def _get_semaphore() -> asyncio.Semaphore:
+    '''获取渲染并发限制'''
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(browser_config.get('max-concurrency') or os.cpu_count())
+    return _semaphore
+
+
 async def close_browser():
     '''
     关闭浏览器进程
     '''
     global playwright
     global browser
+    page_pool.clear()
     await playwright.stop()
     browser = None
 
 
+def _get_user_data_dir() -> str:
+    '''获取浏览器数据目录，chromium的数据目录不能多个进程同时使用，子进程使用各自的目录'''
+    data_dir = config.get('path').get('data')
+    if cluster.is_leader:
+        return data_dir
+    return os.path.join(data_dir, f"browser_{cluster.worker_id}")
+
+
 async def browser_init():
     '''初始化playwright'''
     global playwright
     global browser
     log = '初始化无头浏览器……'
     logger.info(log)
-    user_data_dir = config.get('path').get('data')
+    user_data_dir = _get_user_data_dir()
     playwright = await async_playwright().start()
     browser = await playwright.chromium.launch_persistent_context(user_data_dir=user_data_dir, headless=True)
+
+    # 预热页面
+    for pagename in browser_config.get('preload'):
+        for _ in range(browser_config.get('pool-size')):
+            pool_page = await _new_pool_page(pagename)
+            page_pool.setdefault(pagename, []).append(pool_page)
     log = "无头浏览器初始化完毕！"
     logger.info(log)
 
 
+async def _new_pool_page(pagename: str) -> PoolPage:
+    '''
+    :说明
+        打开一个模板页面，并保存初始的#main内容，用于复用时还原
+
+    :参数
+        * pagename：页面名称
+
+    :返回
+        * PoolPage：预热页面
+    '''
+    page = await browser.new_page()
+    html_path: str = config.get('path').get('html')
+    url = "file://"+os.getcwd()+html_path+pagename
+    # 模板都是本地文件，load事件时脚本和样式已加载完毕
+    await page.goto(url, wait_until="load")
+    await page.evaluate("window.main_html = document.getElementById('main').outerHTML")
+    return PoolPage(page)
+
+
+async def _acquire_page(pagename: str) -> PoolPage:
+    '''从页面池取出一个页面，没有则新建'''
+    pool = page_pool.setdefault(pagename, [])
+    while pool:
+        pool_page = pool.pop()
+        if pool_page.page.is_closed():
+            continue
+        # 还原页面，渲染入口被模板脚本破坏时丢弃页面
+        if await pool_page.page.evaluate(_js_reset_page):
+            return pool_page
+        log = f'页面[{pagename}]渲染入口不可用，已丢弃'
+        logger.error(log)
+        await pool_page.page.close()
+    return await _new_pool_page(pagename)
+
+
+async def _release_page(pagename: str, pool_page: PoolPage) -> None:
+    '''归还页面，超过复用次数或页面池已满则关闭'''
+    pool_page.uses += 1
+    pool = page_pool.setdefault(pagename, [])
+    if pool_page.uses >= browser_config.get('max-reuse') or len(pool) >= browser_config.get('pool-size'):
+        await pool_page.page.close()
+    else:
+        pool.append(pool_page)
+
+
+_default_max_age = 3600
+'''没有配置截图缓存时间时，截图文件的保存时间，单位：秒'''
+
+
+def _get_cache_ttl() -> dict[str, int]:
+    '''获取截图缓存时间配置，key：页面名称，未配置时为空'''
+    return browser_config.get('cache-ttl') or {}
+
+
+def _get_max_age() -> int:
+    '''获取截图文件最长保存时间，单位：秒，为所有页面缓存时间的最大值'''
+    return max((ttl for ttl in _get_cache_ttl().values() if ttl), default=_default_max_age)
+
+
+@scheduler.scheduled_job("cron", hour=4, minute=0)
+async def _():
+    '''每天清理过期的截图磁盘缓存'''
+    if render_disk_cache is None:
+        return
+    max_age = _get_max_age()
+    count = await render_disk_cache.clean(max_age)
+    log = f'清理截图磁盘缓存 {count} 个'
+    logger.debug(log)
+
+
+@scheduler.scheduled_job("cron", hour=4, minute=5)
+async def _():
+    '''每天清理发送用的截图文件，保留时间和截图内存缓存相同'''
+    max_age = _get_max_age()
+    count = await image_cache.clean(max_age)
+    log = f'清理截图文件 {count} 个'
+    logger.debug(log)
+
+
+def _get_render_key(pagename: str, data: Optional[dict]) -> str:
+    '''生成截图缓存key，数据按键排序后取哈希，修改截图格式后不使用旧缓存'''
+    image_format, quality = get_image_options(pagename)
+    data_str = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+    digest = hashlib.sha1(data_str.encode('utf-8')).hexdigest()
+    return f"{pagename}-{image_format}{quality}-{digest}"
+
+
+def get_image_options(pagename: Optional[str] = None) -> tuple[str, int]:
+    '''
+    :说明
+        获取页面的截图格式和质量，页面没有单独设置时使用默认设置
+
+    :参数
+        * pagename：页面名称，为None时返回默认设置
+
+    :返回
+        * str：截图格式，jpeg png webp
+        * int：截图质量
+    '''
+    options: dict = (browser_config.get('image-options') or {}).get(pagename) or {}
+    image_format = options.get('format') or browser_config.get('image-format')
+    quality = options.get('quality') or browser_config.get('image-quality')
+    return image_format, quality
+
+
+def _get_image_timeout(pagename: Optional[str]) -> int:
+    '''获取页面等待图片加载的最长时间，单位：毫秒'''
+    timeout_dict: dict = browser_config.get('image-timeouts') or {}
+    return timeout_dict.get(pagename) or browser_config.get('image-timeout')
+
+
+def _to_webp(png_bytes: bytes, quality: int) -> bytes:
+    '''png截图转为webp，浏览器不支持直接截图为webp'''
+    with Image.open(BytesIO(png_bytes)) as image:
+        buffer = BytesIO()
+        image.save(buffer, "WEBP", quality=quality)
+    return buffer.getvalue()
+
+
+async def _screenshot(handle, pagename: Optional[str], **kwargs) -> bytes:
+    '''
+    :说明
+        按页面设置的格式截图
+
+    :参数
+        * handle：Page或ElementHandle
+        * pagename：页面名称，用于读取截图格式
+        * kwargs：screenshot的其他参数
+    '''
+    image_format, quality = get_image_options(pagename)
+    if image_format == "png":
+        return await handle.screenshot(type="png", **kwargs)
+    if image_format == "webp":
+        png_bytes = await handle.screenshot(type="png", **kwargs)
+        return await asyncio.to_thread(_to_webp, png_bytes, quality)
+    return await handle.screenshot(type="jpeg", quality=quality, **kwargs)
+
+
 async def get_html_screenshots(pagename: str, data: dict = None) -> str:
     '''
     :说明
-        获取页面截图
+        获取页面截图，配置了缓存时间的页面会先查询缓存
 
     :参数
         * page：需要截图的页面名称，在/resources/html/目录下
         * data：需要传输的数据
 
     :返回
-        * str：截图数据base64编码数据
+        * str：图片地址，按send-mode为file://、http://或base64://格式
     '''
-    global browser
-    if browser is None:
-        await browser_init()
+    image_format, _ = get_image_options(pagename)
+    ttl: Optional[int] = _get_cache_ttl().get(pagename)
+    if not ttl:
+        screenshot_bytes = await _get_html_bytes(pagename, data)
+        return await get_image_uri(screenshot_bytes, image_format)
 
-    page = await browser.new_page()
-    html_path: str = config.get('path').get('html')
-    url = "file://"+os.getcwd()+html_path+pagename
+    key = _get_render_key(pagename, data)
+    flag, req_str = render_cache.lookup(key)
+    if flag:
+        return req_str
+
+    screenshot_bytes = None
+    if render_disk_cache is not None:
+        screenshot_bytes = await render_disk_cache.lookup(key, ttl)
+    if screenshot_bytes is None:
+        screenshot_bytes = await _get_html_bytes(pagename, data)
+        if render_disk_cache is not None:
+            await render_disk_cache.set(key, screenshot_bytes)
 
-    # 打开页面
-    await page.goto(url)
+    req_str = await get_image_uri(screenshot_bytes, image_format)
+    render_cache.set(key, req_str, ttl)
+    return req_str
 
-    # 注入js
-    if data is not None:
-        data_str = json.dumps(data, ensure_ascii=False)
-        js = f"data={data_str}\nhandle(data)"
-        await page.evaluate(js)
 
-    # 截图
-    await page.wait_for_load_state("networkidle")
-    element_handle = await page.query_selector("#main")
-    screenshot_bytes = await element_handle.screenshot(type="jpeg", quality=100)
+def _to_base64(screenshot_bytes: bytes) -> str:
+    '''截图数据转为base64://格式'''
     base64_str = base64.b64encode(screenshot_bytes)
-    req_str = 'base64://'+base64_str.decode()
-    await page.close()
-    return req_str
+    return 'base64://'+base64_str.decode()
+
+
+async def get_image_uri(image_bytes: bytes, image_format: str) -> str:
+    '''
+    :说明
+        获取发送图片用的地址，file和http方式把图片保存为文件，go-cqhttp按地址读取，不再传输大段base64
+
+    :参数
+        * image_bytes：图片数据
+        * image_format：图片格式，作为文件后缀
+
+    :返回
+        * str：图片地址
+    '''
+    send_mode = browser_config.get('send-mode')
+    if send_mode == "base64":
+        return _to_base64(image_bytes)
+    name = hashlib.sha256(image_bytes).hexdigest()+"."+image_format
+    await image_cache.set(name, image_bytes)
+    if send_mode == "http":
+        return browser_config.get('http-url').rstrip("/")+"/render_image/"+name
+    return "file:///"+os.path.join(image_cache.path, name).lstrip("/")
+
+
+async def read_image(name: str) -> Optional[tuple[bytes, str]]:
+    '''
+    :说明
+        读取保存的截图文件，用于http发送方式
+
+    :参数
+        * name：文件名
+
+    :返回
+        * bytes：图片数据
+        * str：图片类型
+        * None：文件不存在
+    '''
+    digest, _, image_format = name.partition(".")
+    # 文件名为sha256，只允许小写十六进制，防止读取缓存目录以外的文件
+    if re.fullmatch(r"[0-9a-f]{64}", digest) is None or image_format not in _image_types:
+        return None
+    max_age = _get_max_age()
+    image_bytes = await image_cache.lookup(name, max_age)
+    if image_bytes is None:
+        return None
+    return image_bytes, _image_types[image_format]
+
+
+async def _get_html_bytes(pagename: str, data: Optional[dict]) -> bytes:
+    '''获取页面截图，开启渲染服务时交给渲染服务'''
+    if render_client.enabled:
+        return await render_client.render_html(pagename, data)
+    return await render_html(pagename, data)
+
+
+async def render_html(pagename: str, data: Optional[dict]) -> bytes:
+    '''
+    :说明
+        在本进程渲染页面并截图，页面从预热页面池中获取
+
+    :参数
+        * pagename：页面名称
+        * data：需要传输的数据
+
+    :返回
+        * bytes：截图数据
+    '''
+    global browser
+    if browser is None:
+        await browser_init()
+
+    async with _get_semaphore():
+        pool_page = await _acquire_page(pagename)
+        page = pool_page.page
+        try:
+            # 注入数据，等待模板的渲染完成信号后截图
+            await page.evaluate("([alldata, timeout]) => window.__jx3_render(alldata, timeout)", [data, _get_image_timeout(pagename)])
+            element_handle = await page.query_selector("#main")
+            screenshot_bytes = await _screenshot(element_handle, pagename)
+        except BaseException:
+            # 超时取消时也关闭页面，不放回页面池
+            await page.close()
+            raise
+        await _release_page(pagename, pool_page)
+    return screenshot_bytes
 
 
 async def get_web_screenshot(url: str, width: int) -> str:
@@ -93,22 +405,43 @@ async def get_web_screenshot(url: str, width: int) -> str:
         * width：页面宽度
 
     :返回
-        * str：截图数据base64编码数据
+        * str：图片地址，格式同get_html_screenshots
+    '''
+    if render_client.enabled:
+        screenshot_bytes = await render_client.render_web(url, width)
+    else:
+        screenshot_bytes = await render_web(url, width)
+    image_format, _ = get_image_options()
+    return await get_image_uri(screenshot_bytes, image_format)
+
+
+async def render_web(url: str, width: int) -> bytes:
+    '''
+    :说明
+        在本进程打开网络页面并截图
+
+    :参数
+        * url：网页地址
+        * width：页面宽度
+
+    :返回
+        * bytes：截图数据
     '''
     global browser
     if browser is None:
         await browser_init()
 
-    page = await browser.new_page()
-    # 打开页面
-    viewport_size = {
-        "width": width, "height": 480
-    }
-    await page.set_viewport_size(viewport_size)
-    await page.goto(url)
-    await page.wait_for_load_state("networkidle")
-    screenshot_bytes = await page.screenshot(type="jpeg", quality=100, full_page=True)
-    base64_str = base64.b64encode(screenshot_bytes)
-    req_str = 'base64://'+base64_str.decode()
-    await page.close()
-    return req_str
+    async with _get_semaphore():
+        page = await browser.new_page()
+        try:
+            # 打开页面
+            viewport_size = {
+                "width": width, "height": 480
+            }
+            await page.set_viewport_size(viewport_size)
+            await page.goto(url, wait_until="load")
+            await page.evaluate(_js_wait_images, _get_image_timeout(None))
+            screenshot_bytes = await _screenshot(page, None, full_page=True)
+        finally:
+            await page.close()
+    return screenshot_bytes
@@ -0,0 +1,386 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple, Union
+
+cache_list: list[Union["MemoryCache", "DiskCache"]] = []
+'''所有注册的缓存，用于统计'''
+
+_invalidate_listener: Optional[Callable[[str, Hashable, bool], None]] = None
+'''共享缓存修改时的回调，参数：缓存名称，key或key前缀，是否为前缀，多进程模式下用于通知其他进程'''
+
+
+def set_invalidate_listener(func: Callable[[str, Hashable, bool], None]) -> None:
+    '''设置共享缓存修改时的回调'''
+    global _invalidate_listener
+    _invalidate_listener = func
+
+
+def apply_invalidate(name: str, key: Hashable, prefix: bool = False) -> None:
+    '''
+    :说明
+        处理其他进程的缓存失效通知，不会再次通知
+
+    :参数
+        * name：缓存名称
+        * key：缓存键，prefix为True时为tuple前缀，()表示全部
+        * prefix：是否按前缀删除
+    '''
+    for cache in cache_list:
+        if isinstance(cache, MemoryCache) and cache.name == name:
+            if prefix:
+                cache._drop_prefix(key)
+            else:
+                cache._drop(key)
+
+
+class MemoryCache:
+    '''
+    进程内缓存，字典实现，带命中统计
+    '''
+
+    name: str
+    '''缓存名称'''
+    shared: bool
+    '''是否为共享缓存，修改时通知其他进程删除对应key'''
+    hits: int
+    '''命中次数'''
+    misses: int
+    '''未命中次数'''
+
+    def __init__(self, name: str, shared: bool = False):
+        self.name = name
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._data: dict[Hashable, Any] = {}
+        self._version = 0
+        self._modified: dict[Hashable, int] = {}
+        cache_list.append(self)
+
+    def _notify(self, key: Hashable, prefix: bool = False) -> None:
+        '''共享缓存修改后通知其他进程'''
+        if self.shared and _invalidate_listener is not None:
+            _invalidate_listener(self.name, key, prefix)
+
+    def _touch(self, key: Hashable) -> None:
+        '''记录key或前缀的修改版本，修改前开始的读取不能再写回，只有共享缓存需要记录'''
+        if not self.shared:
+            return
+        self._version += 1
+        self._modified[key] = self._version
+
+    def _is_modified(self, key: Hashable, version: int) -> bool:
+        '''key本身或它的前缀在version之后是否被修改过'''
+        if self._modified.get(key, 0) > version:
+            return True
+        if isinstance(key, tuple):
+            return any(self._modified.get(key[:index], 0) > version for index in range(len(key)))
+        return self._modified.get((), 0) > version
+
+    def _drop(self, key: Hashable) -> None:
+        '''删除一条缓存，不通知'''
+        self._data.pop(key, None)
+        self._touch(key)
+
+    def _drop_prefix(self, prefix: tuple) -> int:
+        '''删除前缀相同的缓存，不通知'''
+        size = len(prefix)
+        if size == 0:
+            keys = list(self._data)
+        else:
+            keys = [key for key in self._data if isinstance(key, tuple) and key[:size] == prefix]
+        for key in keys:
+            del self._data[key]
+        self._touch(prefix)
+        return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        '''
+        :说明
+            查找缓存，值可以为None
+
+        :参数
+            * key：缓存键
+
+        :返回
+            * bool：是否命中
+            * Any：缓存值
+        '''
+        if key in self._data:
+            self.hits += 1
+            return True, self._data[key]
+        self.misses += 1
+        return False, None
+
+    def get_version(self) -> int:
+        '''获取当前版本，从数据库读取前调用，读取后传给fill'''
+        return self._version
+
+    def fill(self, key: Hashable, value: Any, version: int) -> bool:
+        '''
+        :说明
+            写入从数据库读取的数据，数据没有变化，不通知其他进程
+            读取期间key被修改或收到失效通知时放弃写入，避免旧数据覆盖
+
+        :参数
+            * key：缓存键
+            * value：缓存值
+            * version：读取数据库前get_version的返回值
+
+        :返回
+            * bool：是否写入
+        '''
+        if self._is_modified(key, version):
+            return False
+        self._data[key] = value
+        return True
+
+    def set(self, key: Hashable, value: Any) -> None:
+        '''修改数据后写入一条缓存，通知其他进程'''
+        self._data[key] = value
+        self._touch(key)
+        self._notify(key)
+
+    def update(self, key: Hashable, **kwargs) -> None:
+        '''更新一条dict缓存的字段，不存在时只通知其他进程'''
+        value = self._data.get(key)
+        if isinstance(value, dict):
+            value.update(kwargs)
+        self._touch(key)
+        self._notify(key)
+
+    def delete(self, key: Hashable) -> None:
+        '''删除一条缓存'''
+        self._drop(key)
+        self._notify(key)
+
+    def delete_prefix(self, prefix: tuple) -> int:
+        '''
+        :说明
+            删除key前缀相同的缓存，key为tuple时使用，其他进程只删除相同前缀
+
+        :参数
+            * prefix：key前缀，例如(bot_id,)
+
+        :返回
+            * int：删除数量
+        '''
+        count = self._drop_prefix(prefix)
+        self._notify(prefix, True)
+        return count
+
+    def delete_where(self, func: Callable[[Hashable], bool]) -> int:
+        '''
+        :说明
+            按条件删除缓存，共享缓存尽量使用delete_prefix
+
+        :参数
+            * func：判断函数，参数为key，返回True则删除
+
+        :返回
+            * int：删除数量
+        '''
+        keys = [key for key in self._data if func(key)]
+        for key in keys:
+            del self._data[key]
+        # 条件无法传给其他进程，通知其他进程清空
+        self._touch(())
+        self._notify((), True)
+        return len(keys)
+
+    def clear(self) -> None:
+        '''清空缓存'''
+        self.delete_prefix(())
+
+    def get_status(self) -> dict:
+        '''
+        :返回统计数据,dict字段：
+        * name：缓存名称
+        * size：缓存条数
+        * hits：命中次数
+        * misses：未命中次数
+        * hit_rate：命中率，百分比
+        '''
+        total = self.hits+self.misses
+        hit_rate = round(self.hits*100/total, 2) if total else 0
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": hit_rate
+        }
+
+
+class TTLCache(MemoryCache):
+    '''
+    带过期时间的LRU缓存，超过容量时淘汰最久未使用的数据
+    '''
+
+    maxsize: int
+    '''最大缓存条数'''
+
+    def __init__(self, name: str, maxsize: int):
+        super().__init__(name)
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        '''
+        :说明
+            查找缓存，过期数据视为未命中
+
+        :参数
+            * key：缓存键
+
+        :返回
+            * bool：是否命中
+            * Any：缓存值
+        '''
+        one_data = self._data.get(key)
+        if one_data is not None:
+            expire_time, value = one_data
+            if expire_time > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return True, value
+            del self._data[key]
+        self.misses += 1
+        return False, None
+
+    def set(self, key: Hashable, value: Any, ttl: float = 60) -> None:
+        '''
+        :说明
+            写入一条缓存
+
+        :参数
+            * key：缓存键
+            * value：缓存值
+            * ttl：过期时间，单位：秒
+        '''
+        self._data[key] = (time.time()+ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def update(self, key: Hashable, **kwargs) -> None:
+        '''更新一条dict缓存的字段，不存在则跳过'''
+        one_data = self._data.get(key)
+        if one_data is not None and isinstance(one_data[1], dict):
+            one_data[1].update(kwargs)
+
+
+class DiskCache:
+    '''
+    磁盘缓存，每条数据保存为一个文件，按修改时间判断过期
+    '''
+
+    name: str
+    '''缓存名称'''
+    path: str
+    '''缓存目录'''
+    hits: int
+    '''命中次数'''
+    misses: int
+    '''未命中次数'''
+
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        if not os.path.exists(path):
+            os.makedirs(path)
+        cache_list.append(self)
+
+    def _read(self, filename: str, ttl: float) -> Optional[bytes]:
+        '''读取文件，过期返回None'''
+        try:
+            if os.path.getmtime(filename)+ttl < time.time():
+                return None
+            with open(filename, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _write(self, filename: str, value: bytes) -> None:
+        '''写入文件，先写临时文件再替换'''
+        tmp_filename = filename+".tmp"
+        with open(tmp_filename, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_filename, filename)
+
+    async def lookup(self, key: str, ttl: float) -> Optional[bytes]:
+        '''
+        :说明
+            查找缓存
+
+        :参数
+            * key：缓存键，作为文件名
+            * ttl：过期时间，单位：秒
+
+        :返回
+            * bytes：缓存数据
+            * None：未命中
+        '''
+        filename = os.path.join(self.path, key)
+        value = await asyncio.to_thread(self._read, filename, ttl)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        '''写入一条缓存'''
+        filename = os.path.join(self.path, key)
+        await asyncio.to_thread(self._write, filename, value)
+
+    def _clean(self, max_age: float) -> int:
+        '''删除超过时间的文件'''
+        count = 0
+        time_now = time.time()
+        for one_file in os.listdir(self.path):
+            filename = os.path.join(self.path, one_file)
+            try:
+                if os.path.getmtime(filename)+max_age < time_now:
+                    os.remove(filename)
+                    count += 1
+            except OSError:
+                continue
+        return count
+
+    async def clean(self, max_age: float) -> int:
+        '''
+        :说明
+            清理过期缓存文件
+
+        :参数
+            * max_age：最长保存时间，单位：秒
+
+        :返回
+            * int：清理数量
+        '''
+        return await asyncio.to_thread(self._clean, max_age)
+
+    def get_status(self) -> dict:
+        '''返回统计数据，字段同MemoryCache'''
+        total = self.hits+self.misses
+        hit_rate = round(self.hits*100/total, 2) if total else 0
+        return {
+            "name": self.name,
+            "size": len(os.listdir(self.path)),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": hit_rate
+        }
+
+
+def get_cache_status() -> list[dict]:
+    '''获取所有缓存的统计数据'''
+    return [cache.get_status() for cache in cache_list]
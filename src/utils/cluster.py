@@ -0,0 +1,260 @@
+import asyncio
+import json
+import os
+import sys
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from .cache import apply_invalidate, set_invalidate_listener
+from .config import config
+from .log import logger
+
+cluster_config: dict = config.get('cluster')
+'''多进程配置'''
+
+worker_count: int = cluster_config.get('workers')
+'''进程数，为1时是单进程模式'''
+
+class Cluster:
+    '''
+    多进程通信，主进程开启unix socket，子进程链接主进程，消息为一行json
+    '''
+
+    enabled: bool
+    '''是否开启多进程模式'''
+
+    def __init__(self):
+        self.enabled = worker_count > 1
+        self._handler_dict: dict[str, Callable[[Any], Awaitable[None]]] = {}
+        '''消息处理函数，key：消息类型'''
+        self._job_dict: dict[str, Callable[[], Awaitable[None]]] = {}
+        '''所有进程都要执行的定时任务，key：任务名'''
+        self._writer_list: list[asyncio.StreamWriter] = []
+        '''主进程：子进程链接'''
+        self._writer: Optional[asyncio.StreamWriter] = None
+        '''子进程：到主进程的链接'''
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._task_list: list[asyncio.Task] = []
+        self._process_dict: dict[int, asyncio.subprocess.Process] = {}
+        '''主进程：子进程，key：进程编号'''
+        self._stopping = False
+        self._job_task_set: set[asyncio.Task] = set()
+        '''正在执行的定时任务，保存引用避免被回收'''
+        self._handler_dict["job"] = self._on_job
+
+    @property
+    def worker_id(self) -> int:
+        '''本进程编号，主进程为0，由主进程启动子进程时设置，使用时读取，不受导入时机影响'''
+        return int(os.environ.get('JX3_WORKER_ID', 0))
+
+    @property
+    def is_leader(self) -> bool:
+        '''是否为主进程，主进程负责ws链接和定时任务'''
+        return self.worker_id == 0
+
+    async def _on_job(self, name: str) -> None:
+        '''主进程通知执行定时任务，任务可能执行很久，不阻塞消息接收'''
+        func = self._job_dict.get(name)
+        if func is not None:
+            task = asyncio.get_event_loop().create_task(func())
+            self._job_task_set.add(task)
+            task.add_done_callback(self._job_task_set.discard)
+
+    def subscribe(self, msg_type: str) -> Callable:
+        '''
+        :说明
+            注册消息处理函数，装饰器
+
+        :参数
+            * msg_type：消息类型
+        '''
+
+        def decorator(func: Callable[[Any], Awaitable[None]]):
+            self._handler_dict[msg_type] = func
+            return func
+
+        return decorator
+
+    def broadcast_job(self, name: str) -> Callable:
+        '''
+        :说明
+            定时任务装饰器，放在scheduled_job下面，主进程执行时通知所有子进程也执行，用于只处理本进程机器人的任务
+
+        :参数
+            * name：任务名，所有进程相同
+        '''
+
+        def decorator(func: Callable[[], Awaitable[None]]):
+            self._job_dict[name] = func
+
+            async def wrapper():
+                self.publish("job", name)
+                await func()
+
+            return wrapper
+
+        return decorator
+
+    def publish(self, msg_type: str, data: Any) -> None:
+        '''
+        :说明
+            发送消息给其他所有进程，单进程模式下跳过
+
+        :参数
+            * msg_type：消息类型
+            * data：消息内容，需要能json序列化
+        '''
+        if not self.enabled:
+            return
+        line = (json.dumps({"type": msg_type, "data": data}, ensure_ascii=False)+"\n").encode()
+        if self.is_leader:
+            for writer in self._writer_list:
+                writer.write(line)
+        elif self._writer is not None:
+            self._writer.write(line)
+
+    async def _handle_line(self, line: bytes, source: Optional[asyncio.StreamWriter] = None) -> None:
+        '''处理一条消息，主进程收到子进程的消息时转发给其他子进程'''
+        if self.is_leader:
+            for writer in self._writer_list:
+                if writer is not source:
+                    writer.write(line)
+        try:
+            msg = json.loads(line)
+        except ValueError:
+            log = f'多进程 > 无法解析的消息：{line}'
+            logger.error(log)
+            return
+        handler = self._handler_dict.get(msg.get('type'))
+        if handler is None:
+            return
+        try:
+            await handler(msg.get('data'))
+        except Exception as e:
+            log = f'多进程 > 处理[{msg.get("type")}]消息出错：{str(e)}'
+            logger.error(log)
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        '''主进程：处理一个子进程链接'''
+        self._writer_list.append(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self._handle_line(line, writer)
+        finally:
+            self._writer_list.remove(writer)
+            writer.close()
+
+    async def _client_run(self) -> None:
+        '''子进程：链接主进程，断开后重连'''
+        while not self._stopping:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(cluster_config.get('socket'))
+            except OSError:
+                await asyncio.sleep(1)
+                continue
+            log = f'多进程 > 进程[{self.worker_id}]已链接主进程'
+            logger.info(log)
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self._handle_line(line)
+            self._writer = None
+            logger.error('多进程 > 与主进程的链接已断开')
+
+    async def _process_run(self, one_worker_id: int, port: int) -> None:
+        '''主进程：启动子进程，异常退出后重启'''
+        env = {**os.environ, "JX3_WORKER_ID": str(one_worker_id), "PORT": str(port)}
+        while not self._stopping:
+            process = await asyncio.create_subprocess_exec(sys.executable, *sys.argv, env=env)
+            self._process_dict[one_worker_id] = process
+            log = f'多进程 > 子进程[{one_worker_id}]已启动，端口：{port}，pid：{process.pid}'
+            logger.info(log)
+            code = await process.wait()
+            if self._stopping:
+                return
+            log = f'多进程 > 子进程[{one_worker_id}]退出，code：{code}，5 秒后重启'
+            logger.error(log)
+            await asyncio.sleep(5)
+
+    async def start(self, port: int) -> None:
+        '''
+        :说明
+            启动多进程通信，主进程开启socket并启动子进程
+
+        :参数
+            * port：本进程端口，子进程依次使用后面的端口
+        '''
+        if not self.enabled:
+            return
+        if not hasattr(asyncio, 'start_unix_server'):
+            logger.error('多进程 > 当前系统不支持unix socket，使用单进程模式')
+            self.enabled = False
+            return
+        set_invalidate_listener(_on_invalidate)
+        loop = asyncio.get_event_loop()
+        if self.is_leader:
+            socket_path = cluster_config.get('socket')
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            self._server = await asyncio.start_unix_server(self._on_connect, path=socket_path)
+            for one_worker_id in range(1, worker_count):
+                self._task_list.append(loop.create_task(self._process_run(one_worker_id, port+one_worker_id)))
+        else:
+            self._task_list.append(loop.create_task(self._client_run()))
+
+    async def stop(self) -> None:
+        '''关闭通信和子进程'''
+        self._stopping = True
+        for task in self._task_list:
+            task.cancel()
+        for process in self._process_dict.values():
+            if process.returncode is None:
+                process.terminate()
+        if self._server is not None:
+            self._server.close()
+        for writer in self._writer_list:
+            writer.close()
+        if self._writer is not None:
+            self._writer.close()
+
+    def is_local_bot(self, bot_id: int) -> bool:
+        '''机器人是否应该链接到本进程，按QQ号分配'''
+        if not self.enabled:
+            return True
+        return bot_id % worker_count == self.worker_id
+
+    def get_worker_id(self, bot_id: int) -> int:
+        '''获取机器人应该链接的进程编号'''
+        return bot_id % worker_count if self.enabled else 0
+
+    def get_bot_port(self, bot_id: int, port: int) -> int:
+        '''
+        :说明
+            获取机器人应该链接的端口
+
+        :参数
+            * bot_id：机器人QQ
+            * port：本进程端口
+        '''
+        return port-self.worker_id+self.get_worker_id(bot_id)
+
+
+cluster = Cluster()
+'''全局多进程通信'''
+
+
+def _on_invalidate(name: str, key: Hashable, prefix: bool) -> None:
+    '''共享缓存修改时通知其他进程，tuple类型的key转为list'''
+    cluster.publish("invalidate", {"name": name,
+                                   "key": list(key) if isinstance(key, tuple) else key,
+                                   "prefix": prefix})
+
+
+@cluster.subscribe("invalidate")
+async def _(data: dict):
+    '''其他进程修改了共享缓存，删除本进程对应的缓存'''
+    key = data.get('key')
+    apply_invalidate(data.get('name'), tuple(key) if isinstance(key, list) else key, data.get('prefix', False))
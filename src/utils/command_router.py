@@ -0,0 +1,205 @@
+import re
+import time
+from typing import Optional, Type
+
+from nonebot import on_message
+from nonebot.adapters import Bot, Event
+from nonebot.matcher import Matcher
+from nonebot.message import run_postprocessor, run_preprocessor
+from nonebot.rule import Rule
+from nonebot.typing import T_State
+
+router_list: list["CommandRouter"] = []
+'''所有注册的路由，用于统计'''
+
+
+class CommandStatus:
+    '''
+    单个指令的统计
+    '''
+    count: int
+    '''匹配次数'''
+    total_time: float
+    '''处理总耗时，单位：秒'''
+    max_time: float
+    '''处理最大耗时，单位：秒'''
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0
+        self.max_time = 0
+
+
+class CommandRouter:
+    '''
+    指令路由，把一个插件的所有正则合并成一个，每条消息只匹配一次，正则从消息开头匹配
+    '''
+
+    name: str
+    '''路由名称'''
+    match_count: int
+    '''分类消息数'''
+    match_time: float
+    '''分类总耗时，单位：秒'''
+
+    def __init__(self, name: str):
+        self.name = name
+        self.match_count = 0
+        self.match_time = 0
+        self._pattern_list: list[tuple[str, str]] = []
+        '''注册的指令，[(指令名, 正则)]'''
+        self._pattern: Optional[re.Pattern] = None
+        '''合并后的正则，第一次匹配时编译'''
+        self._matcher_dict: dict[Type[Matcher], str] = {}
+        '''matcher对应的指令名'''
+        self._status: dict[str, CommandStatus] = {}
+        '''指令统计'''
+        self._last_event: Optional[Event] = None
+        self._last_result: Optional[tuple[str, re.Match]] = None
+        '''上一个事件的分类结果，同一事件的多个matcher共用'''
+        router_list.append(self)
+
+    def _compile(self) -> re.Pattern:
+        '''合并所有正则，每个指令用命名组包住，组名为序号'''
+        pattern_str = "|".join(f"(?P<_c{index}>{pattern})" for index, (_, pattern) in enumerate(self._pattern_list))
+        return re.compile(pattern_str)
+
+    def classify(self, text: str) -> Optional[tuple[str, re.Match]]:
+        '''
+        :说明
+            对消息分类
+
+        :参数
+            * text：消息文本
+
+        :返回
+            * str：指令名
+            * Match：合并正则的匹配结果
+            * None：没有匹配的指令
+        '''
+        if self._pattern is None:
+            self._pattern = self._compile()
+        time_start = time.perf_counter()
+        # 所有指令都从开头匹配，用match不必逐个位置尝试
+        matched = self._pattern.match(text)
+        self.match_time += time.perf_counter()-time_start
+        self.match_count += 1
+        if matched is None:
+            return None
+        # 外层命名组最后闭合，lastgroup即为匹配到的指令
+        index = int(matched.lastgroup[2:])
+        return self._pattern_list[index][0], matched
+
+    def _get_result(self, event: Event) -> Optional[tuple[str, re.Match]]:
+        '''获取事件的分类结果，同一个事件只分类一次'''
+        if event is not self._last_event:
+            self._last_event = event
+            self._last_result = self.classify(str(event.get_message()))
+        return self._last_result
+
+    def _rule(self, command: str) -> Rule:
+        '''生成指令的匹配规则'''
+
+        async def _check_command(bot: Bot, event: Event, state: T_State) -> bool:
+            if event.get_type() != "message":
+                return False
+            result = self._get_result(event)
+            if result is None or result[0] != command:
+                return False
+            state["_matched"] = result[1].group()
+            return True
+
+        return Rule(_check_command)
+
+    def on_command(self, command: str, pattern: str, **kwargs) -> Type[Matcher]:
+        '''
+        :说明
+            注册一条指令，用法同on_regex，匹配在所有指令中只进行一次
+
+        :参数
+            * command：指令名，用于统计
+            * pattern：正则，从消息开头匹配，先注册的指令优先
+            * kwargs：on_message的参数
+
+        :返回
+            * Matcher：事件响应器
+        '''
+        # 先单独编译，正则有误时在注册时报错
+        re.compile(pattern)
+        self._pattern_list.append((command, pattern))
+        self._pattern = None
+        self._status[command] = CommandStatus()
+        matcher = on_message(rule=self._rule(command), **kwargs)
+        self._matcher_dict[matcher] = command
+        return matcher
+
+    def get_command(self, matcher: Matcher) -> Optional[str]:
+        '''获取matcher对应的指令名，不属于本路由返回None'''
+        return self._matcher_dict.get(type(matcher))
+
+    def record(self, command: str, time_use: float) -> None:
+        '''记录一次指令处理'''
+        status = self._status[command]
+        status.count += 1
+        status.total_time += time_use
+        status.max_time = max(status.max_time, time_use)
+
+    def get_status(self) -> list[dict]:
+        '''
+        :返回指令统计,dict字段：
+        * name：指令名
+        * count：处理次数
+        * avg_time：平均耗时，单位：毫秒
+        * max_time：最大耗时，单位：毫秒
+        '''
+        data = []
+        for command, status in self._status.items():
+            data.append({
+                "name": command,
+                "count": status.count,
+                "avg_time": round(status.total_time*1000/status.count, 1) if status.count else 0,
+                "max_time": round(status.max_time*1000, 1)
+            })
+        return data
+
+
+def get_router_status() -> list[dict]:
+    '''
+    :返回所有路由的统计,dict字段：
+    * name：路由名称
+    * match_count：分类消息数
+    * avg_match：平均分类耗时，单位：微秒
+    * commands：指令统计，见CommandRouter.get_status
+    '''
+    data = []
+    for router in router_list:
+        count = router.match_count
+        data.append({
+            "name": router.name,
+            "match_count": count,
+            "avg_match": round(router.match_time*1000000/count, 1) if count else 0,
+            "commands": router.get_status()
+        })
+    return data
+
+
+@run_preprocessor
+async def _(matcher: Matcher, bot: Bot, event: Event, state: T_State):
+    '''记录指令开始时间'''
+    for router in router_list:
+        if router.get_command(matcher) is not None:
+            state["_router_start"] = time.perf_counter()
+            return
+
+
+@run_postprocessor
+async def _(matcher: Matcher, exception: Optional[Exception], bot: Bot, event: Event, state: T_State):
+    '''记录指令耗时'''
+    time_start = state.get("_router_start")
+    if time_start is None:
+        return
+    for router in router_list:
+        command = router.get_command(matcher)
+        if command is not None:
+            router.record(command, time.perf_counter()-time_start)
+            return
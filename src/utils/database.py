@@ -1,14 +1,53 @@
 from nonebot.log import logger
-from tortoise import Tortoise
+from tortoise import Tortoise, fields
+from tortoise.backends.base.client import BaseDBAsyncClient
+
+
+def _get_tortoise_config(database_config: dict, models: list[str]) -> dict:
+    '''
+    :说明
+        生成tortoise配置，填写了dsn时使用dsn，否则使用sqlite并设置pragma
+
+    :参数
+        * database_config：数据库配置
+        * models：要加载的表
+
+    :返回
+        * dict：tortoise配置
+    '''
+    dsn: str = database_config.get('dsn')
+    if dsn:
+        connection = dsn
+    else:
+        connection = {
+            "engine": "tortoise.backends.sqlite",
+            "credentials": {
+                "file_path": database_config.get('path'),
+                "journal_mode": database_config.get('journal-mode'),
+                "synchronous": database_config.get('synchronous'),
+                "cache_size": database_config.get('cache-size'),
+                "mmap_size": database_config.get('mmap-size'),
+                "busy_timeout": database_config.get('busy-timeout')
+            }
+        }
+    return {
+        "connections": {"default": connection},
+        "apps": {
+            "models": {
+                "models": models,
+                "default_connection": "default"
+            }
+        }
+    }
 
 
 async def database_init():
     '''
     初始化建表
     '''
+    # 本模块在config_init之前导入，需要在这里读取配置
+    from .config import config
     logger.debug('正在注册数据库')
-    database_path = "./data/data.db"
-    db_url = f'sqlite://{database_path}'
     # 这里填要加载的表
     models = [
         'src.modules.bot_info',
@@ -18,7 +57,133 @@ async def database_init():
         'src.modules.token_info',
         'src.modules.search_record'
     ]
-    modules = {"models": models}
-    await Tortoise.init(db_url=db_url, modules=modules)
+    await Tortoise.init(config=_get_tortoise_config(config.get('database'), models))
     await Tortoise.generate_schemas()
+    connection = Tortoise.get_connection("default")
+    if connection.capabilities.dialect != "sqlite":
+        # sqlite的INTEGER本身就是64位，不需要修改字段类型
+        await _migrate_bigint(connection)
+    await _migrate_unique_index(connection)
     logger.debug('数据库注册完成')
+
+
+def get_update_sql(connection: BaseDBAsyncClient, table: str, field: str) -> str:
+    '''
+    :说明
+        生成按id更新单个字段的sql，用于execute_many，占位符按数据库类型生成
+
+    :参数
+        * connection：数据库连接
+        * table：表名
+        * field：字段名
+
+    :返回
+        * str：sql语句，参数顺序为[字段值, id]
+    '''
+    return f"UPDATE {table} SET {field}={_get_placeholder(connection, 1)} WHERE id={_get_placeholder(connection, 2)}"
+
+
+def _get_placeholder(connection: BaseDBAsyncClient, index: int) -> str:
+    '''按数据库类型生成第index个参数的占位符，从1开始'''
+    dialect = connection.capabilities.dialect
+    if dialect == "postgres":
+        return f"${index}"
+    if dialect == "mysql":
+        return "%s"
+    return "?"
+
+
+async def _get_column_types(connection: BaseDBAsyncClient, table: str) -> dict[str, str]:
+    '''获取表中各字段的类型，key：字段名，value：小写的类型名'''
+    if connection.capabilities.dialect == "postgres":
+        sql = ("SELECT column_name, data_type FROM information_schema.columns "
+               "WHERE table_schema = current_schema() AND table_name = $1")
+    else:
+        sql = ("SELECT COLUMN_NAME AS column_name, DATA_TYPE AS data_type FROM information_schema.COLUMNS "
+               "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s")
+    row_list = await connection.execute_query_dict(sql, [table])
+    return {row['column_name']: row['data_type'].lower() for row in row_list}
+
+
+async def _migrate_bigint(connection: BaseDBAsyncClient):
+    '''
+    把旧数据库中QQ号、群号的INT字段改为BIGINT，INT为32位，超过2147483647的号码无法保存，仅用于postgres和mysql
+    '''
+    dialect = connection.capabilities.dialect
+    for model in Tortoise.apps.get("models").values():
+        table = model._meta.db_table
+        column_types = await _get_column_types(connection, table)
+        for field_name, field in model._meta.fields_map.items():
+            if not isinstance(field, fields.BigIntField):
+                continue
+            column = field.source_field or field_name
+            if column_types.get(column) not in ("integer", "int"):
+                continue
+            if dialect == "postgres":
+                sql = f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT"
+            else:
+                # mysql的MODIFY会覆盖整个字段定义，需要带上原来的属性
+                sql = f"ALTER TABLE {table} MODIFY {column} BIGINT {'NULL' if field.null else 'NOT NULL'}"
+                if field.generated:
+                    sql += " AUTO_INCREMENT"
+            await connection.execute_script(sql)
+            log = f'数据表 {table} 字段 {column} 改为BIGINT'
+            logger.info(log)
+
+
+async def _migrate_unique_index(connection: BaseDBAsyncClient):
+    '''
+    给旧数据库补建联合唯一索引，建索引前先删除重复数据，保留id最小的一条
+    '''
+    for model in Tortoise.apps.get("models").values():
+        table = model._meta.db_table
+        for field_names in model._meta.unique_together:
+            columns = [model._meta.fields_map[field].source_field or field for field in field_names]
+            if await _has_unique_index(connection, table, columns):
+                continue
+            column_str = ", ".join(columns)
+            # mysql不能在子查询中直接查询要删除的表，多套一层
+            sql = (f"DELETE FROM {table} WHERE id NOT IN "
+                   f"(SELECT id FROM (SELECT MIN(id) AS id FROM {table} GROUP BY {column_str}) AS keep_id)")
+            count, _ = await connection.execute_query(sql)
+            index_name = f"uid_{table}_{'_'.join(columns)}"
+            sql = f"CREATE UNIQUE INDEX {index_name} ON {table} ({column_str})"
+            await connection.execute_script(sql)
+            log = f'数据表 {table} 建立唯一索引（{column_str}），删除重复数据 {count} 条'
+            logger.info(log)
+
+
+async def _has_unique_index(connection: BaseDBAsyncClient, table: str, columns: list[str]) -> bool:
+    '''检查表中是否已有相同字段的唯一索引'''
+    for index_columns in await _get_unique_indexes(connection, table):
+        if index_columns == set(columns):
+            return True
+    return False
+
+
+async def _get_unique_indexes(connection: BaseDBAsyncClient, table: str) -> list[set[str]]:
+    '''获取表中所有唯一索引的字段，包括主键'''
+    dialect = connection.capabilities.dialect
+    if dialect == "sqlite":
+        index_list = []
+        for one_index in await connection.execute_query_dict(f"PRAGMA index_list({table})"):
+            if not one_index['unique']:
+                continue
+            info_list = await connection.execute_query_dict(f"PRAGMA index_info({one_index['name']})")
+            index_list.append(set(info['name'] for info in info_list))
+        return index_list
+
+    if dialect == "postgres":
+        sql = ("SELECT i.relname AS index_name, a.attname AS column_name FROM pg_index x "
+               "JOIN pg_class t ON t.oid = x.indrelid "
+               "JOIN pg_class i ON i.oid = x.indexrelid "
+               "JOIN pg_namespace n ON n.oid = t.relnamespace "
+               "JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(x.indkey) "
+               "WHERE x.indisunique AND n.nspname = current_schema() AND t.relname = $1")
+    else:
+        sql = ("SELECT INDEX_NAME AS index_name, COLUMN_NAME AS column_name FROM information_schema.STATISTICS "
+               "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND NON_UNIQUE = 0")
+    index_dict: dict[str, set[str]] = {}
+    for row in await connection.execute_query_dict(sql, [table]):
+        index_dict.setdefault(row['index_name'], set()).add(row['column_name'])
+    return list(index_dict.values())
@@ -0,0 +1,71 @@
+from typing import Optional
+
+import httpx
+
+from .config import config
+from .log import logger
+
+http_config: dict = config.get('http')
+'''http客户端配置'''
+
+_client_dict: dict[str, httpx.AsyncClient] = {}
+'''共享客户端，key：域名，每个域名一个连接池'''
+
+
+def _new_client() -> httpx.AsyncClient:
+    '''按配置新建一个客户端'''
+    timeout = httpx.Timeout(
+        connect=http_config.get('connect-timeout'),
+        read=http_config.get('read-timeout'),
+        write=http_config.get('read-timeout'),
+        pool=http_config.get('connect-timeout')
+    )
+    limits = httpx.Limits(
+        max_connections=http_config.get('max-connections'),
+        max_keepalive_connections=http_config.get('max-keepalive'),
+        keepalive_expiry=http_config.get('keepalive-expiry')
+    )
+    # 连接失败时由transport重试
+    transport = httpx.AsyncHTTPTransport(http2=http_config.get('http2'),
+                                         limits=limits,
+                                         retries=http_config.get('retries'))
+    return httpx.AsyncClient(timeout=timeout, transport=transport)
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    '''
+    :说明
+        获取共享的http客户端，同一个域名复用连接，请求头需要在请求时传入
+
+    :参数
+        * url：请求地址
+
+    :返回
+        * AsyncClient：客户端，不要关闭
+    '''
+    host = httpx.URL(url).host
+    client = _client_dict.get(host)
+    if client is None or client.is_closed:
+        client = _new_client()
+        _client_dict[host] = client
+    return client
+
+
+async def close_client(host: Optional[str] = None) -> None:
+    '''
+    :说明
+        关闭共享客户端
+
+    :参数
+        * host：域名，为None时关闭全部
+    '''
+    if host is None:
+        host_list = list(_client_dict.keys())
+    else:
+        host_list = [host]
+    for one_host in host_list:
+        client = _client_dict.pop(one_host, None)
+        if client is not None:
+            await client.aclose()
+    log = f'关闭http客户端 {len(host_list)} 个'
+    logger.debug(log)
@@ -0,0 +1,139 @@
+import asyncio
+import hashlib
+import os
+import time
+from typing import Optional
+
+from .cache import TTLCache
+from .config import config
+from .log import logger
+
+media_config: dict = config.get('media')
+'''媒体存储配置'''
+
+
+class MediaStore:
+    '''
+    按内容哈希保存的图片存储，相同图片只保存一份，最近使用的图片保存在内存中
+    '''
+
+    path: str
+    '''存储目录'''
+
+    def __init__(self, path: str, maxsize: int):
+        self.path = path
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self._cache = TTLCache("media", maxsize)
+        '''图片内存缓存，key：文件路径'''
+
+    def _get_filename(self, name: str) -> str:
+        '''获取文件路径，兼容旧数据中保存的完整路径'''
+        if os.path.dirname(name):
+            return name
+        return os.path.join(self.path, name)
+
+    def _read(self, filename: str) -> bytes:
+        '''读取文件'''
+        with open(filename, 'rb') as f:
+            return f.read()
+
+    def _write(self, filename: str, value: bytes) -> None:
+        '''写入文件，已存在则只更新修改时间，避免刚设置的图片被清理，先写临时文件再替换'''
+        if os.path.exists(filename):
+            os.utime(filename)
+            return
+        tmp_filename = filename+".tmp"
+        with open(tmp_filename, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_filename, filename)
+
+    async def put(self, value: bytes) -> str:
+        '''
+        :说明
+            保存一张图片
+
+        :参数
+            * value：图片数据
+
+        :返回
+            * str：图片名称，用于get
+        '''
+        name = hashlib.sha256(value).hexdigest()+".image"
+        filename = self._get_filename(name)
+        await asyncio.to_thread(self._write, filename, value)
+        self._cache.set(filename, value, media_config.get('cache-ttl'))
+        return name
+
+    async def get(self, name: str) -> Optional[bytes]:
+        '''
+        :说明
+            读取一张图片，优先从内存读取
+
+        :参数
+            * name：图片名称，或旧数据中的文件路径
+
+        :返回
+            * bytes：图片数据
+            * None：文件不存在或读取失败
+        '''
+        filename = self._get_filename(name)
+        hit, value = self._cache.lookup(filename)
+        if hit:
+            return value
+        try:
+            value = await asyncio.to_thread(self._read, filename)
+        except OSError as e:
+            log = f'读取图片失败：{str(e)}'
+            logger.error(log)
+            return None
+        self._cache.set(filename, value, media_config.get('cache-ttl'))
+        return value
+
+    def _delete(self, filename_list: list[str], min_age: float) -> int:
+        '''删除文件，min_age秒内修改过的跳过'''
+        count = 0
+        time_now = time.time()
+        for filename in filename_list:
+            try:
+                if os.path.getmtime(filename)+min_age > time_now:
+                    continue
+                os.remove(filename)
+                count += 1
+            except OSError:
+                continue
+        return count
+
+    async def delete(self, name_list: list[str]) -> int:
+        '''
+        :说明
+            删除不再使用的图片，最近保存过的图片可能正要被设置为新消息，跳过
+
+        :参数
+            * name_list：图片名称，或旧数据中的文件路径
+
+        :返回
+            * int：删除数量
+        '''
+        filename_list = [self._get_filename(name) for name in name_list]
+        for filename in filename_list:
+            self._cache.delete(filename)
+        return await asyncio.to_thread(self._delete, filename_list, media_config.get('clean-delay'))
+
+    async def clean(self, used: set[str]) -> int:
+        '''
+        :说明
+            清理存储目录中没有被任何消息使用的图片
+
+        :参数
+            * used：所有消息中使用的图片名称
+
+        :返回
+            * int：删除数量
+        '''
+        name_list = await asyncio.to_thread(os.listdir, self.path)
+        return await self.delete([name for name in name_list if name.endswith(".image") and name not in used])
+
+
+media_store = MediaStore(config.get('path').get('media'), media_config.get('cache-size'))
+'''全局图片存储，欢迎、离群、晚安消息共用'''
@@ -0,0 +1,126 @@
+from typing import Optional
+
+
+class PushIndex:
+    '''
+    推送订阅索引，按插件、服务器、机器人索引开启推送的群
+    '''
+
+    def __init__(self):
+        self._modules: set[str] = set()
+        '''需要索引的插件模块'''
+        self._groups: dict[tuple[int, int], dict] = {}
+        '''群设置，key：(bot_id, group_id)，value：{"server","robot_status"}'''
+        self._plugins: dict[tuple[int, str, int], bool] = {}
+        '''插件开关，key：(bot_id, module_name, group_id)'''
+        self._index: dict[str, dict[str, dict[int, set[int]]]] = {}
+        '''索引，module_name -> server -> bot_id -> 群号集合'''
+        self._member: dict[tuple[int, int, str], str] = {}
+        '''群当前所在的索引位置，key：(bot_id, group_id, module_name)，value：server'''
+
+    def register(self, module_name: str) -> None:
+        '''注册一个需要索引的推送插件'''
+        self._modules.add(module_name)
+        self._index.setdefault(module_name, {})
+
+    def _refresh(self, bot_id: int, group_id: int) -> None:
+        '''重新计算一个群在所有插件索引中的位置'''
+        group = self._groups.get((bot_id, group_id))
+        for module_name in self._modules:
+            server_dict = self._index[module_name]
+            member_key = (bot_id, group_id, module_name)
+            old_server = self._member.pop(member_key, None)
+            if old_server is not None:
+                server_dict[old_server][bot_id].discard(group_id)
+
+            if group is None or not group['robot_status']:
+                continue
+            if not self._plugins.get((bot_id, module_name, group_id)):
+                continue
+            server = group['server']
+            server_dict.setdefault(server, {}).setdefault(bot_id, set()).add(group_id)
+            self._member[member_key] = server
+
+    def set_group(self, bot_id: int, group_id: int, **kwargs) -> None:
+        '''
+        :说明
+            设置群信息，只更新传入的字段
+
+        :参数
+            * bot_id：机器人QQ
+            * group_id：QQ群号
+            * server：绑定服务器
+            * robot_status：机器人开关
+        '''
+        group = self._groups.setdefault((bot_id, group_id), {"server": None, "robot_status": False})
+        group.update(kwargs)
+        self._refresh(bot_id, group_id)
+
+    def set_bot_robot_status(self, bot_id: int, status: bool) -> None:
+        '''设置一个机器人所有群的开关'''
+        for (one_bot_id, group_id), group in self._groups.items():
+            if one_bot_id == bot_id:
+                group['robot_status'] = status
+                self._refresh(bot_id, group_id)
+
+    def set_plugin(self, bot_id: int, module_name: str, group_id: int, status: Optional[bool]) -> None:
+        '''设置一个群的插件开关'''
+        if module_name not in self._modules:
+            return
+        self._plugins[(bot_id, module_name, group_id)] = bool(status)
+        self._refresh(bot_id, group_id)
+
+    def set_group_plugins(self, bot_id: int, group_id: int, status: bool) -> None:
+        '''设置一个群的所有插件开关'''
+        for module_name in self._modules:
+            self._plugins[(bot_id, module_name, group_id)] = status
+        self._refresh(bot_id, group_id)
+
+    def set_module(self, bot_id: int, module_name: str, status: bool) -> None:
+        '''设置一个机器人所有群的某个插件开关'''
+        if module_name not in self._modules:
+            return
+        for (one_bot_id, group_id) in list(self._groups.keys()):
+            if one_bot_id == bot_id:
+                self._plugins[(bot_id, module_name, group_id)] = status
+                self._refresh(bot_id, group_id)
+
+    def remove_group(self, bot_id: int, group_id: int) -> None:
+        '''删除一个群'''
+        self._groups.pop((bot_id, group_id), None)
+        for module_name in self._modules:
+            self._plugins.pop((bot_id, module_name, group_id), None)
+        self._refresh(bot_id, group_id)
+
+    def remove_bot(self, bot_id: int) -> None:
+        '''删除一个机器人'''
+        group_list = [group_id for (one_bot_id, group_id) in self._groups if one_bot_id == bot_id]
+        for group_id in group_list:
+            self.remove_group(bot_id, group_id)
+        for key in [key for key in self._plugins if key[0] == bot_id]:
+            del self._plugins[key]
+
+    def get_groups(self, bot_id: int, module_name: str, server: Optional[str] = None) -> list[int]:
+        '''
+        :说明
+            获取开启推送的群
+
+        :参数
+            * bot_id：机器人QQ
+            * module_name：推送插件模块名
+            * server：服务器名，为None时返回所有服务器的群
+
+        :返回
+            * list[int]：群号列表
+        '''
+        server_dict = self._index.get(module_name, {})
+        if server is not None:
+            return list(server_dict.get(server, {}).get(bot_id, ()))
+        group_list = []
+        for bot_dict in server_dict.values():
+            group_list.extend(bot_dict.get(bot_id, ()))
+        return group_list
+
+
+push_index = PushIndex()
+'''全局推送订阅索引'''
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Optional
+
+from PIL import Image, ImageFont
+
+from .config import config
+from .log import logger
+
+render_config: dict = config.get('render')
+'''图片绘制配置'''
+
+_executor = ThreadPoolExecutor(max_workers=render_config.get('workers'), thread_name_prefix="render")
+'''绘制线程池，Pillow在缩放和编码时会释放GIL，线程可以并行'''
+
+_semaphore: Optional[asyncio.Semaphore] = None
+'''限制提交到线程池的任务数，超过时在事件循环中等待'''
+
+_font_local = threading.local()
+'''每个线程单独的字体缓存，FreeType的字体对象不是线程安全的，加载字形时会修改共用的状态，不在线程间共用'''
+
+
+class RenderStatus:
+    '''
+    绘制统计
+    '''
+    count: int
+    '''完成次数'''
+    errors: int
+    '''出错次数'''
+    waiting: int
+    '''当前排队数'''
+    total_time: float
+    '''总耗时，单位：秒'''
+    max_time: float
+    '''最大耗时，单位：秒'''
+    total_wait: float
+    '''总排队时间，单位：秒'''
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.waiting = 0
+        self.total_time = 0
+        self.max_time = 0
+        self.total_wait = 0
+
+
+render_status = RenderStatus()
+'''全局绘制统计'''
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    '''获取任务数限制'''
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(render_config.get('workers')+render_config.get('max-queue'))
+    return _semaphore
+
+
+async def run_render(func: Callable[..., Any], *args) -> Any:
+    '''
+    :说明
+        在绘制线程池中执行绘制函数，不阻塞事件循环
+
+    :参数
+        * func：同步绘制函数
+        * args：函数参数
+
+    :返回
+        * Any：函数返回值
+    '''
+    loop = asyncio.get_running_loop()
+    semaphore = _get_semaphore()
+    time_start = time.time()
+    render_status.waiting += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        render_status.waiting -= 1
+    try:
+        time_submit = time.time()
+        render_status.total_wait += time_submit-time_start
+        result = await loop.run_in_executor(_executor, func, *args)
+        time_use = time.time()-time_submit
+    except Exception:
+        render_status.errors += 1
+        raise
+    finally:
+        semaphore.release()
+    render_status.count += 1
+    render_status.total_time += time_use
+    render_status.max_time = max(render_status.max_time, time_use)
+    log = f"绘制 {func.__name__} 完成，用时 {round(time_use*1000, 1)} ms"
+    logger.debug(log)
+    return result
+
+
+def get_render_status() -> dict:
+    '''
+    :返回绘制统计,dict字段：
+    * count：完成次数
+    * errors：出错次数
+    * waiting：当前排队数
+    * avg_time：平均耗时，单位：毫秒
+    * max_time：最大耗时，单位：毫秒
+    * avg_wait：平均排队时间，单位：毫秒
+    '''
+    count = render_status.count
+    return {
+        "count": count,
+        "errors": render_status.errors,
+        "waiting": render_status.waiting,
+        "avg_time": round(render_status.total_time*1000/count, 1) if count else 0,
+        "max_time": round(render_status.max_time*1000, 1),
+        "avg_wait": round(render_status.total_wait*1000/count, 1) if count else 0
+    }
+
+
+def get_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    '''
+    :说明
+        获取字体，每个线程的每个(路径, 字号)只加载一次，线程数固定，缓存数量有上限
+
+    :参数
+        * path：字体文件路径
+        * size：字号
+    '''
+    font_dict: Optional[dict] = getattr(_font_local, "font_dict", None)
+    if font_dict is None:
+        font_dict = {}
+        _font_local.font_dict = font_dict
+    font = font_dict.get((path, size))
+    if font is None:
+        font = ImageFont.truetype(path, size)
+        font_dict[(path, size)] = font
+    return font
+
+
+def clear_cache() -> None:
+    '''清空本线程的字体缓存和所有图片缓存，用于资源文件更新后和基准测试'''
+    _font_local.font_dict = {}
+    _load_image.cache_clear()
+    get_icon.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def _load_image(path: str) -> Image.Image:
+    '''
+    读取并解码图片，缓存的图片不能修改
+    图片在缓存前已经load，之后只有copy和作为paste的来源读取像素，多个线程同时读取是安全的
+    '''
+    img = Image.open(path)
+    img.load()
+    return img
+
+
+def get_image(path: str) -> Image.Image:
+    '''
+    :说明
+        获取图片，只从磁盘读取一次，返回缓存的副本，可以直接在上面绘制
+
+    :参数
+        * path：图片文件路径
+    '''
+    return _load_image(path).copy()
+
+
+@lru_cache(maxsize=None)
+def get_icon(path: str, scale: float = 1.0) -> Image.Image:
+    '''
+    :说明
+        获取缩放后的RGBA图标，每个(路径, 比例)只缩放一次，返回的图标只能用于粘贴，不能修改
+        图标在所有线程间共用，同_load_image只读取像素
+
+    :参数
+        * path：图标文件路径
+        * scale：缩放比例
+    '''
+    img = _load_image(path)
+    resize = (int(img.width * scale), int(img.height * scale))
+    icon = img.copy()
+    icon.thumbnail(resize, Image.ANTIALIAS)
+    return icon.convert("RGBA")
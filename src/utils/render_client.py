@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import struct
+import sys
+import time
+from typing import Optional
+
+from .cluster import cluster
+from .config import config
+from .log import logger
+
+service_config: dict = config.get('render-service')
+'''渲染服务配置'''
+
+_frame_head = struct.Struct(">II")
+'''消息头：json长度，数据长度'''
+
+
+class RenderError(Exception):
+    '''渲染服务返回的错误'''
+
+
+async def read_frame(reader: asyncio.StreamReader) -> tuple[dict, bytes]:
+    '''
+    :说明
+        读取一条消息，链接断开时抛出IncompleteReadError
+
+    :返回
+        * dict：消息头
+        * bytes：数据
+    '''
+    head_len, body_len = _frame_head.unpack(await reader.readexactly(_frame_head.size))
+    header = json.loads(await reader.readexactly(head_len))
+    body = await reader.readexactly(body_len) if body_len else b""
+    return header, body
+
+
+def write_frame(writer: asyncio.StreamWriter, header: dict, body: bytes = b"") -> None:
+    '''
+    :说明
+        写入一条消息，数据中无法json序列化的值转为字符串
+
+    :参数
+        * header：消息头
+        * body：数据
+    '''
+    head = json.dumps(header, ensure_ascii=False, default=str).encode()
+    writer.write(_frame_head.pack(len(head), len(body))+head+body)
+
+
+class RenderClient:
+    '''
+    渲染服务客户端，一条链接上同时提交多个任务，按任务id返回结果，主进程负责启动渲染服务，异常退出后重启
+    '''
+
+    enabled: bool
+    '''是否使用渲染服务'''
+
+    def __init__(self):
+        self.enabled = service_config.get('enable')
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._read_task: Optional[asyncio.Task] = None
+        self._connect_task: Optional[asyncio.Task] = None
+        '''正在进行的链接任务，同时提交的任务共用'''
+        self._pending: dict[int, asyncio.Future] = {}
+        '''等待结果的任务，key：任务id'''
+        self._next_id = 0
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._process_task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def _process_run(self) -> None:
+        '''启动渲染服务进程，退出后重启'''
+        script = os.path.abspath("render_server.py")
+        while not self._stopping:
+            self._process = await asyncio.create_subprocess_exec(sys.executable, script)
+            log = f'渲染服务 > 已启动，pid：{self._process.pid}'
+            logger.info(log)
+            code = await self._process.wait()
+            if self._stopping:
+                return
+            log = f'渲染服务 > 进程退出，code：{code}，5 秒后重启'
+            logger.error(log)
+            await asyncio.sleep(5)
+
+    def start(self) -> None:
+        '''主进程启动渲染服务，子进程直接链接主进程启动的服务'''
+        if not self.enabled or not cluster.is_leader:
+            return
+        self._stopping = False
+        self._process_task = asyncio.get_event_loop().create_task(self._process_run())
+
+    async def stop(self) -> None:
+        '''断开链接并关闭渲染服务'''
+        self._stopping = True
+        if self._read_task is not None:
+            self._read_task.cancel()
+        if self._connect_task is not None:
+            self._connect_task.cancel()
+        if self._process_task is not None:
+            self._process_task.cancel()
+        if self._process is not None and self._process.returncode is None:
+            self._process.terminate()
+            await self._process.wait()
+
+    async def _connect(self) -> None:
+        '''链接渲染服务，服务刚启动时等待一会'''
+        deadline = time.time()+service_config.get('start-timeout')
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_connection("127.0.0.1", service_config.get('port'))
+                break
+            except OSError:
+                if self._stopping or time.time() > deadline:
+                    raise ConnectionError("渲染服务未启动")
+                await asyncio.sleep(1)
+        self._read_task = asyncio.get_event_loop().create_task(self._read_loop(self._reader, self._writer))
+
+    def _on_connect_done(self, task: asyncio.Task) -> None:
+        '''链接任务结束，失败时记录日志，等待的任务可能都已超时'''
+        if not task.cancelled() and task.exception() is not None:
+            log = f'渲染服务 > 链接失败：{str(task.exception())}'
+            logger.error(log)
+
+    async def _read_loop(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        '''接收渲染结果，链接断开后所有等待中的任务失败，下次提交时重连'''
+        try:
+            while True:
+                header, body = await read_frame(reader)
+                future = self._pending.pop(header.get('id'), None)
+                if future is None or future.done():
+                    continue
+                if header.get('ok'):
+                    future.set_result(body)
+                else:
+                    future.set_exception(RenderError(header.get('error')))
+        except (asyncio.IncompleteReadError, OSError):
+            logger.error('渲染服务 > 链接已断开')
+        finally:
+            writer.close()
+            self._reader = None
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("渲染服务链接已断开"))
+            self._pending.clear()
+
+    async def _request(self, header: dict) -> bytes:
+        '''提交一个任务并等待结果'''
+        timeout = service_config.get('timeout')
+        if self._writer is None:
+            if self._connect_task is None or self._connect_task.done():
+                self._connect_task = asyncio.get_event_loop().create_task(self._connect())
+                self._connect_task.add_done_callback(self._on_connect_done)
+            # 不持有锁等待服务启动，每个任务最多等待自己的超时时间，取消时不影响链接任务
+            await asyncio.wait_for(asyncio.shield(self._connect_task), timeout)
+        writer = self._writer
+        if writer is None:
+            raise ConnectionError("渲染服务链接已断开")
+
+        self._next_id += 1
+        job_id = self._next_id
+        future = asyncio.get_event_loop().create_future()
+        self._pending[job_id] = future
+        write_frame(writer, {"id": job_id, "timeout": timeout, **header})
+        try:
+            await writer.drain()
+            # 服务端超时会返回失败，这里多等几秒防止服务卡死时一直等待
+            return await asyncio.wait_for(future, timeout+5)
+        finally:
+            self._pending.pop(job_id, None)
+
+    async def render_html(self, pagename: str, data: Optional[dict]) -> bytes:
+        '''
+        :说明
+            交给渲染服务渲染模板页面
+
+        :参数
+            * pagename：页面名称
+            * data：传入的数据
+
+        :返回
+            * bytes：截图数据
+        '''
+        return await self._request({"type": "html", "pagename": pagename, "data": data})
+
+    async def render_web(self, url: str, width: int) -> bytes:
+        '''
+        :说明
+            交给渲染服务截图网络页面
+
+        :参数
+            * url：网页地址
+            * width：页面宽度
+
+        :返回
+            * bytes：截图数据
+        '''
+        return await self._request({"type": "web", "url": url, "width": width})
+
+
+render_client = RenderClient()
+'''全局渲染服务客户端'''
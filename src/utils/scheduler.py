@@ -18,6 +18,12 @@ scheduler = AsyncIOScheduler(timezone="Asia/Shanghai")
 
 
 async def start_scheduler():
+    # 本模块在config_init之前导入，需要在这里读取配置
+    from .cluster import cluster
+    if not cluster.is_leader:
+        # 多进程模式下定时任务由主进程执行
+        logger.opt(colors=True).info("<y>子进程不开启定时器模块。</y>")
+        return
     if not scheduler.running:
         scheduler.configure(plugin_config.apscheduler_config)
         scheduler.start()
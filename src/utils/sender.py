@@ -0,0 +1,321 @@
+import asyncio
+import itertools
+import time
+from enum import IntEnum
+from typing import Any
+
+import httpx
+from nonebot.adapters.cqhttp import Bot
+from nonebot.exception import ActionFailed, ApiNotAvailable, NetworkError
+
+from .config import config
+from .log import logger
+
+sender_config: dict = config.get('sender')
+'''发送队列配置'''
+
+
+class Priority(IntEnum):
+    '''
+    发送优先级，数值越小越先发送
+    '''
+    HIGH = 0
+    '''开服推送'''
+    NORMAL = 1
+    '''奇遇、新闻推送，管理员广播'''
+    LOW = 2
+    '''晚安通知'''
+
+
+class TokenBucket:
+    '''
+    令牌桶限速
+    '''
+    rate: float
+    '''每秒生成令牌数'''
+    burst: float
+    '''令牌桶容量'''
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+
+    def _refill(self) -> None:
+        '''补充令牌'''
+        time_now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens+(time_now-self._last)*self.rate)
+        self._last = time_now
+
+    def wait_time(self) -> float:
+        '''获取到下一个令牌需要等待的时间，单位：秒'''
+        self._refill()
+        if self._tokens >= 1:
+            return 0
+        return (1-self._tokens)/self.rate
+
+    def consume(self) -> None:
+        '''消耗一个令牌'''
+        self._refill()
+        self._tokens -= 1
+
+
+class SendSummary:
+    '''
+    一次批量发送的结果统计
+    '''
+    count_all: int
+    '''发送总数'''
+    count_success: int
+    '''成功数'''
+    count_failed: int
+    '''失败数'''
+    failed_list: list[int]
+    '''失败的群号'''
+    time_start: float
+    '''开始时间'''
+    time_use: float
+    '''用时，单位：秒'''
+
+    def __init__(self, count_all: int):
+        self.count_all = count_all
+        self.count_success = 0
+        self.count_failed = 0
+        self.failed_list = []
+        self.time_start = time.time()
+        self.time_use = 0
+        self._done = asyncio.Event()
+        if count_all == 0:
+            self._done.set()
+
+    def add_result(self, group_id: int, success: bool) -> None:
+        '''记录一个群的发送结果'''
+        if success:
+            self.count_success += 1
+        else:
+            self.count_failed += 1
+            self.failed_list.append(group_id)
+        if self.count_success+self.count_failed >= self.count_all:
+            self.time_use = round(time.time()-self.time_start, 2)
+            self._done.set()
+
+    async def wait(self) -> "SendSummary":
+        '''等待发送完毕'''
+        await self._done.wait()
+        return self
+
+    def log_when_done(self, prefix: str) -> None:
+        '''
+        :说明
+            不等待发送，发送完毕后记录结果日志
+
+        :参数
+            * prefix：日志开头，例如"Bot(123) | 奇遇推送完毕"
+        '''
+
+        async def _log():
+            await self._done.wait()
+            log = f"{prefix}，成功 {self.count_success} 个，失败 {self.count_failed} 个，用时 {self.time_use} 秒"
+            logger.info(log)
+
+        # 保存任务引用，避免被回收
+        self._log_task = asyncio.create_task(_log())
+
+
+class SendJob:
+    '''
+    单条发送任务
+    '''
+
+    def __init__(self, group_id: int, message: Any, priority: int, summary: SendSummary):
+        self.group_id = group_id
+        self.message = message
+        self.priority = priority
+        self.summary = summary
+        self.retry = 0
+
+
+def _is_not_sent(e: Exception) -> bool:
+    '''
+    :说明
+        判断消息是否确定没有发出，只有没发出的消息才重试，等待回复超时的消息可能已经发出，重试会重复发送
+
+    :参数
+        * e：发送时的异常
+
+    :返回
+        * bool：是否确定没有发出
+    '''
+    if isinstance(e, ApiNotAvailable):
+        return True
+    if isinstance(e, NetworkError):
+        # 超时和请求失败都是NetworkError，只有连不上时确定没有发出
+        return isinstance(e.__context__, (httpx.ConnectError, httpx.ConnectTimeout))
+    # 其他异常无法确定是否发出，不重试
+    return False
+
+
+class BotSender:
+    '''
+    单个机器人的发送队列，按优先级发送，受机器人和群两级令牌桶限速
+    '''
+    bot: Bot
+    '''机器人对象，重连后会更新'''
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        bot_id = int(bot.self_id)
+        bot_config = (sender_config.get('bots') or {}).get(bot_id, {})
+        self._bucket = TokenBucket(bot_config.get('rate', sender_config.get('bot-rate')),
+                                   bot_config.get('burst', sender_config.get('bot-burst')))
+        self._group_buckets: dict[int, TokenBucket] = {}
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._counter = itertools.count()
+        self._semaphore = asyncio.Semaphore(sender_config.get('max-inflight'))
+        self._task_dict: dict[asyncio.Task, SendJob] = {}
+        '''发送和延迟入队任务，保存引用避免被回收，value：任务处理的消息'''
+        self._worker = asyncio.create_task(self._run())
+
+    def _create_task(self, coro, job: SendJob) -> None:
+        '''创建任务并保存引用，结束后移除'''
+        task = asyncio.create_task(coro)
+        self._task_dict[task] = job
+        task.add_done_callback(lambda _: self._task_dict.pop(task, None))
+
+    async def close(self) -> None:
+        '''
+        :说明
+            机器人断开链接，停止发送，未完成的消息都记为失败，等待发送结果的调用可以结束
+        '''
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        for task, job in list(self._task_dict.items()):
+            task.cancel()
+            job.summary.add_result(job.group_id, False)
+        self._task_dict.clear()
+        while not self._queue.empty():
+            _, _, job = self._queue.get_nowait()
+            job.summary.add_result(job.group_id, False)
+
+    def _get_group_bucket(self, group_id: int) -> TokenBucket:
+        '''获取群令牌桶'''
+        bucket = self._group_buckets.get(group_id)
+        if bucket is None:
+            group_config = (sender_config.get('groups') or {}).get(group_id, {})
+            bucket = TokenBucket(group_config.get('rate', sender_config.get('group-rate')),
+                                 group_config.get('burst', sender_config.get('group-burst')))
+            self._group_buckets[group_id] = bucket
+        return bucket
+
+    def put(self, job: SendJob) -> None:
+        '''加入队列，同优先级先进先出'''
+        self._queue.put_nowait((job.priority, next(self._counter), job))
+
+    async def _put_later(self, job: SendJob, delay: float) -> None:
+        '''延迟加入队列'''
+        await asyncio.sleep(delay)
+        self.put(job)
+
+    async def _run(self) -> None:
+        '''发送循环，每次取出优先级最高的任务'''
+        while True:
+            _, _, job = await self._queue.get()
+            group_bucket = self._get_group_bucket(job.group_id)
+            group_wait = group_bucket.wait_time()
+            if group_wait > 0:
+                # 群限速，延后再发，不阻塞其他群
+                self._create_task(self._put_later(job, group_wait), job)
+                continue
+            bot_wait = self._bucket.wait_time()
+            if bot_wait > 0:
+                # 机器人限速，放回队列，等待后重新按优先级取出
+                self.put(job)
+                await asyncio.sleep(bot_wait)
+                continue
+            self._bucket.consume()
+            group_bucket.consume()
+            try:
+                await self._semaphore.acquire()
+            except asyncio.CancelledError:
+                # 关闭时放回队列，由close记为失败
+                self.put(job)
+                raise
+            self._create_task(self._send(job), job)
+
+    async def _send(self, job: SendJob) -> None:
+        '''发送一条消息，确定没有发出时按退避时间重试'''
+        try:
+            await self.bot.send_group_msg(group_id=job.group_id, message=job.message)
+            job.summary.add_result(job.group_id, True)
+        except ActionFailed:
+            # 被禁言或不在群中，重试无意义
+            log = f'Bot({self.bot.self_id}) | 群（{job.group_id}）消息发送失败'
+            logger.debug(log)
+            job.summary.add_result(job.group_id, False)
+        except Exception as e:
+            if _is_not_sent(e) and job.retry < sender_config.get('max-retry'):
+                delay = sender_config.get('retry-delay')*(2**job.retry)
+                job.retry += 1
+                log = f'Bot({self.bot.self_id}) | 群（{job.group_id}）消息发送出错，{delay} 秒后重试：{str(e)}'
+                logger.debug(log)
+                self._create_task(self._put_later(job, delay), job)
+            else:
+                log = f'Bot({self.bot.self_id}) | 群（{job.group_id}）消息发送出错，不再重试：{str(e)}'
+                logger.debug(log)
+                job.summary.add_result(job.group_id, False)
+        finally:
+            self._semaphore.release()
+
+    def get_queue_size(self) -> int:
+        '''获取队列中的任务数'''
+        return self._queue.qsize()
+
+
+sender_dict: dict[int, BotSender] = {}
+'''所有机器人的发送队列，key：机器人QQ'''
+
+
+def _get_sender(bot: Bot) -> BotSender:
+    '''获取机器人发送队列，没有则创建'''
+    bot_id = int(bot.self_id)
+    sender = sender_dict.get(bot_id)
+    if sender is None:
+        sender = BotSender(bot)
+        sender_dict[bot_id] = sender
+    else:
+        sender.bot = bot
+    return sender
+
+
+async def remove_sender(bot_id: int) -> None:
+    '''机器人断开链接时关闭并删除发送队列，重连后重新创建'''
+    sender = sender_dict.pop(bot_id, None)
+    if sender is not None:
+        await sender.close()
+
+
+async def send_group_msgs(bot: Bot,
+                          msg_list: list[tuple[int, Any]],
+                          priority: int = Priority.NORMAL,
+                          wait: bool = True) -> SendSummary:
+    '''
+    :说明
+        批量发送群消息，加入机器人发送队列
+
+    :参数
+        * bot：机器人对象
+        * msg_list：发送列表，元素为(群号, 消息)
+        * priority：发送优先级
+        * wait：是否等待发送完毕
+
+    :返回
+        * SendSummary：发送结果统计，wait为False时不等待，结果会在发送过程中更新
+    '''
+    sender = _get_sender(bot)
+    summary = SendSummary(len(msg_list))
+    for group_id, message in msg_list:
+        sender.put(SendJob(group_id, message, priority, summary))
+    if wait:
+        return await summary.wait()
+    return summary
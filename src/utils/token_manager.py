@@ -0,0 +1,205 @@
+import time
+from typing import Optional, Tuple
+
+from src.modules.token_info import TokenInfo
+
+from .cluster import cluster
+from .config import config
+from .http_client import get_client
+from .log import logger
+from .scheduler import scheduler
+from .user_agent import get_user_agent
+
+jx3_config: dict = config.get('jx3-api')
+'''jx3-api的配置'''
+
+
+class TokenStatus:
+    '''
+    单个ticket的状态和统计
+    '''
+    alive: Optional[bool]
+    '''是否有效，None为未检查'''
+    msg: str
+    '''上次检查返回信息'''
+    check_time: float
+    '''上次检查时间'''
+    uses: int
+    '''使用次数'''
+    errors: int
+    '''请求失败次数'''
+    last_use: float
+    '''上次使用时间'''
+
+    def __init__(self):
+        self.alive = None
+        self.msg = ""
+        self.check_time = 0
+        self.uses = 0
+        self.errors = 0
+        self.last_use = 0
+
+
+class TokenManager:
+    '''
+    ticket管理器，缓存有效性，按最久未使用轮换
+    '''
+
+    def __init__(self):
+        self._status: dict[Tuple[int, str], TokenStatus] = {}
+        '''ticket状态，key：(bot_id, token)'''
+
+    def _get_status(self, bot_id: int, token: str) -> TokenStatus:
+        '''获取ticket状态，没有则创建'''
+        key = (bot_id, token)
+        status = self._status.get(key)
+        if status is None:
+            status = TokenStatus()
+            self._status[key] = status
+        return status
+
+    async def _check(self, token: str) -> Tuple[Optional[bool], str]:
+        '''
+        :说明
+            请求jx3-api检查ticket有效性
+
+        :返回
+            * bool：是否有效，网络错误时为None
+            * str：返回信息
+        '''
+        url = jx3_config.get('jx3-url')+'/token/validity'
+        params = {
+            'token': jx3_config.get('jx3-token'),
+            'ticket': token
+        }
+        client = get_client(url)
+        try:
+            req_url = await client.get(url=url, params=params, headers=get_user_agent())
+            req = req_url.json()
+            return (req['code'] == 200), req['msg']
+        except Exception as e:
+            return None, str(e)
+
+    async def validate(self, bot_id: int, token: str) -> bool:
+        '''
+        :说明
+            检查ticket并更新状态，有效性改变时写入数据库
+
+        :返回
+            * bool：是否有效
+        '''
+        status = self._get_status(bot_id, token)
+        alive, msg = await self._check(token)
+        status.msg = msg
+        if alive is None:
+            # 网络错误，保留之前的状态
+            return bool(status.alive)
+        status.check_time = time.time()
+        if alive != status.alive:
+            await TokenInfo.change_alive(bot_id, token, alive)
+            if not alive:
+                log = f"Bot({bot_id}) | ticket失效：{token}，{msg}"
+                logger.info(log)
+        status.alive = alive
+        return alive
+
+    async def get_token(self, bot_id: int) -> Tuple[str, str]:
+        '''
+        :说明
+            获取一条有效的ticket，优先使用最久未使用的，有效性超过缓存时间才重新检查
+
+        :返回
+            * str：msg，为'success'时成功
+            * str：token
+        '''
+        ttl = jx3_config.get('token-ttl')
+        token_list = await TokenInfo.get_alive_token(bot_id)
+        token_list.sort(key=lambda x: self._get_status(bot_id, x).last_use)
+        time_now = time.time()
+        for token in token_list:
+            status = self._get_status(bot_id, token)
+            if status.alive is None:
+                status.alive = True
+            if status.check_time+ttl < time_now:
+                if not await self.validate(bot_id, token):
+                    continue
+            elif not status.alive:
+                continue
+            status.uses += 1
+            status.last_use = time_now
+            return "success", token
+
+        return "没有找到合适的ticket", ""
+
+    def record(self, token: str, success: bool) -> None:
+        '''记录一次使用ticket的请求结果'''
+        if success:
+            return
+        for (_, one_token), status in self._status.items():
+            if one_token == token:
+                status.errors += 1
+
+    def remove(self, bot_id: int, token: str) -> None:
+        '''删除ticket状态'''
+        self._status.pop((bot_id, token), None)
+
+    def get_stats(self, bot_id: int, token: str) -> dict:
+        '''
+        :返回ticket统计,dict字段：
+        * uses：使用次数
+        * errors：请求失败次数
+        * check_time：上次检查时间
+        * msg：上次检查返回信息
+        '''
+        status = self._get_status(bot_id, token)
+        if status.check_time:
+            check_time = time.strftime("%m-%d %H:%M:%S", time.localtime(status.check_time))
+        else:
+            check_time = "未检查"
+        return {
+            "uses": status.uses,
+            "errors": status.errors,
+            "check_time": check_time,
+            "msg": status.msg
+        }
+
+    def apply_result(self, bot_id: int, token: str, alive: bool, msg: str, check_time: float) -> None:
+        '''写入其他进程的检查结果'''
+        status = self._get_status(bot_id, token)
+        status.alive = alive
+        status.msg = msg
+        status.check_time = check_time
+
+    async def check_all(self) -> None:
+        '''检查所有机器人的ticket，失效的ticket恢复后会重新启用，检查结果同步给其他进程'''
+        token_list = await TokenInfo.get_all_token()
+        result_dict: dict[int, list] = {}
+        for one_token in token_list:
+            bot_id = one_token['bot_id']
+            token = one_token['token']
+            status = self._get_status(bot_id, token)
+            if status.alive is None:
+                status.alive = one_token['alive']
+            await self.validate(bot_id, token)
+            if status.check_time:
+                result_dict.setdefault(bot_id, []).append([token, status.alive, status.msg, status.check_time])
+        # 按机器人分条发送，避免单条消息过长
+        for bot_id, result_list in result_dict.items():
+            cluster.publish("token_status", {"bot_id": bot_id, "result": result_list})
+
+
+token_manager = TokenManager()
+'''全局ticket管理器'''
+
+
+@scheduler.scheduled_job("interval", seconds=jx3_config.get('token-check-interval'))
+async def _():
+    await token_manager.check_all()
+
+
+@cluster.subscribe("token_status")
+async def _(data: dict):
+    '''主进程定时检查后同步结果，子进程不用等缓存过期再检查'''
+    bot_id = data.get('bot_id')
+    for token, alive, msg, check_time in data.get('result'):
+        token_manager.apply_result(bot_id, token, alive, msg, check_time)